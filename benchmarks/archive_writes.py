@@ -0,0 +1,97 @@
+"""
+Measure message archive write throughput
+
+"per message" commits one INSERT per message, the way a naive archive would,
+"batched" buffers messages and writes them the way MessageArchive does,
+one transaction per flush interval.
+
+Run from the repository root:
+    python -m benchmarks.archive_writes
+"""
+import argparse
+import asyncio
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from useractivitylog.archive import SCHEMA, UPSERT, MessageArchive
+
+
+class _Attachment:
+    url = "https://cdn.discordapp.com/attachments/1/2/image.png"
+
+
+class _Object:
+    def __init__(self, object_id):
+        self.id = object_id
+
+
+class _Message:
+    def __init__(self, message_id):
+        self.id = message_id
+        self.guild = _Object(message_id % 10)
+        self.channel = _Object(message_id % 50)
+        self.author = _Object(message_id % 1000)
+        self.content = "benchmark message content " * 4
+        self.attachments = [_Attachment] if message_id % 5 == 0 else []
+
+
+def _per_message(path: Path, messages):
+    db = sqlite3.connect(str(path), isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    start = time.perf_counter()
+    for m in messages:
+        db.execute(
+            UPSERT,
+            (
+                m.id,
+                m.guild.id,
+                m.channel.id,
+                m.author.id,
+                m.content,
+                "\n".join(a.url for a in m.attachments),
+            ),
+        )
+    elapsed = time.perf_counter() - start
+    db.close()
+    return len(messages) / elapsed
+
+
+async def _batched(path: Path, messages, interval: float):
+    archive = MessageArchive(path, interval=interval)
+    await archive.open()
+    start = time.perf_counter()
+    for i, message in enumerate(messages):
+        archive.add(message)
+        if i % 1000 == 0:
+            # let the background writer run as it would between gateway events
+            await asyncio.sleep(0)
+    await archive.flush()
+    elapsed = time.perf_counter() - start
+    flushes = archive.flushes
+    await archive.close()
+    return len(messages) / elapsed, flushes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=50_000)
+    parser.add_argument("--interval", type=float, default=0.5)
+    args = parser.parse_args()
+
+    messages = [_Message(message_id) for message_id in range(1, args.messages + 1)]
+    with tempfile.TemporaryDirectory() as directory:
+        per_message = _per_message(Path(directory) / "per_message.sqlite3", messages)
+        batched, flushes = asyncio.run(
+            _batched(Path(directory) / "batched.sqlite3", messages, args.interval)
+        )
+    print(f"per message: {per_message:>12,.0f} messages/sec")
+    print(f"batched:     {batched:>12,.0f} messages/sec ({flushes} transactions)")
+    print(f"speedup: {batched / per_message:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Measure attachment archive throughput against a local stand-in for Discord's CDN
+
+Serves --files distinct random files from a local aiohttp server and posts
+--messages messages picking from them, so most downloads are reposts that
+are stored once. Reports downloads per second and what ended up on disk.
+
+Requires discord.py, run from the repository root:
+    python -m benchmarks.attachment_archive --messages 2000 --files 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from aiohttp import web
+
+from useractivitylog.attachments import AttachmentArchive
+
+
+class _Attachment:
+    def __init__(self, attachment_id: int, port: int, file_id: int, size: int):
+        self.id = attachment_id
+        self.filename = f"image-{file_id}.png"
+        self.url = f"http://127.0.0.1:{port}/files/{file_id}"
+        self.size = size
+        self.content_type = "image/png"
+
+
+class _Author:
+    def __init__(self, author_id: int):
+        self.id = author_id
+
+
+class _Message:
+    def __init__(self, message_id: int, attachments, author_id: int = 1):
+        self.id = message_id
+        self.author = _Author(author_id)
+        self.attachments = attachments
+
+
+async def _serve(files, port: int) -> web.AppRunner:
+    async def handle(request):
+        file_id = int(request.match_info["file_id"])
+        return web.Response(body=files[file_id], content_type="image/png")
+
+    app = web.Application()
+    app.router.add_get("/files/{file_id}", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def _run(args):
+    rng = random.Random(args.seed)
+    files = [os.urandom(rng.randint(1024, args.max_kilobytes * 1024)) for _ in range(args.files)]
+    runner = await _serve(files, args.port)
+    messages = []
+    for message_id in range(1, args.messages + 1):
+        picked = [rng.randrange(args.files) for _ in range(rng.randint(1, 3))]
+        messages.append(
+            _Message(
+                message_id,
+                [
+                    _Attachment(message_id * 10 + n, args.port, file_id, len(files[file_id]))
+                    for n, file_id in enumerate(picked)
+                ],
+            )
+        )
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            archive = AttachmentArchive(
+                Path(directory),
+                workers=args.workers,
+                queue_size=len(messages) * 3,
+                allowed_hosts=None,
+            )
+            await archive.start()
+            start = time.perf_counter()
+            for message in messages:
+                archive.submit(message)
+            await archive.drain()
+            elapsed = time.perf_counter() - start
+            stored_files, size = await archive.usage()
+            await archive.close()
+    finally:
+        await runner.cleanup()
+
+    downloads = archive.stored + archive.deduplicated
+    print(f"{downloads:,} downloads in {elapsed:.2f}s ({downloads / elapsed:,.0f}/sec)")
+    print(
+        f"stored {stored_files:,} files ({size // 1024:,} KiB), "
+        f"{archive.deduplicated:,} reposts"
+    )
+    print(f"failed {archive.failed}, skipped {archive.skipped}, dropped {archive.dropped}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--max-kilobytes", type=int, default=512)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
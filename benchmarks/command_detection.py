@@ -0,0 +1,116 @@
+"""
+Compare command detection on deleted and edited messages
+
+"before" calls `bot.get_context` for every message like the listeners used to,
+"after" uses CommandDetector, which only builds a Context once a prefix matches.
+The bot is a stand-in that resolves prefixes and builds a Context the same way
+discord.py does, so the numbers show relative rather than absolute cost.
+
+Run from the repository root:
+    python -m benchmarks.command_detection
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from useractivitylog.commanddetect import CommandDetector
+
+PREFIXES = ["!", "<@1234567890> ", "<@!1234567890> "]
+COMMANDS = {"ping": object(), "help": object(), "useractivitylog": object()}
+WORDS = "the quick brown fox jumps over the lazy dog and then some more words".split()
+
+
+class _Context:
+    def __init__(self, **attrs):
+        for key, value in attrs.items():
+            setattr(self, key, value)
+
+
+class _Bot:
+    async def get_valid_prefixes(self, guild=None):
+        await asyncio.sleep(0)
+        return list(PREFIXES)
+
+    async def get_context(self, message):
+        prefixes = await self.get_valid_prefixes(message.guild)
+        view = message.content
+        prefix = next((p for p in prefixes if view.startswith(p)), None)
+        ctx = _Context(
+            prefix=prefix,
+            view=view,
+            bot=self,
+            message=message,
+            args=[],
+            kwargs={},
+            invoked_with=None,
+            invoked_subcommand=None,
+            subcommand_passed=None,
+            command_failed=False,
+            command=None,
+        )
+        if prefix is None:
+            return ctx
+        invoker = view[len(prefix):].split(maxsplit=1)
+        ctx.invoked_with = invoker[0] if invoker else None
+        ctx.command = COMMANDS.get(ctx.invoked_with)
+        return ctx
+
+
+class _Guild:
+    id = 1
+
+
+class _Message:
+    __slots__ = ("id", "content", "guild")
+
+    def __init__(self, message_id, content):
+        self.id = message_id
+        self.content = content
+        self.guild = _Guild
+
+
+def _messages(count, command_ratio):
+    rng = random.Random(0)
+    messages = []
+    for message_id in range(count):
+        if rng.random() < command_ratio:
+            content = "!" + rng.choice(list(COMMANDS)) + " " + rng.choice(WORDS)
+        else:
+            content = " ".join(rng.choices(WORDS, k=rng.randint(1, 20)))
+        messages.append(_Message(message_id, content))
+    return messages
+
+
+async def _before(bot, messages):
+    start = time.perf_counter()
+    for message in messages:
+        (await bot.get_context(message)).command
+    return len(messages) / (time.perf_counter() - start)
+
+
+async def _after(bot, messages):
+    detector = CommandDetector(bot)
+    start = time.perf_counter()
+    for message in messages:
+        await detector.is_command(message)
+    return len(messages) / (time.perf_counter() - start), detector.context_calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--command-ratio", type=float, default=0.05)
+    args = parser.parse_args()
+
+    bot = _Bot()
+    messages = _messages(args.messages, args.command_ratio)
+    before = asyncio.run(_before(bot, messages))
+    after, context_calls = asyncio.run(_after(bot, messages))
+    print(f"before: {before:>14,.0f} messages/sec")
+    print(f"after:  {after:>14,.0f} messages/sec ({context_calls:,} get_context calls)")
+    print(f"speedup: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
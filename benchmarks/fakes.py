@@ -0,0 +1,415 @@
+"""
+Stand-ins for the bot, gateway objects and Config used by the listener benchmarks
+
+Gateway objects carry the attributes the cogs read and nothing else, Config
+uses an in-memory driver, and log channels record what would have been sent
+instead of making HTTP requests. Raw events are discord.py's own classes.
+"""
+import contextlib
+import copy
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import discord
+from redbot.core.config import Config
+from redbot.core.drivers import BaseDriver
+
+DISCORD_EPOCH = 1420070400000
+WORDS = "the quick brown fox jumps over the lazy dog and then some more words".split()
+PREFIXES = ["!", "<@1234567890> "]
+
+
+def snowflake(moment: datetime, sequence: int = 0) -> int:
+    return (int(moment.timestamp() * 1000) - DISCORD_EPOCH) << 22 | (sequence & 0x3FFFFF)
+
+
+class MemoryDriver(BaseDriver):
+    """Config driver keeping data in a dict, counting reads and writes"""
+
+    def __init__(self, cog_name, identifier, **kwargs):
+        super().__init__(cog_name, identifier)
+        self.data: Dict = {}
+        self.reads = 0
+        self.writes = 0
+
+    @classmethod
+    async def initialize(cls, **storage_details):
+        pass
+
+    @classmethod
+    async def teardown(cls):
+        pass
+
+    @staticmethod
+    def get_config_details():
+        return {}
+
+    async def get(self, identifier_data):
+        self.reads += 1
+        partial = self.data
+        for key in identifier_data.to_tuple()[1:]:
+            partial = partial[key]
+        return copy.deepcopy(partial)
+
+    async def set(self, identifier_data, value=None):
+        self.writes += 1
+        partial = self.data
+        *path, last = identifier_data.to_tuple()[1:]
+        for key in path:
+            partial = partial.setdefault(key, {})
+        partial[last] = copy.deepcopy(value)
+
+    async def clear(self, identifier_data):
+        self.writes += 1
+        partial = self.data
+        *path, last = identifier_data.to_tuple()[1:]
+        try:
+            for key in path:
+                partial = partial[key]
+            del partial[last]
+        except KeyError:
+            pass
+
+    @classmethod
+    async def aiter_cogs(cls):
+        return
+        yield
+
+
+@contextlib.contextmanager
+def memory_config():
+    """Make Config.get_conf use MemoryDriver while cogs are constructed"""
+    original = Config.get_conf
+
+    def get_conf(cog_instance, identifier: int, force_registration: bool = False, **kwargs):
+        cog_name = type(cog_instance).__name__
+        return Config(
+            cog_name=cog_name,
+            unique_identifier=str(identifier),
+            driver=MemoryDriver(cog_name, str(identifier)),
+            force_registration=force_registration,
+        )
+
+    Config.get_conf = get_conf
+    try:
+        yield
+    finally:
+        Config.get_conf = original
+
+
+class SentMessage:
+    __slots__ = ("channel_id", "embeds", "filename")
+
+    def __init__(self, channel_id: int, embeds: List[dict], filename: Optional[str]):
+        self.channel_id = channel_id
+        self.embeds = embeds
+        self.filename = filename
+
+
+class RecordingSink:
+    """Collects every message the cogs send, in order"""
+
+    def __init__(self):
+        self.messages: List[SentMessage] = []
+
+    @property
+    def embeds(self) -> int:
+        return sum(len(message.embeds) for message in self.messages)
+
+
+class _HTTP:
+    def __init__(self, channel: "FakeChannel"):
+        self.channel = channel
+
+    async def request(self, route, json=None, **kwargs):
+        self.channel.sink.messages.append(
+            SentMessage(self.channel.id, list(json.get("embeds", ())), None)
+        )
+        return {"id": self.channel.id}
+
+
+class _State:
+    def __init__(self, channel: "FakeChannel"):
+        self.http = _HTTP(channel)
+
+
+class FakeChannel:
+    def __init__(self, guild: "FakeGuild", channel_id: int, sink: RecordingSink, nsfw=False):
+        self.guild = guild
+        self.id = channel_id
+        self.name = f"channel-{channel_id}"
+        self.mention = f"<#{channel_id}>"
+        self.nsfw = nsfw
+        self.category_id = None
+        self.sink = sink
+        self._state = _State(self)
+
+    async def send(self, content=None, *, embed=None, file=None, **kwargs):
+        embeds = [embed.to_dict()] if embed else []
+        self.sink.messages.append(SentMessage(self.id, embeds, file.filename if file else None))
+
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str, created_at: datetime, bot: bool = False):
+        self.id = user_id
+        self.name = name
+        self.discriminator = "0001"
+        self.bot = bot
+        self.created_at = created_at
+        self.avatar_url = f"https://cdn.discordapp.com/embed/avatars/{user_id % 5}.png"
+        self.mention = f"<@{user_id}>"
+
+    def __str__(self):
+        return f"{self.name}#{self.discriminator}"
+
+
+class FakeMember(FakeUser):
+    def __init__(
+            self, guild: "FakeGuild", user: FakeUser, roles=(), premium_since=None, joined_at=None
+    ):
+        super().__init__(user.id, user.name, user.created_at, user.bot)
+        self.guild = guild
+        self.joined_at = joined_at
+        # discord.py keeps sorted role ids in an array
+        self._roles = discord.utils.SnowflakeList(roles)
+        self.premium_since = premium_since
+
+    def copy(self, *, roles=None, premium_since=...):
+        member = copy.copy(self)
+        if roles is not None:
+            member._roles = discord.utils.SnowflakeList(roles)
+        if premium_since is not ...:
+            member.premium_since = premium_since
+        return member
+
+
+class FakeAttachment:
+    def __init__(self, attachment_id: int):
+        self.id = attachment_id
+        self.filename = f"image-{attachment_id}.png"
+        path = f"attachments/1/{attachment_id}/{self.filename}"
+        self.url = f"https://cdn.discordapp.com/{path}"
+        self.proxy_url = f"https://media.discordapp.net/{path}"
+        self.size = 123456
+
+
+class FakeMessage:
+    def __init__(
+            self, message_id: int, channel: FakeChannel, author, content: str, attachments=()
+    ):
+        self.id = message_id
+        self.guild = channel.guild
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.attachments = list(attachments)
+        self.embeds = []
+        self.reference = None
+        self.edited_at = None
+        self.created_at = discord.utils.snowflake_time(message_id)
+        self.jump_url = (
+            f"https://discord.com/channels/{channel.guild.id}/{channel.id}/{message_id}"
+        )
+
+    @property
+    def system_content(self):
+        return self.content
+
+    def edited(self, content: str) -> "FakeMessage":
+        message = copy.copy(self)
+        message.content = content
+        message.edited_at = datetime.now(timezone.utc)
+        return message
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, sink: RecordingSink):
+        self.id = guild_id
+        self.name = f"guild-{guild_id}"
+        self.unavailable = False
+        self.filesize_limit = 8 * 1024 * 1024
+        self.channels: Dict[int, FakeChannel] = {}
+        self.members: Dict[int, FakeMember] = {}
+        self.roles = {guild_id + role: None for role in range(1, 6)}
+        self.log_channel = self.add_channel(guild_id + 100, sink)
+        self.text_channels = [self.add_channel(guild_id + 200 + n, sink) for n in range(5)]
+
+    def add_channel(self, channel_id: int, sink: RecordingSink) -> FakeChannel:
+        channel = self.channels[channel_id] = FakeChannel(self, channel_id, sink)
+        return channel
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    def get_role(self, role_id):
+        return None
+
+
+class _I18nCache:
+    async def get_locale(self, guild):
+        return "en-US"
+
+    async def get_regional_format(self, guild):
+        return None
+
+
+class _Context:
+    def __init__(self, command):
+        self.command = command
+
+
+class FakeBot:
+    """Just enough of Red for the cogs' listeners, routing and command detection"""
+
+    def __init__(self):
+        self.sink = RecordingSink()
+        self.guilds: Dict[int, FakeGuild] = {}
+        self.users: Dict[int, FakeUser] = {}
+        self.listeners: Dict[str, list] = {}
+        self._i18n_cache = _I18nCache()
+        self.commands = {"ping", "help", "useractivitylog"}
+        self.shard_count = 1
+
+    def add_listener(self, func, name=None):
+        self.listeners.setdefault(name or func.__name__, []).append(func)
+
+    def remove_listener(self, func, name=None):
+        self.listeners.get(name or func.__name__, []).remove(func)
+
+    async def dispatch(self, event: str, *args):
+        for listener in self.listeners.get(f"on_{event}", ()):
+            await listener(*args)
+
+    def get_guild(self, guild_id):
+        return self.guilds.get(guild_id)
+
+    def get_channel(self, channel_id):
+        for guild in self.guilds.values():
+            if channel := guild.get_channel(channel_id):
+                return channel
+        return None
+
+    def get_user(self, user_id):
+        return self.users.get(user_id)
+
+    async def cog_disabled_in_guild(self, cog, guild):
+        return False
+
+    async def cog_disabled_in_guild_raw(self, cog_name, guild_id):
+        return False
+
+    async def get_valid_prefixes(self, guild=None):
+        return list(PREFIXES)
+
+    async def get_context(self, message):
+        prefix = next((p for p in PREFIXES if message.content.startswith(p)), None)
+        if prefix is None:
+            return _Context(None)
+        invoked = message.content[len(prefix):].split(maxsplit=1)
+        return _Context(invoked[0] if invoked and invoked[0] in self.commands else None)
+
+
+class World:
+    """Guilds full of members and channels, producing gateway events"""
+
+    def __init__(self, bot: FakeBot, guilds: int = 10, members: int = 200, seed: int = 0):
+        self.bot = bot
+        self.rng = random.Random(seed)
+        self.now = datetime.now(timezone.utc)
+        self._sequence = 0
+        self.recent: Dict[int, List[FakeMessage]] = {}
+        for n in range(guilds):
+            guild = bot.guilds[(n + 1) << 32] = FakeGuild((n + 1) << 32, bot.sink)
+            self.recent[guild.id] = []
+            for m in range(members):
+                self.add_member(guild)
+
+    def _id(self) -> int:
+        self._sequence += 1
+        return snowflake(self.now, self._sequence)
+
+    def add_member(self, guild: FakeGuild) -> FakeMember:
+        user_id = self._id()
+        created_at = self.now - timedelta(days=self.rng.randint(0, 3000))
+        user = self.bot.users[user_id] = FakeUser(user_id, f"user{user_id % 100000}", created_at)
+        roles = self.rng.sample(sorted(guild.roles), self.rng.randint(0, 3))
+        member = guild.members[user_id] = FakeMember(guild, user, roles, joined_at=self.now)
+        return member
+
+    def guild(self) -> FakeGuild:
+        return self.bot.guilds[self.rng.choice(list(self.bot.guilds))]
+
+    def message(self, guild: FakeGuild = None, command_ratio: float = 0.05) -> FakeMessage:
+        guild = guild or self.guild()
+        rng = self.rng
+        if rng.random() < command_ratio:
+            content = "!" + rng.choice(sorted(self.bot.commands)) + " " + rng.choice(WORDS)
+        else:
+            content = " ".join(rng.choices(WORDS, k=rng.randint(1, 40)))
+        attachments = [FakeAttachment(self._id())] if rng.random() < 0.1 else []
+        message = FakeMessage(
+            self._id(),
+            rng.choice(guild.text_channels),
+            rng.choice(list(guild.members.values())),
+            content,
+            attachments,
+        )
+        recent = self.recent[guild.id]
+        recent.append(message)
+        if len(recent) > 1000:
+            del recent[:500]
+        return message
+
+    def old_message(self, guild: FakeGuild = None) -> FakeMessage:
+        """A message posted earlier, making one up if the guild has none yet"""
+        guild = guild or self.guild()
+        recent = self.recent[guild.id]
+        return recent.pop(self.rng.randrange(len(recent))) if recent else self.message(guild)
+
+    def raw_delete(self, cached: bool = False) -> discord.RawMessageDeleteEvent:
+        message = self.old_message()
+        payload = discord.RawMessageDeleteEvent(
+            {"id": message.id, "channel_id": message.channel.id, "guild_id": message.guild.id}
+        )
+        payload.cached_message = message if cached else None
+        return payload
+
+    def raw_bulk_delete(self, count: int = 50) -> discord.RawBulkMessageDeleteEvent:
+        guild = self.guild()
+        channel = self.rng.choice(guild.text_channels)
+        messages = [self.message(guild) for _ in range(count)]
+        payload = discord.RawBulkMessageDeleteEvent(
+            {
+                "ids": [m.id for m in messages],
+                "channel_id": channel.id,
+                "guild_id": guild.id,
+            }
+        )
+        payload.cached_messages = messages[: count // 2]
+        return payload
+
+    def member_update(self):
+        guild = self.guild()
+        before = self.rng.choice(list(guild.members.values()))
+        roll = self.rng.random()
+        if roll < 0.7:
+            # nickname, avatar and similar updates without role changes
+            after = before.copy()
+        elif roll < 0.9:
+            roles = set(before._roles) ^ {self.rng.choice(sorted(guild.roles))}
+            after = before.copy(roles=sorted(roles))
+        else:
+            after = before.copy(
+                premium_since=None if before.premium_since else datetime.now(timezone.utc)
+            )
+        guild.members[after.id] = after
+        return before, after
+
+    def leaving_member(self) -> FakeMember:
+        guild = self.guild()
+        member = guild.members.pop(self.rng.choice(list(guild.members)))
+        return member
@@ -0,0 +1,196 @@
+"""
+Drive every listener of UserActivityLog and UserRoleAnnouncer with fake gateway events
+
+Cogs are loaded against a stand-in bot with an in-memory Config driver and
+log channels that record what would be sent, so no Discord connection is
+needed. Every guild logs everything to one channel. Reports events/sec, p50
+and p99 latency per listener, and with --allocations, the peak traced memory
+and the number of memory blocks still held per event.
+
+Requires Red-DiscordBot and discord.py, run from the repository root:
+    python -m benchmarks.listeners
+    python -m benchmarks.listeners --events 2000 --rate 500 --only message_deleted
+"""
+import argparse
+import asyncio
+import gc
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.fakes import FakeBot, World, memory_config
+from useractivitylog.useractivitylog import UserActivityLog
+from userroleannouncer.userroleannouncer import UserRoleAnnouncer
+
+
+async def load_cogs(bot: FakeBot, world: World) -> Tuple[UserActivityLog, UserRoleAnnouncer]:
+    with memory_config():
+        activity = UserActivityLog(bot)
+        announcer = UserRoleAnnouncer(bot)
+    for guild in bot.guilds.values():
+        await announcer.config.guild(guild).boost_channel.set(guild.log_channel.id)
+        await announcer.config.guild(guild).join_channel.set(guild.log_channel.id)
+    await activity.initialize()
+    await announcer.initialize()
+    # the sink is not rate limited, batching is kept so output matches production
+    activity.dispatcher.rate = announcer.dispatcher.rate = 1e9
+    activity.dispatcher.burst = announcer.dispatcher.burst = 1e9
+    activity.dispatcher.window = 0
+    for guild in bot.guilds.values():
+        log_channel = guild.log_channel.id
+        changes = {
+            key: log_channel
+            for key in (
+                "delete_channel",
+                "edit_channel",
+                "bulk_delete_channel",
+                "join_channel",
+                "leave_channel",
+                "boost_channel",
+            )
+        }
+        changes["save_bulk"] = True
+        activity.settings.update(guild.id, **changes)
+    return activity, announcer
+
+
+LISTENERS = (
+    "message_stored",
+    "message_edited",
+    "message_deleted",
+    "raw_message_deleted",
+    "raw_bulk_message_deleted",
+    "member_join",
+    "member_leave",
+    "member_update",
+)
+
+
+def scenarios(bot: FakeBot, world: World, cog: UserActivityLog) -> Dict[str, Callable]:
+    """Listener name -> function making one event and handling it"""
+
+    async def message_stored():
+        await cog.message_stored(world.message())
+
+    async def message_edited():
+        before = world.old_message()
+        after = before.edited(before.content + " edited")
+        await cog.message_store_edited(before, after)
+        await cog.message_edited(before, after)
+
+    async def message_deleted():
+        message = world.old_message()
+        await cog.message_deleted(message)
+        payload = world.raw_delete(cached=True)
+        await cog.raw_message_deleted(payload)
+
+    async def raw_message_deleted():
+        # evicted from discord.py's cache, found in the cog's own store or not at all
+        await cog.raw_message_deleted(world.raw_delete())
+
+    async def raw_bulk_message_deleted():
+        await cog.raw_bulk_message_deleted(world.raw_bulk_delete())
+
+    async def member_join():
+        await cog.message_user_join(world.add_member(world.guild()))
+
+    async def member_leave():
+        await cog.message_user_leave(world.leaving_member())
+
+    async def member_update():
+        # routed to both cogs through the shared router
+        await bot.dispatch("member_update", *world.member_update())
+
+    return {
+        "message_stored": message_stored,
+        "message_edited": message_edited,
+        "message_deleted": message_deleted,
+        "raw_message_deleted": raw_message_deleted,
+        "raw_bulk_message_deleted": raw_bulk_message_deleted,
+        "member_join": member_join,
+        "member_leave": member_leave,
+        "member_update": member_update,
+    }
+
+
+def percentile(latencies: List[float], fraction: float) -> float:
+    return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+
+async def drive(event: Callable, count: int, rate: float) -> Tuple[float, List[float]]:
+    """Handle `count` events, paced at `rate` per second if given"""
+    latencies = []
+    interval = 1 / rate if rate else 0
+    start = time.perf_counter()
+    for n in range(count):
+        if interval:
+            delay = start + n * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        began = time.perf_counter()
+        await event()
+        latencies.append(time.perf_counter() - began)
+    return count / (time.perf_counter() - start), sorted(latencies)
+
+
+async def allocations(event: Callable, count: int) -> Tuple[float, float]:
+    """Peak traced bytes per event and memory blocks still held per event"""
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    for _ in range(count):
+        await event()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.collect()
+    return peak / count, (sys.getallocatedblocks() - blocks) / count
+
+
+async def run(args):
+    bot = FakeBot()
+    world = World(bot, guilds=args.guilds, members=args.members)
+    activity, announcer = await load_cogs(bot, world)
+    events = scenarios(bot, world, activity)
+
+    # fill the message store, so deletions and edits find something
+    for _ in range(args.warmup):
+        await events["message_stored"]()
+    if args.only:
+        events = {name: events[name] for name in args.only}
+
+    print(f"{'listener':<26}{'events/sec':>12}{'p50 ms':>10}{'p99 ms':>10}", end="")
+    print(f"{'peak B/event':>14}{'kept blocks/event':>19}" if args.allocations else "")
+    for name, event in events.items():
+        throughput, latencies = await drive(event, args.events, args.rate)
+        p50 = percentile(latencies, 0.5) * 1000
+        p99 = percentile(latencies, 0.99) * 1000
+        line = f"{name:<26}{throughput:>12,.0f}{p50:>10.3f}{p99:>10.3f}"
+        if args.allocations:
+            peak, kept = await allocations(event, min(args.events, 1000))
+            line += f"{peak:>14,.0f}{kept:>19.2f}"
+        print(line)
+
+    await activity.dispatcher.flush()
+    await announcer.dispatcher.flush()
+    print(f"\nsent {len(bot.sink.messages):,} messages with {bot.sink.embeds:,} embeds")
+    activity.cog_unload()
+    announcer.cog_unload()
+    await asyncio.sleep(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=5_000, help="events per listener")
+    parser.add_argument("--rate", type=float, default=0, help="events/sec, 0 for max speed")
+    parser.add_argument("--guilds", type=int, default=10)
+    parser.add_argument("--members", type=int, default=200, help="members per guild")
+    parser.add_argument("--warmup", type=int, default=5_000, help="messages stored first")
+    parser.add_argument("--only", nargs="+", choices=LISTENERS, help="listeners to run")
+    parser.add_argument("--allocations", action="store_true", help="measure allocations")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Replay a recorded gateway trace against UserActivityLog and UserRoleAnnouncer
+
+Traces are recorded on a live bot with `[p]useractivitylog trace start`, their
+IDs and content are sanitized. Events are replayed in real time, accelerated
+by --speed, or as fast as possible with --speed 0. Reports timing per
+listener, and writes every sent embed to --output so two runs can be compared
+with --compare, proving a change did not change what is logged.
+
+Requires Red-DiscordBot and discord.py, run from the repository root:
+    python -m benchmarks.replay trace.ndjson.gz --speed 0 --output after.ndjson
+    python -m benchmarks.replay trace.ndjson.gz --speed 0 --compare before.ndjson
+"""
+import argparse
+import asyncio
+import difflib
+import json
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List
+
+import discord
+
+from benchmarks.fakes import (
+    FakeAttachment,
+    FakeBot,
+    FakeGuild,
+    FakeMember,
+    FakeMessage,
+    FakeUser,
+    RecordingSink,
+)
+from benchmarks.listeners import load_cogs, percentile
+from useractivitylog.trace import read_trace
+
+
+class ReplayWorld:
+    """Builds fake gateway objects from recorded events, keeping them by id"""
+
+    def __init__(self, bot: FakeBot):
+        self.bot = bot
+        self.messages: Dict[int, FakeMessage] = {}
+        # fixed so replays of the same trace log the same
+        self.started = datetime(2021, 1, 1, tzinfo=timezone.utc)
+
+    def time(self, data: dict) -> datetime:
+        return self.started + timedelta(seconds=data["at"])
+
+    def guild(self, guild_id: int) -> FakeGuild:
+        guild = self.bot.guilds.get(guild_id)
+        if guild is None:
+            guild = self.bot.guilds[guild_id] = FakeGuild(guild_id, self.bot.sink)
+        return guild
+
+    def channel(self, guild: FakeGuild, data: dict):
+        channel = guild.get_channel(data["channel"])
+        if channel is None:
+            channel = guild.add_channel(data["channel"], self.bot.sink)
+        channel.nsfw = data.get("nsfw", channel.nsfw)
+        channel.category_id = data.get("category", channel.category_id)
+        return channel
+
+    def member(self, data: dict, joined_at: datetime = None) -> FakeMember:
+        guild = self.guild(data["guild"])
+        if joined_at is None:
+            # members not seen joining are taken to have joined before the trace
+            current = guild.members.get(data["id"])
+            joined_at = current.joined_at if current is not None else self.started
+        user = self.bot.users.get(data["id"])
+        if user is None:
+            # user IDs are hashed whole, traces keep no account creation time
+            user = self.bot.users[data["id"]] = FakeUser(
+                data["id"], f"user{data['id'] % 100000}", self.started, data["bot"]
+            )
+        premium_since = data.get("premium_since")
+        member = FakeMember(
+            guild,
+            user,
+            data["roles"],
+            datetime.fromisoformat(premium_since) if premium_since else None,
+            joined_at,
+        )
+        guild.members[member.id] = member
+        return member
+
+    def message(self, data: dict) -> FakeMessage:
+        guild = self.guild(data["guild"])
+        author = self.member({**data, "id": data["author"], "premium_since": None})
+        message = FakeMessage(
+            data["id"],
+            self.channel(guild, data),
+            author,
+            data["content"],
+            [FakeAttachment(data["id"] + n) for n in range(data["attachments"])],
+        )
+        self.messages[message.id] = message
+        return message
+
+    def raw_delete(self, data: dict) -> discord.RawMessageDeleteEvent:
+        payload = discord.RawMessageDeleteEvent(
+            {"id": data["id"], "channel_id": data["channel"], "guild_id": data["guild"]}
+        )
+        self.channel(self.guild(data["guild"]), data)
+        cached = self.messages.pop(data["id"], None)
+        payload.cached_message = cached if data["cached"] else None
+        return payload
+
+    def raw_bulk_delete(self, data: dict) -> discord.RawBulkMessageDeleteEvent:
+        payload = discord.RawBulkMessageDeleteEvent(
+            {"ids": data["ids"], "channel_id": data["channel"], "guild_id": data["guild"]}
+        )
+        self.channel(self.guild(data["guild"]), data)
+        payload.cached_messages = [self.message(m) for m in data["cached"]]
+        for message_id in data["ids"]:
+            self.messages.pop(message_id, None)
+        return payload
+
+
+def handlers(bot: FakeBot, world: ReplayWorld, cog):
+    """Recorded event -> coroutine handling it like the gateway would"""
+
+    async def message(data):
+        await cog.message_stored(world.message(data))
+
+    async def message_delete(data):
+        await cog.message_deleted(world.message(data))
+
+    async def raw_message_delete(data):
+        await cog.raw_message_deleted(world.raw_delete(data))
+
+    async def raw_bulk_message_delete(data):
+        await cog.raw_bulk_message_deleted(world.raw_bulk_delete(data))
+
+    async def message_edit(data):
+        before, after = world.message(data["before"]), world.message(data["after"])
+        await cog.message_store_edited(before, after)
+        await cog.message_edited(before, after)
+
+    async def member_join(data):
+        await cog.message_user_join(world.member(data, world.time(data)))
+
+    async def member_remove(data):
+        member = world.member(data)
+        member.guild.members.pop(member.id, None)
+        await cog.message_user_leave(member)
+
+    async def member_update(data):
+        before, after = world.member(data["before"]), world.member(data["after"])
+        await bot.dispatch("member_update", before, after)
+
+    return {
+        "message": message,
+        "message_delete": message_delete,
+        "raw_message_delete": raw_message_delete,
+        "raw_bulk_message_delete": raw_bulk_message_delete,
+        "message_edit": message_edit,
+        "member_join": member_join,
+        "member_remove": member_remove,
+        "member_update": member_update,
+    }
+
+
+def sent_lines(sink: RecordingSink, keep_timestamps: bool) -> List[str]:
+    """One line per sent embed, grouped by channel
+
+    Batching depends on timing, so embeds are compared one by one. Order is
+    only guaranteed within a channel, so channels are kept together.
+    """
+    by_channel = defaultdict(list)
+    for message in sink.messages:
+        for embed in message.embeds:
+            if not keep_timestamps:
+                embed = {key: value for key, value in embed.items() if key != "timestamp"}
+            by_channel[message.channel_id].append(
+                json.dumps({"channel": message.channel_id, "embed": embed}, sort_keys=True)
+            )
+        if message.filename:
+            by_channel[message.channel_id].append(
+                json.dumps({"channel": message.channel_id, "file": message.filename})
+            )
+    return [line for channel_id in sorted(by_channel) for line in by_channel[channel_id]]
+
+
+async def replay(args) -> int:
+    events = list(read_trace(args.trace))
+    if not events:
+        print("trace is empty")
+        return 1
+    bot = FakeBot()
+    world = ReplayWorld(bot)
+    # every guild has to exist before the cogs are configured to log it
+    for event in events:
+        world.guild(event.get("guild") or event["after"]["guild"])
+    activity, announcer = await load_cogs(bot, world)
+    handle = handlers(bot, world, activity)
+
+    latencies = defaultdict(list)
+    start = time.perf_counter()
+    for event in events:
+        if args.speed:
+            delay = start + event["at"] / args.speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        began = time.perf_counter()
+        await handle[event["event"]](event)
+        latencies[event["event"]].append(time.perf_counter() - began)
+    elapsed = time.perf_counter() - start
+    # edits still waiting for their window are logged now
+    await activity.edits.close()
+    await activity.dispatcher.flush()
+    await announcer.dispatcher.flush()
+
+    print(f"replayed {len(events):,} events in {elapsed:.2f}s ({len(events) / elapsed:,.0f}/sec)")
+    print(f"{'event':<26}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'total ms':>12}")
+    for name, values in sorted(latencies.items()):
+        values.sort()
+        print(
+            f"{name:<26}{len(values):>8}{percentile(values, 0.5) * 1000:>10.3f}"
+            f"{percentile(values, 0.99) * 1000:>10.3f}{sum(values) * 1000:>12.1f}"
+        )
+
+    lines = sent_lines(bot.sink, args.keep_timestamps)
+    print(f"sent {len(bot.sink.messages):,} messages with {len(lines):,} embeds and files")
+    if args.output:
+        args.output.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    if args.compare:
+        expected = args.compare.read_text(encoding="utf-8").splitlines()
+        diff = list(
+            difflib.unified_diff(expected, lines, str(args.compare), "replay", lineterm="")
+        )
+        if diff:
+            print("\n".join(diff[: args.diff_lines]))
+            print(f"output differs from {args.compare}")
+            return 1
+        print(f"output matches {args.compare}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("trace", type=Path)
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="1 for real time, 0 for max speed"
+    )
+    parser.add_argument("--output", type=Path, help="write sent embeds here")
+    parser.add_argument("--compare", type=Path, help="compare sent embeds with this output")
+    parser.add_argument("--diff-lines", type=int, default=50)
+    parser.add_argument(
+        "--keep-timestamps",
+        action="store_true",
+        help="also compare embed timestamps, some are taken from the clock at replay",
+    )
+    args = parser.parse_args()
+    sys.exit(asyncio.run(replay(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Compare per-event settings resolution in UserActivityLog
+
+"before" awaits one Config value per setting the way `message_deleted` used to,
+"after" makes a single synchronous lookup on the in-memory settings snapshot.
+Config reads are approximated by an awaitable that deep-copies the stored value,
+which is what Red's Config does on every read.
+
+Run from the repository root:
+    python -m benchmarks.settings_snapshot
+"""
+import argparse
+import asyncio
+import time
+from copy import deepcopy
+
+from useractivitylog.settings import DEFAULT_GUILD, SettingsCache
+
+
+class _Value:
+    def __init__(self, value):
+        self._value = value
+
+    async def _get(self):
+        await asyncio.sleep(0)
+        return deepcopy(self._value)
+
+    def __call__(self):
+        return self._get()
+
+
+class _GuildConfig:
+    def __init__(self, data):
+        for key, value in data.items():
+            setattr(self, key, _Value(value))
+
+
+def _guild_data(guild_id):
+    data = dict(DEFAULT_GUILD)
+    data["delete_channel"] = guild_id + 1
+    data["ignored_users"] = list(range(guild_id, guild_id + 50))
+    data["ignored_channels"] = list(range(guild_id, guild_id + 10))
+    return data
+
+
+async def _before(guilds, events):
+    configs = {guild_id: _GuildConfig(data) for guild_id, data in guilds.items()}
+    guild_ids = list(guilds)
+    start = time.perf_counter()
+    for i in range(events):
+        config = configs[guild_ids[i % len(guild_ids)]]
+        await config.delete_channel()
+        await config.ignored_categories()
+        await config.deletion()
+        await config.ignored_channels()
+        await config.ignored_users()
+    return events / (time.perf_counter() - start)
+
+
+async def _after(guilds, events):
+    cache = SettingsCache()
+    cache.load(guilds)
+    guild_ids = list(guilds)
+    start = time.perf_counter()
+    for i in range(events):
+        settings = cache.get(guild_ids[i % len(guild_ids)])
+        settings.delete_channel
+        settings.ignored_categories
+        settings.deletion
+        settings.ignored_channels
+        settings.ignored_users
+    return events / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=100)
+    parser.add_argument("--events", type=int, default=100_000)
+    args = parser.parse_args()
+
+    guilds = {guild_id: _guild_data(guild_id) for guild_id in range(args.guilds)}
+    before = asyncio.run(_before(guilds, args.events))
+    after = asyncio.run(_after(guilds, args.events))
+    print(f"before: {before:>14,.0f} events/sec")
+    print(f"after:  {after:>14,.0f} events/sec")
+    print(f"speedup: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 from .introchannelmanager import IntroChannelManager
 
 __red_end_user_data_statement__ = (
-    "This cog does not persistently store data or metadata about users."
+    "This cog stores the ids of intro messages and of the members who posted them, "
+    "and when members without an intro are due a reminder."
 )
 
 
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import time
+from enum import IntEnum
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .introindex import IntroIndex
+
+log = logging.getLogger("red.ukfur-cogs.intromanager.deadlines")
+
+# deadlines are wall clock times, sleeps are capped so a clock jump is noticed
+MAX_SLEEP = 300
+
+
+class DeadlineStage(IntEnum):
+    REMIND = 1
+    ENFORCE = 2
+
+
+class Deadline:
+    __slots__ = ("guild_id", "member_id", "due", "stage", "position")
+
+    def __init__(self, guild_id: int, member_id: int, due: float, stage: DeadlineStage):
+        self.guild_id = guild_id
+        self.member_id = member_id
+        self.due = due
+        self.stage = stage
+        self.position = -1
+
+    @property
+    def key(self) -> Tuple[int, int]:
+        return self.guild_id, self.member_id
+
+
+class DeadlineHeap:
+    """Binary min-heap of deadlines by due time, one per member
+
+    Every entry knows its position in the heap, so an entry can be moved
+    or removed by key in O(log n) instead of being left behind as a
+    tombstone.
+    """
+
+    def __init__(self, entries: Iterable[Deadline] = ()):
+        self._heap: List[Deadline] = []
+        self._entries: Dict[Tuple[int, int], Deadline] = {}
+        for entry in entries:
+            self._entries[entry.key] = entry
+        self._heap = list(self._entries.values())
+        for position, entry in enumerate(self._heap):
+            entry.position = position
+        for position in reversed(range(len(self._heap) // 2)):
+            self._sift_down(position)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, key: Tuple[int, int]):
+        return key in self._entries
+
+    def __iter__(self):
+        return iter(self._heap)
+
+    def get(self, key: Tuple[int, int]) -> Optional[Deadline]:
+        return self._entries.get(key)
+
+    def peek(self) -> Optional[Deadline]:
+        return self._heap[0] if self._heap else None
+
+    def push(self, entry: Deadline):
+        """Add a deadline, replacing the member's current one"""
+        current = self._entries.get(entry.key)
+        if current is not None:
+            current.due = entry.due
+            current.stage = entry.stage
+            self._sift_up(current.position)
+            self._sift_down(current.position)
+            return
+        self._entries[entry.key] = entry
+        entry.position = len(self._heap)
+        self._heap.append(entry)
+        self._sift_up(entry.position)
+
+    def remove(self, key: Tuple[int, int]) -> Optional[Deadline]:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        last = self._heap.pop()
+        if last is not entry:
+            self._heap[entry.position] = last
+            last.position = entry.position
+            self._sift_up(last.position)
+            self._sift_down(last.position)
+        entry.position = -1
+        return entry
+
+    def pop(self) -> Deadline:
+        return self.remove(self._heap[0].key)
+
+    def _swap(self, i: int, j: int):
+        heap = self._heap
+        heap[i], heap[j] = heap[j], heap[i]
+        heap[i].position = i
+        heap[j].position = j
+
+    def _sift_up(self, position: int):
+        heap = self._heap
+        while position > 0:
+            parent = (position - 1) // 2
+            if heap[parent].due <= heap[position].due:
+                break
+            self._swap(position, parent)
+            position = parent
+
+    def _sift_down(self, position: int):
+        heap = self._heap
+        size = len(heap)
+        while True:
+            smallest = position
+            for child in (2 * position + 1, 2 * position + 2):
+                if child < size and heap[child].due < heap[smallest].due:
+                    smallest = child
+            if smallest == position:
+                return
+            self._swap(position, smallest)
+            position = smallest
+
+
+class DeadlineScheduler:
+    """Calls back when a member's deadline is due
+
+    Deadlines are stored with the intro index and loaded into a heap on
+    open, members are never scanned. A single task sleeps until the
+    earliest deadline. Deadlines missed while the bot was offline are
+    due right after start. A deadline is deleted from disk only after
+    its callback ran, unless the callback scheduled the member's next one.
+    """
+
+    def __init__(
+            self,
+            index: IntroIndex,
+            callback: Callable[[int, int, DeadlineStage], Awaitable[None]],
+    ):
+        self.index = index
+        self.callback = callback
+        self._heap = DeadlineHeap()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.fired = 0
+        self.cancelled = 0
+
+    async def open(self):
+        self._heap = DeadlineHeap(
+            Deadline(guild_id, member_id, due, DeadlineStage(stage))
+            for guild_id, member_id, due, stage in await self.index.deadlines()
+        )
+        log.debug("Loaded %s intro deadlines", len(self._heap))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def get(self, guild_id: int, member_id: int) -> Optional[Deadline]:
+        return self._heap.get((guild_id, member_id))
+
+    def pending(self, guild_id: int) -> List[Deadline]:
+        """The guild's deadlines, earliest first"""
+        entries = [entry for entry in self._heap if entry.guild_id == guild_id]
+        return sorted(entries, key=lambda entry: entry.due)
+
+    async def schedule(self, guild_id: int, member_id: int, due: float, stage: DeadlineStage):
+        """Set the member's deadline, replacing the one they had"""
+        self._heap.push(Deadline(guild_id, member_id, due, stage))
+        if self._heap.peek().key == (guild_id, member_id):
+            self._wakeup.set()
+        await self.index.set_deadline(guild_id, member_id, due, stage)
+
+    async def cancel(self, guild_id: int, member_id: int) -> bool:
+        if self._heap.remove((guild_id, member_id)) is None:
+            return False
+        self.cancelled += 1
+        await self.index.delete_deadline(guild_id, member_id)
+        return True
+
+    def forget_member(self, member_id: int):
+        """Drop the member's deadlines in every guild, the index deletes them from disk"""
+        for entry in [entry for entry in self._heap if entry.member_id == member_id]:
+            self._heap.remove(entry.key)
+
+    async def _run(self):
+        while True:
+            entry = self._heap.peek()
+            delay = MAX_SLEEP if entry is None else min(MAX_SLEEP, entry.due - time.time())
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._heap.pop()
+            self.fired += 1
+            try:
+                await self.callback(entry.guild_id, entry.member_id, entry.stage)
+            except Exception:
+                log.exception("Unable to handle the intro deadline of %s", entry.member_id)
+            if entry.key not in self._heap:
+                await self.index.delete_deadline(entry.guild_id, entry.member_id)
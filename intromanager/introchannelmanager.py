@@ -1,13 +1,422 @@
+import asyncio
+import logging
+import time
+from datetime import timezone
+from typing import Dict, List, Optional, Tuple
+
+import discord
 from redbot.core import commands
+from redbot.core.config import Config
+from redbot.core.data_manager import cog_data_path
+from redbot.core.i18n import Translator, cog_i18n
+from redbot.core.utils import chat_formatting as chat
+from ukfurcore import TokenBucket
+
+from .deadlines import DeadlineScheduler, DeadlineStage
+from .introindex import IntroIndex
+
+log = logging.getLogger("red.ukfur-cogs.intromanager")
+_ = Translator("IntroChannelManager", __file__)
+
+# history pages of 100 messages fetched per second by backfills, across all guilds
+BACKFILL_RATE = 1.0
+BACKFILL_BURST = 2
+# seconds a kick or role removal waits while the history is still being scanned
+BACKFILL_GRACE = 3600
+
 
+def reminder_text(message: Optional[str], member: discord.Member, channel: discord.TextChannel):
+    if message is None:
+        message = _("Hi {member}, welcome to {server}! Please introduce yourself in {channel}.")
+    return message.format(member=member.mention, server=member.guild.name, channel=channel.mention)
+
+
+@cog_i18n(_)
 class IntroChannelManager(commands.Cog):
-    """My custom cog"""
+    """Keeps track of who posted an intro in the intro channel"""
+
+    __version__ = "1"
 
     def __init__(self, bot):
         self.bot = bot
+        self.config = Config.get_conf(self, identifier=0x2c1f4e7b9a0d36e5, force_registration=True)
+        default_guild = {
+            "intro_channel": None,
+            "reminder_hours": 0,
+            "reminder_message": None,
+            "action": None,
+            "action_days": 0,
+            "action_role": None,
+        }
+        self.config.register_guild(**default_guild)
+        self.index: Optional[IntroIndex] = None
+        self.deadlines: Optional[DeadlineScheduler] = None
+        self._deadline_starter: Optional[asyncio.Task] = None
+        # guild id -> intro channel id, so listeners do not wait on config
+        self._channels: Dict[int, int] = {}
+        self._backfills: Dict[int, asyncio.Task] = {}
+        self._history_bucket = TokenBucket(BACKFILL_RATE, BACKFILL_BURST)
+
+    async def initialize(self):
+        self.index = IntroIndex(cog_data_path(self) / "intros.sqlite3")
+        await self.index.open()
+        self.deadlines = DeadlineScheduler(self.index, self._deadline_due)
+        await self.deadlines.open()
+        self._deadline_starter = asyncio.create_task(self._start_deadlines())
+        for guild_id, data in (await self.config.all_guilds()).items():
+            if data["intro_channel"]:
+                self._channels[guild_id] = data["intro_channel"]
+                self._start_backfill(guild_id)
+
+    async def _start_deadlines(self):
+        """Deadlines are handled once members are known, missed ones are due right away"""
+        await self.bot.wait_until_red_ready()
+        self.deadlines.start()
+
+    def cog_unload(self):
+        if self._deadline_starter is not None:
+            self._deadline_starter.cancel()
+        for task in self._backfills.values():
+            task.cancel()
+        asyncio.create_task(self._shutdown())
+
+    async def _shutdown(self):
+        await asyncio.gather(*self._backfills.values(), return_exceptions=True)
+        await self.deadlines.close()
+        await self.index.close()
+
+    def format_help_for_context(self, ctx: commands.Context) -> str:
+        pre_processed = super().format_help_for_context(ctx)
+        return f"{pre_processed}\n\n**Version**: {self.__version__}"
+
+    async def red_delete_data_for_user(self, *, requester, user_id: int):
+        self.deadlines.forget_member(user_id)
+        await self.index.delete_member(user_id)
+
+    def _start_backfill(self, guild_id: int):
+        task = self._backfills.pop(guild_id, None)
+        if task is not None:
+            task.cancel()
+        self._backfills[guild_id] = asyncio.create_task(self._backfill(guild_id))
+
+    async def _backfill(self, guild_id: int):
+        """Scan the intro channel's history oldest first, resuming from the last checkpoint"""
+        await self.bot.wait_until_red_ready()
+        channel = self.bot.get_channel(self._channels.get(guild_id))
+        if channel is None:
+            return
+        state = await self.index.backfill_state(channel.id)
+        while not state.done:
+            await asyncio.sleep(self._history_bucket.reserve())
+            try:
+                messages = await channel.history(
+                    limit=100, after=discord.Object(id=state.after_id), oldest_first=True
+                ).flatten()
+            except discord.HTTPException as e:
+                log.warning(
+                    "Intro backfill of %s stopped at %s: %s", channel.id, state.after_id, e
+                )
+                return
+            if messages:
+                state.after_id = messages[-1].id
+            state.scanned += len(messages)
+            state.done = len(messages) < 100
+            rows = [(m.id, m.author.id) for m in messages if not m.author.bot]
+            await self.index.add_page(guild_id, rows, state)
+            for message_id, member_id in rows:
+                if self.deadlines.get(guild_id, member_id) is not None:
+                    await self.deadlines.cancel(guild_id, member_id)
+        log.debug("Intro backfill of %s done, %s messages scanned", channel.id, state.scanned)
+
+    @staticmethod
+    def _next_deadline(
+            member: discord.Member, settings: dict, after: DeadlineStage = None
+    ) -> Optional[Tuple[float, DeadlineStage]]:
+        """When the member's next deadline is due, counted from when they joined"""
+        if member.joined_at is None:
+            joined = time.time()
+        else:
+            joined = member.joined_at.replace(tzinfo=timezone.utc).timestamp()
+        if after is None and settings["reminder_hours"]:
+            return joined + settings["reminder_hours"] * 3600, DeadlineStage.REMIND
+        if after is not DeadlineStage.ENFORCE and settings["action"] and settings["action_days"]:
+            return joined + settings["action_days"] * 86400, DeadlineStage.ENFORCE
+        return None
+
+    async def _schedule_first_deadlines(self, guild_id: int, member_ids: List[int]):
+        """Give members whose intros were all deleted a deadline again"""
+        guild = self.bot.get_guild(guild_id)
+        if guild is None or not member_ids:
+            return
+        settings = await self.config.guild(guild).all()
+        for member_id in member_ids:
+            member = guild.get_member(member_id)
+            if member is None or member.bot:
+                continue
+            deadline = self._next_deadline(member, settings)
+            if deadline is not None:
+                await self.deadlines.schedule(guild_id, member_id, *deadline)
+
+    async def _deadline_due(self, guild_id: int, member_id: int, stage: DeadlineStage):
+        """Remind a member without an intro, or kick them or take their role"""
+        guild = self.bot.get_guild(guild_id)
+        member = guild and guild.get_member(member_id)
+        if member is None or self.index.has_intro(guild_id, member_id):
+            return
+        channel = guild.get_channel(self._channels.get(guild_id))
+        if channel is None:
+            return
+        settings = await self.config.guild(guild).all()
+        if stage is DeadlineStage.ENFORCE:
+            if not (await self.index.backfill_state(channel.id)).done:
+                # their intro may still be found in the channel history
+                await self.deadlines.schedule(
+                    guild_id, member_id, time.time() + BACKFILL_GRACE, stage
+                )
+            elif settings["action"] and settings["action_days"]:
+                await self._enforce(member, settings)
+            return
+        if settings["reminder_hours"]:
+            try:
+                await member.send(reminder_text(settings["reminder_message"], member, channel))
+            except discord.HTTPException as e:
+                log.debug("Unable to remind %s about their intro: %s", member.id, e)
+        deadline = self._next_deadline(member, settings, after=stage)
+        if deadline is not None:
+            await self.deadlines.schedule(guild_id, member_id, *deadline)
+
+    async def _enforce(self, member: discord.Member, settings: dict):
+        reason = _("No intro posted within {} days").format(settings["action_days"])
+        try:
+            if settings["action"] == "kick":
+                await member.kick(reason=reason)
+            else:
+                role = member.guild.get_role(settings["action_role"])
+                if role is not None and role in member.roles:
+                    await member.remove_roles(role, reason=reason)
+        except discord.HTTPException as e:
+            log.warning("Unable to %s %s without an intro: %s", settings["action"], member.id, e)
 
-    @commands.command()
+    @commands.group(autohelp=True, aliases=["intromanager"])
+    @commands.guild_only()
+    @commands.admin_or_permissions(manage_guild=True)
     async def introchannelmanager(self, ctx):
-        """This does stuff!"""
-        # Your code will go here
-        await ctx.send("I can do stuff!")
\ No newline at end of file
+        """Manage the intro channel"""
+        pass
+
+    @introchannelmanager.command(name="channel")
+    async def set_channel(self, ctx, channel: discord.TextChannel = None):
+        """Set the intro channel
+
+        Its history is scanned for intros already posted.
+        If channel isn't specified, the intro channel is unset."""
+        if channel is not None and channel.id == self._channels.get(ctx.guild.id):
+            await ctx.send(chat.info(_("{} is already the intro channel").format(channel.mention)))
+            return
+        task = self._backfills.pop(ctx.guild.id, None)
+        if task is not None:
+            task.cancel()
+        await self.index.reset(ctx.guild.id)
+        # deadlines were counted against intros in the old channel
+        for entry in self.deadlines.pending(ctx.guild.id):
+            await self.deadlines.cancel(ctx.guild.id, entry.member_id)
+        await self.config.guild(ctx.guild).intro_channel.set(channel.id if channel else None)
+        if channel is None:
+            self._channels.pop(ctx.guild.id, None)
+        else:
+            self._channels[ctx.guild.id] = channel.id
+            self._start_backfill(ctx.guild.id)
+        await ctx.tick()
+
+    @introchannelmanager.command(name="backfill")
+    async def backfill_status(self, ctx):
+        """Show how far the intro channel's history has been scanned"""
+        channel = ctx.guild.get_channel(self._channels.get(ctx.guild.id))
+        if channel is None:
+            await ctx.send(chat.error(_("Intro channel is not set")))
+            return
+        state = await self.index.backfill_state(channel.id)
+        task = self._backfills.get(ctx.guild.id)
+        if state.done:
+            status = _("done")
+        elif task is not None and not task.done():
+            status = _("running")
+        else:
+            status = _("stopped, use `{prefix}introchannelmanager rescan` to resume").format(
+                prefix=ctx.clean_prefix
+            )
+        await ctx.send(
+            chat.info(
+                _("Backfill of {channel} {status}: {scanned} messages scanned, "
+                  "{members} members with an intro").format(
+                    channel=channel.mention,
+                    status=status,
+                    scanned=state.scanned,
+                    members=self.index.count(ctx.guild.id),
+                )
+            )
+        )
+
+    @introchannelmanager.command()
+    async def rescan(self, ctx, from_start: bool = False):
+        """Resume scanning the intro channel's history
+
+        With `from_start` every known intro is forgotten and the scan starts over."""
+        if ctx.guild.id not in self._channels:
+            await ctx.send(chat.error(_("Intro channel is not set")))
+            return
+        if from_start:
+            task = self._backfills.pop(ctx.guild.id, None)
+            if task is not None:
+                task.cancel()
+            await self.index.reset(ctx.guild.id)
+        self._start_backfill(ctx.guild.id)
+        await ctx.tick()
+
+    @introchannelmanager.command()
+    async def check(self, ctx, *, member: discord.Member):
+        """Check if a member has posted an intro"""
+        channel_id = self._channels.get(ctx.guild.id)
+        if channel_id is None:
+            await ctx.send(chat.error(_("Intro channel is not set")))
+            return
+        message_id = self.index.first_intro(ctx.guild.id, member.id)
+        if message_id is None:
+            await ctx.send(chat.info(_("{} has not posted an intro").format(member)))
+            return
+        await ctx.send(
+            chat.info(
+                _("{member} posted an intro: {link}").format(
+                    member=member,
+                    link=f"https://discord.com/channels/{ctx.guild.id}/{channel_id}/{message_id}",
+                )
+            )
+        )
+
+    @introchannelmanager.command()
+    async def reminder(self, ctx, hours: int, *, message: str = None):
+        """Remind members without an intro after some hours
+
+        The message can use `{member}`, `{server}` and `{channel}`.
+        Applies to members joining from now on, 0 disables reminders."""
+        if hours < 0:
+            await ctx.send(chat.error(_("Hours can't be negative")))
+            return
+        if message is not None:
+            try:
+                reminder_text(message, ctx.author, ctx.channel)
+            except (KeyError, IndexError, ValueError):
+                await ctx.send(
+                    chat.error(_("Only `{member}`, `{server}` and `{channel}` can be used"))
+                )
+                return
+        await self.config.guild(ctx.guild).reminder_hours.set(hours)
+        await self.config.guild(ctx.guild).reminder_message.set(message)
+        await ctx.tick()
+
+    @introchannelmanager.group(name="action")
+    async def set_action(self, ctx):
+        """Set what happens to members without an intro
+
+        Applies to members joining from now on."""
+        pass
+
+    @set_action.command(name="kick")
+    async def action_kick(self, ctx, days: int):
+        """Kick members without an intro after some days"""
+        if days <= 0:
+            await ctx.send(chat.error(_("Days must be positive")))
+            return
+        await self.config.guild(ctx.guild).action.set("kick")
+        await self.config.guild(ctx.guild).action_days.set(days)
+        await ctx.tick()
+
+    @set_action.command(name="removerole")
+    async def action_remove_role(self, ctx, days: int, *, role: discord.Role):
+        """Remove a role from members without an intro after some days"""
+        if days <= 0:
+            await ctx.send(chat.error(_("Days must be positive")))
+            return
+        if role >= ctx.guild.me.top_role:
+            await ctx.send(chat.error(_("I can't remove {} from members").format(role.name)))
+            return
+        await self.config.guild(ctx.guild).action.set("role")
+        await self.config.guild(ctx.guild).action_days.set(days)
+        await self.config.guild(ctx.guild).action_role.set(role.id)
+        await ctx.tick()
+
+    @set_action.command(name="none")
+    async def action_none(self, ctx):
+        """Do nothing to members without an intro"""
+        await self.config.guild(ctx.guild).action.set(None)
+        await ctx.tick()
+
+    @introchannelmanager.command(name="deadlines")
+    async def show_deadlines(self, ctx):
+        """Show the next members to be reminded, kicked or lose their role"""
+        pending = self.deadlines.pending(ctx.guild.id)
+        if not pending:
+            await ctx.send(chat.info(_("No members are waiting on a deadline")))
+            return
+        stages = {DeadlineStage.REMIND: _("reminder"), DeadlineStage.ENFORCE: _("action")}
+        now = time.time()
+        lines = [
+            _("{member}: {stage} in {time}").format(
+                member=ctx.guild.get_member(entry.member_id) or entry.member_id,
+                stage=stages[entry.stage],
+                time=chat.humanize_timedelta(seconds=max(1, int(entry.due - now))),
+            )
+            for entry in pending[:10]
+        ]
+        await ctx.send(
+            _("{count} members are waiting on a deadline:").format(count=len(pending))
+            + "\n"
+            + chat.box("\n".join(lines))
+        )
+
+    """
+    This is our listener for intros being posted
+    """
+    @commands.Cog.listener("on_message")
+    async def intro_posted(self, message: discord.Message):
+        if (
+                message.guild
+                and message.channel.id == self._channels.get(message.guild.id)
+                and not message.author.bot
+        ):
+            await self.index.add(message.guild.id, message.author.id, message.id)
+            await self.deadlines.cancel(message.guild.id, message.author.id)
+
+    """
+    These are our listeners for members who still have to post an intro
+    """
+    @commands.Cog.listener("on_member_join")
+    async def member_joined(self, member: discord.Member):
+        if (
+                member.bot
+                or member.guild.id not in self._channels
+                or self.index.has_intro(member.guild.id, member.id)
+        ):
+            return
+        deadline = self._next_deadline(member, await self.config.guild(member.guild).all())
+        if deadline is not None:
+            await self.deadlines.schedule(member.guild.id, member.id, *deadline)
+
+    @commands.Cog.listener("on_member_remove")
+    async def member_left(self, member: discord.Member):
+        await self.deadlines.cancel(member.guild.id, member.id)
+
+    """
+    These are our listeners for intros being deleted
+    """
+    @commands.Cog.listener("on_raw_message_delete")
+    async def intro_deleted(self, payload: discord.RawMessageDeleteEvent):
+        if payload.guild_id and payload.channel_id == self._channels.get(payload.guild_id):
+            without = await self.index.remove(payload.guild_id, [payload.message_id])
+            await self._schedule_first_deadlines(payload.guild_id, without)
+
+    @commands.Cog.listener("on_raw_bulk_message_delete")
+    async def intros_purged(self, payload: discord.RawBulkMessageDeleteEvent):
+        if payload.guild_id and payload.channel_id == self._channels.get(payload.guild_id):
+            without = await self.index.remove(payload.guild_id, list(payload.message_ids))
+            await self._schedule_first_deadlines(payload.guild_id, without)
@@ -0,0 +1,219 @@
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS intros (
+    message_id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    member_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS intros_member ON intros (guild_id, member_id, message_id);
+CREATE TABLE IF NOT EXISTS backfill (
+    channel_id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    after_id INTEGER NOT NULL,
+    scanned INTEGER NOT NULL,
+    done INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deadlines (
+    guild_id INTEGER NOT NULL,
+    member_id INTEGER NOT NULL,
+    due REAL NOT NULL,
+    stage INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, member_id)
+);
+"""
+
+
+class BackfillState:
+    """How far the history of an intro channel has been scanned"""
+
+    __slots__ = ("channel_id", "after_id", "scanned", "done")
+
+    def __init__(self, channel_id: int, after_id: int = 0, scanned: int = 0, done: bool = False):
+        self.channel_id = channel_id
+        self.after_id = after_id
+        self.scanned = scanned
+        self.done = done
+
+
+class IntroIndex:
+    """Every member's intro posts on disk, their first intro in memory
+
+    Posts are kept in SQLite so an intro deleted later can fall back to
+    the member's next one. The first intro of each member is held in a
+    dict per guild, so checking whether a member posted an intro never
+    touches the disk. All SQLite work runs on a single worker thread.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="intromanager")
+        self._db: Optional[sqlite3.Connection] = None
+        # guild id -> member id -> id of their first intro message
+        self._first: Dict[int, Dict[int, int]] = {}
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _open(self):
+        db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(SCHEMA)
+        self._db = db
+        return db.execute(
+            "SELECT guild_id, member_id, MIN(message_id) FROM intros GROUP BY guild_id, member_id"
+        ).fetchall()
+
+    async def open(self):
+        for guild_id, member_id, message_id in await self._run(self._open):
+            self._first.setdefault(guild_id, {})[member_id] = message_id
+
+    async def close(self):
+        if self._db is not None:
+            await self._run(self._db.close)
+            self._db = None
+        self._executor.shutdown(wait=False)
+
+    def first_intro(self, guild_id: int, member_id: int) -> Optional[int]:
+        """Id of the member's first intro message, None if they have not posted one"""
+        return self._first.get(guild_id, {}).get(member_id)
+
+    def has_intro(self, guild_id: int, member_id: int) -> bool:
+        return member_id in self._first.get(guild_id, {})
+
+    def count(self, guild_id: int) -> int:
+        """Number of members with an intro"""
+        return len(self._first.get(guild_id, {}))
+
+    def _remember(self, guild_id: int, member_id: int, message_id: int):
+        first = self._first.setdefault(guild_id, {})
+        if member_id not in first or message_id < first[member_id]:
+            first[member_id] = message_id
+
+    def _insert(self, guild_id: int, rows: List[Tuple[int, int]], state: BackfillState = None):
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT OR IGNORE INTO intros (message_id, guild_id, member_id) VALUES (?, ?, ?)",
+                [(message_id, guild_id, member_id) for message_id, member_id in rows],
+            )
+            if state is not None:
+                # the checkpoint is saved with the page, a restart never skips or repeats one
+                self._db.execute(
+                    "INSERT INTO backfill (channel_id, guild_id, after_id, scanned, done) "
+                    "VALUES (?, ?, ?, ?, ?) ON CONFLICT (channel_id) DO UPDATE "
+                    "SET after_id = excluded.after_id, scanned = excluded.scanned, "
+                    "done = excluded.done",
+                    (state.channel_id, guild_id, state.after_id, state.scanned, int(state.done)),
+                )
+
+    async def add(self, guild_id: int, member_id: int, message_id: int):
+        """Record an intro post"""
+        self._remember(guild_id, member_id, message_id)
+        await self._run(self._insert, guild_id, [(message_id, member_id)])
+
+    async def add_page(
+            self, guild_id: int, rows: Iterable[Tuple[int, int]], state: BackfillState
+    ):
+        """Record a page of (message id, member id) intro posts found by a backfill"""
+        rows = list(rows)
+        for message_id, member_id in rows:
+            self._remember(guild_id, member_id, message_id)
+        await self._run(self._insert, guild_id, rows, state)
+
+    def _delete(self, guild_id: int, message_ids: List[int]) -> Dict[int, Optional[int]]:
+        """Delete posts, returns member id -> their first remaining intro for affected members"""
+        members = set()
+        with self._db:
+            self._db.execute("BEGIN")
+            for message_id in message_ids:
+                row = self._db.execute(
+                    "SELECT member_id FROM intros WHERE message_id = ? AND guild_id = ?",
+                    (message_id, guild_id),
+                ).fetchone()
+                if row is not None:
+                    self._db.execute("DELETE FROM intros WHERE message_id = ?", (message_id,))
+                    members.add(row[0])
+        return {
+            member_id: self._db.execute(
+                "SELECT MIN(message_id) FROM intros WHERE guild_id = ? AND member_id = ?",
+                (guild_id, member_id),
+            ).fetchone()[0]
+            for member_id in members
+        }
+
+    async def remove(self, guild_id: int, message_ids: List[int]) -> List[int]:
+        """Forget deleted posts, returns members left without an intro"""
+        changed = await self._run(self._delete, guild_id, message_ids)
+        first = self._first.get(guild_id, {})
+        without = []
+        for member_id, message_id in changed.items():
+            if message_id is None:
+                first.pop(member_id, None)
+                without.append(member_id)
+            else:
+                first[member_id] = message_id
+        return without
+
+    def _backfill_state(self, channel_id: int) -> Optional[tuple]:
+        return self._db.execute(
+            "SELECT after_id, scanned, done FROM backfill WHERE channel_id = ?", (channel_id,)
+        ).fetchone()
+
+    async def backfill_state(self, channel_id: int) -> BackfillState:
+        row = await self._run(self._backfill_state, channel_id)
+        if row is None:
+            return BackfillState(channel_id)
+        return BackfillState(channel_id, row[0], row[1], bool(row[2]))
+
+    def _reset(self, guild_id: int):
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM intros WHERE guild_id = ?", (guild_id,))
+            self._db.execute("DELETE FROM backfill WHERE guild_id = ?", (guild_id,))
+
+    async def reset(self, guild_id: int):
+        """Forget a guild's intros and backfill progress, like when its channel changes"""
+        self._first.pop(guild_id, None)
+        await self._run(self._reset, guild_id)
+
+    def _delete_member(self, member_id: int):
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM intros WHERE member_id = ?", (member_id,))
+            self._db.execute("DELETE FROM deadlines WHERE member_id = ?", (member_id,))
+
+    async def delete_member(self, member_id: int):
+        for first in self._first.values():
+            first.pop(member_id, None)
+        await self._run(self._delete_member, member_id)
+
+    def _deadlines(self) -> List[tuple]:
+        return self._db.execute("SELECT guild_id, member_id, due, stage FROM deadlines").fetchall()
+
+    async def deadlines(self) -> List[Tuple[int, int, float, int]]:
+        """Every stored (guild id, member id, due time, stage) deadline"""
+        return await self._run(self._deadlines)
+
+    def _set_deadline(self, guild_id: int, member_id: int, due: float, stage: int):
+        self._db.execute(
+            "INSERT OR REPLACE INTO deadlines (guild_id, member_id, due, stage) "
+            "VALUES (?, ?, ?, ?)",
+            (guild_id, member_id, due, stage),
+        )
+
+    async def set_deadline(self, guild_id: int, member_id: int, due: float, stage: int):
+        await self._run(self._set_deadline, guild_id, member_id, due, int(stage))
+
+    def _delete_deadline(self, guild_id: int, member_id: int):
+        self._db.execute(
+            "DELETE FROM deadlines WHERE guild_id = ? AND member_id = ?", (guild_id, member_id)
+        )
+
+    async def delete_deadline(self, guild_id: int, member_id: int):
+        await self._run(self._delete_deadline, guild_id, member_id)
@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+import os
+import time
+import types
+
+from aiohttp import web
+
+from useractivitylog.attachments import AttachmentArchive
+
+PORT = 8765
+
+
+class _Attachment:
+    def __init__(self, attachment_id: int, file_id: int, size: int):
+        self.id = attachment_id
+        self.filename = f"image-{file_id}.png"
+        self.url = f"http://127.0.0.1:{PORT}/files/{file_id}"
+        self.size = size
+        self.content_type = "image/png"
+
+
+class _Message:
+    def __init__(self, message_id: int, attachments, author_id: int = 1):
+        self.id = message_id
+        self.author = types.SimpleNamespace(id=author_id)
+        self.attachments = attachments
+
+
+async def _serve(files) -> web.AppRunner:
+    async def handle(request):
+        file_id = int(request.match_info["file_id"])
+        return web.Response(body=files[file_id], content_type="image/png")
+
+    app = web.Application()
+    app.router.add_get("/files/{file_id}", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+    return runner
+
+
+def test_fetch_dedup_prune(tmp_path):
+    files = [os.urandom(4096), os.urandom(8192)]
+
+    async def run():
+        runner = await _serve(files)
+        archive = AttachmentArchive(tmp_path, workers=2, allowed_hosts=None)
+        await archive.start()
+        try:
+            archive.submit(_Message(1, [_Attachment(10, 0, 4096), _Attachment(11, 1, 8192)]))
+            archive.submit(_Message(2, [_Attachment(20, 0, 4096)]))
+            await archive.drain()
+
+            assert (archive.stored, archive.deduplicated, archive.failed) == (2, 1, 0)
+            first, second = sorted(archive.get(1), key=lambda a: a.attachment_id)
+            assert first.sha256 == hashlib.sha256(files[0]).hexdigest()
+            assert archive.get(2)[0].path == first.path
+            file = first.file()
+            try:
+                assert file.fp.read() == files[0]
+                assert file.filename == "image-0.png"
+            finally:
+                file.close()
+
+            # an upload still being written is neither counted nor pruned
+            in_flight = second.path.with_name(f".{second.path.name}.1.tmp")
+            in_flight.write_bytes(b"partial")
+            assert await archive.usage() == (2, 4096 + 8192)
+
+            old = time.time() - archive.max_age - 60
+            os.utime(first.path, (old, old))
+            os.utime(in_flight, (old, old))
+            assert await archive.prune() == 1
+            assert not first.path.exists() and in_flight.exists()
+            assert archive.get(2) == []
+            assert [a.attachment_id for a in archive.get(1)] == [11]
+        finally:
+            await archive.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_delete_author(tmp_path):
+    files = [os.urandom(4096), os.urandom(8192), os.urandom(1024)]
+
+    async def run():
+        runner = await _serve(files)
+        archive = AttachmentArchive(tmp_path, workers=2, allowed_hosts=None)
+        await archive.start()
+        try:
+            archive.submit(_Message(1, [_Attachment(10, 0, 4096), _Attachment(11, 1, 8192)], 5))
+            archive.submit(_Message(2, [_Attachment(20, 0, 4096)], 6))
+            await archive.drain()
+            shared, own = sorted(archive.get(1), key=lambda a: a.attachment_id)
+
+            # the file also posted by another user stays
+            assert await archive.delete_author(5) == 1
+            assert archive.get(1) == [] and not own.path.exists()
+            assert shared.path.exists() and archive.get(2)[0].path == shared.path
+
+            # a download queued before the deletion is not kept
+            archive.submit(_Message(3, [_Attachment(30, 2, 1024)], 5))
+            assert await archive.delete_author(5) == 0
+            await archive.drain()
+            assert archive.get(3) == [] and archive.stored == 3
+            assert await archive.usage() == (1, 4096)
+
+            archive.submit(_Message(4, [_Attachment(40, 2, 1024)], 5))
+            await archive.drain()
+            assert len(archive.get(4)) == 1
+        finally:
+            await archive.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
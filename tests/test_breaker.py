@@ -0,0 +1,92 @@
+import asyncio
+import time
+import types
+
+import discord
+
+from ukfurcore import BreakerState, CircuitBreaker, LogDispatcher, breaker_status
+
+
+class _Channel:
+    """Log channel where every send is forbidden"""
+
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.guild = types.SimpleNamespace(id=1)
+        self.sends = 0
+
+    async def send(self, **kwargs):
+        self.sends += 1
+        raise discord.Forbidden(types.SimpleNamespace(status=403, reason="Forbidden"), "")
+
+
+def _expire(breaker: CircuitBreaker):
+    breaker.retry_at = time.monotonic() - 1
+
+
+def test_opens_after_threshold():
+    breaker = CircuitBreaker(threshold=3, backoff=30)
+    breaker.failure("forbidden")
+    breaker.failure("forbidden")
+    assert breaker.state is BreakerState.CLOSED and breaker.allow()
+    breaker.failure("forbidden")
+    assert breaker.state is BreakerState.OPEN and breaker.blocked
+    assert not breaker.allow()
+    assert 29 < breaker.retry_in <= 30
+    assert "missing permissions" in breaker_status(breaker)
+
+
+def test_probe_backs_off_and_recovers():
+    breaker = CircuitBreaker(threshold=1, backoff=30, max_backoff=100)
+    breaker.failure("not_found")
+    _expire(breaker)
+    assert breaker.allow() and breaker.state is BreakerState.HALF_OPEN
+    breaker.failure("not_found")
+    assert breaker.state is BreakerState.OPEN and 59 < breaker.retry_in <= 60
+    breaker.retries = 5
+    _expire(breaker)
+    assert breaker.allow()
+    breaker.failure("not_found")
+    assert breaker.retry_in <= 100
+    _expire(breaker)
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state is BreakerState.CLOSED and breaker.retries == 0
+    assert breaker_status(breaker) == ""
+
+
+def test_allow_does_not_count_skips():
+    breaker = CircuitBreaker(threshold=1)
+    breaker.failure("forbidden")
+    for _ in range(5):
+        assert not breaker.allow()
+    assert breaker.skipped == 0
+
+
+def test_dispatcher_counts_skipped_items_once():
+    async def run():
+        channel = _Channel(10)
+        dispatcher = LogDispatcher(window=0, rate=1000, burst=1000)
+        for n in range(3):
+            dispatcher.enqueue(channel, discord.Embed(title=str(n)))
+            await asyncio.sleep(0.01)
+        breaker = dispatcher.breaker(channel.id)
+        assert channel.sends == 3 and breaker.blocked
+
+        # skipped when queued
+        dispatcher.enqueue(channel, discord.Embed(title="a"))
+        dispatcher.enqueue(channel, discord.Embed(title="b"))
+        assert dispatcher.skipped == breaker.skipped == 2
+
+        # skipped when the breaker opened while they were queued
+        dispatcher.window = 0.05
+        breaker.success()
+        for title in ("c", "d", "e"):
+            dispatcher.enqueue(channel, discord.Embed(title=title))
+        for _ in range(3):
+            breaker.failure("forbidden")
+        await asyncio.sleep(0.1)
+        assert channel.sends == 3
+        assert dispatcher.skipped == breaker.skipped == 5
+
+    asyncio.run(run())
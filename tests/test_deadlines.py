@@ -0,0 +1,152 @@
+import asyncio
+import random
+import time
+import types
+from datetime import datetime, timezone
+
+import discord
+
+from intromanager.deadlines import Deadline, DeadlineHeap, DeadlineScheduler, DeadlineStage
+from intromanager.introchannelmanager import IntroChannelManager
+from intromanager.introindex import IntroIndex
+
+
+def _check(heap: DeadlineHeap):
+    entries = list(heap)
+    for position, entry in enumerate(entries):
+        assert entry.position == position
+        assert heap.get(entry.key) is entry
+        if position:
+            assert entries[(position - 1) // 2].due <= entry.due
+
+
+def test_heap_keeps_positions():
+    rng = random.Random(1)
+    heap = DeadlineHeap()
+    due = {}
+    for _ in range(2000):
+        key = (rng.randint(1, 3), rng.randint(1, 50))
+        if rng.random() < 0.3:
+            removed = heap.remove(key)
+            assert (removed is None) == (key not in due)
+            assert removed is None or removed.position == -1
+            due.pop(key, None)
+        else:
+            due[key] = rng.random()
+            heap.push(Deadline(*key, due[key], DeadlineStage.REMIND))
+        _check(heap)
+        assert len(heap) == len(due)
+
+    popped = [heap.pop() for _ in range(len(heap))]
+    assert [entry.due for entry in popped] == sorted(due.values())
+    assert heap.peek() is None
+
+
+def test_push_replaces_the_member_deadline():
+    heap = DeadlineHeap(
+        Deadline(1, member_id, member_id, DeadlineStage.REMIND) for member_id in (5, 3, 9)
+    )
+    _check(heap)
+    assert heap.peek().member_id == 3
+    heap.push(Deadline(1, 3, 10, DeadlineStage.ENFORCE))
+    assert len(heap) == 3 and heap.get((1, 3)).stage is DeadlineStage.ENFORCE
+    assert [heap.pop().member_id for _ in range(3)] == [5, 9, 3]
+
+
+def test_scheduler_fires_due_deadlines(tmp_path):
+    async def run():
+        index = IntroIndex(tmp_path / "intros.sqlite3")
+        await index.open()
+        fired = []
+
+        async def callback(guild_id, member_id, stage):
+            fired.append((member_id, stage))
+            if stage is DeadlineStage.REMIND:
+                await scheduler.schedule(guild_id, member_id, time.time(), DeadlineStage.ENFORCE)
+
+        scheduler = DeadlineScheduler(index, callback)
+        await scheduler.open()
+        now = time.time()
+        await scheduler.schedule(1, 10, now + 0.05, DeadlineStage.REMIND)
+        await scheduler.schedule(1, 11, now + 0.02, DeadlineStage.ENFORCE)
+        await scheduler.schedule(1, 12, now + 0.03, DeadlineStage.ENFORCE)
+        await scheduler.schedule(1, 13, now + 60, DeadlineStage.ENFORCE)
+        assert await scheduler.cancel(1, 12)
+        assert not await scheduler.cancel(1, 12)
+        scheduler.start()
+        await asyncio.sleep(0.15)
+        assert fired == [
+            (11, DeadlineStage.ENFORCE),
+            (10, DeadlineStage.REMIND),
+            (10, DeadlineStage.ENFORCE),
+        ]
+        await scheduler.close()
+        await index.close()
+
+        # only the deadline that did not fire is left on disk
+        index = IntroIndex(tmp_path / "intros.sqlite3")
+        await index.open()
+        scheduler = DeadlineScheduler(index, callback)
+        await scheduler.open()
+        assert [entry.member_id for entry in scheduler.pending(1)] == [13]
+        await index.close()
+
+    asyncio.run(run())
+
+
+def test_deleted_intro_gives_the_member_a_deadline_again(tmp_path, config):
+    config.register_guild(
+        intro_channel=None,
+        reminder_hours=24,
+        reminder_message=None,
+        action=None,
+        action_days=0,
+        action_role=None,
+    )
+    joined_at = datetime.now(timezone.utc)
+    members = {
+        member_id: types.SimpleNamespace(id=member_id, bot=False, joined_at=joined_at)
+        for member_id in (10, 11)
+    }
+    guild = types.SimpleNamespace(id=1, get_member=members.get)
+
+    async def run():
+        cog = IntroChannelManager.__new__(IntroChannelManager)
+        cog.bot = types.SimpleNamespace(get_guild={1: guild}.get)
+        cog.config = config
+        cog.index = IntroIndex(tmp_path / "intros.sqlite3")
+        await cog.index.open()
+        cog.deadlines = DeadlineScheduler(cog.index, None)
+        cog._channels = {1: 100}
+        cog._backfills = {}
+        await cog.index.add(1, 10, 1000)
+        await cog.index.add(1, 11, 1001)
+        await cog.index.add(1, 11, 1002)
+
+        payload = discord.RawBulkMessageDeleteEvent(
+            {"ids": [1000, 1001], "channel_id": 100, "guild_id": 1}
+        )
+        await cog.intros_purged(payload)
+        # member 11 still has an intro
+        assert [entry.member_id for entry in cog.deadlines.pending(1)] == [10]
+        deadline = cog.deadlines.get(1, 10)
+        assert deadline.stage is DeadlineStage.REMIND
+        assert deadline.due == joined_at.timestamp() + 24 * 3600
+
+        await cog.intro_deleted(
+            discord.RawMessageDeleteEvent({"id": 1002, "channel_id": 100, "guild_id": 1})
+        )
+        assert {entry.member_id for entry in cog.deadlines.pending(1)} == {10, 11}
+
+        # deadlines counted against the old channel are dropped with it
+        ctx = types.SimpleNamespace(guild=guild, tick=_tick)
+        await IntroChannelManager.set_channel.callback(cog, ctx, None)
+        assert cog.deadlines.pending(1) == [] and await cog.index.deadlines() == []
+        assert await config.guild(guild).intro_channel() is None
+        await cog.index.close()
+
+    asyncio.run(run())
+
+
+async def _tick():
+    return True
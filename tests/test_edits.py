@@ -0,0 +1,123 @@
+import asyncio
+import random
+import types
+
+from useractivitylog.edits import DELETE, EQUAL, INSERT, EditDebouncer, render_diff, word_diff
+from useractivitylog.filters import CHAINS, FilterPipeline
+from useractivitylog.settings import GuildSettings
+
+WORDS = ["the", "quick", "brown", "fox", "jumps", "over", "lazy", "dog", "\n", "  "]
+
+
+def _sides(runs):
+    before = "".join(text for op, text in runs if op != INSERT)
+    after = "".join(text for op, text in runs if op != DELETE)
+    return before, after
+
+
+def _edits(runs):
+    return sum(len(text.split()) for op, text in runs if op != EQUAL)
+
+
+def test_round_trip():
+    rng = random.Random(1)
+    for _ in range(500):
+        before = " ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 40)))
+        tokens = before.split(" ")
+        for _ in range(rng.randint(0, 5)):
+            position = rng.randint(0, len(tokens))
+            if rng.random() < 0.5 and position < len(tokens):
+                del tokens[position]
+            else:
+                tokens.insert(position, rng.choice(WORDS))
+        after = " ".join(tokens)
+        runs = word_diff(before, after, budget=1)
+        assert runs is not None
+        assert _sides(runs) == (before, after)
+        assert all(runs[i][0] != runs[i + 1][0] for i in range(len(runs) - 1))
+
+
+def test_minimal_change():
+    runs = word_diff("the quick brown fox", "the slow brown fox")
+    assert runs == [(EQUAL, "the "), (DELETE, "quick"), (INSERT, "slow"), (EQUAL, " brown fox")]
+    assert word_diff("same text", "same text") == [(EQUAL, "same text")]
+    assert _edits(word_diff("a b c d e", "a c d e f")) == 2
+
+
+def test_gives_up():
+    before = " ".join(str(n) for n in range(300))
+    after = " ".join(str(n) for n in range(300, 600))
+    assert word_diff(before, after, max_edits=50) is None
+    assert word_diff("x " * 600, "y " * 600, max_tokens=1000) is None
+
+
+def test_render_diff():
+    runs = word_diff("the quick fox", "the slow fox ")
+    assert render_diff(runs, 2000) == "the ~~quick~~**slow** fox "
+    assert render_diff(word_diff("a *b*", "a c"), 2000) == "a ~~\\*b\\*~~**c**"
+    assert render_diff(runs, 5) is None
+
+
+def test_debouncer_coalesces():
+    async def run():
+        logged = []
+
+        async def log_edit(pending):
+            logged.append(pending)
+
+        debouncer = EditDebouncer(log_edit)
+        first = types.SimpleNamespace(id=1, content="a")
+        channel = object()
+        for content in ("b", "c", "d"):
+            after = types.SimpleNamespace(id=1, content=content)
+            assert debouncer.add(channel, first, after, 0.05)
+            await asyncio.sleep(0.01)
+        assert not debouncer.add(channel, first, types.SimpleNamespace(id=3, content="x"), 0)
+        await asyncio.sleep(0.1)
+        assert len(logged) == 1 and len(debouncer) == 0
+        pending = logged[0]
+        assert (pending.before.content, pending.after.content, pending.edits) == ("a", "d", 3)
+        assert debouncer.coalesced == 2
+
+        debouncer.add(channel, first, types.SimpleNamespace(id=2, content="e"), 10)
+        await debouncer.close()
+        assert len(logged) == 2 and logged[1].after.content == "e"
+
+    asyncio.run(run())
+
+
+def test_edit_removing_an_attachment_passes_the_filters():
+    async def cog_disabled_in_guild(cog, guild):
+        return False
+
+    async def is_command(message):
+        return False
+
+    cog = types.SimpleNamespace(
+        bot=types.SimpleNamespace(cog_disabled_in_guild=cog_disabled_in_guild),
+        command_detector=types.SimpleNamespace(is_command=is_command),
+    )
+    pipeline = FilterPipeline(cog, CHAINS)
+    settings = GuildSettings({"edit_channel": 10})
+    logchannel = types.SimpleNamespace(id=10, nsfw=False)
+
+    def message(content, attachments):
+        return types.SimpleNamespace(
+            id=1,
+            guild=types.SimpleNamespace(id=1),
+            channel=types.SimpleNamespace(id=20, nsfw=False, category_id=None),
+            author=types.SimpleNamespace(id=30, bot=False, _roles=[]),
+            content=content,
+            attachments=[types.SimpleNamespace(id=n) for n in attachments],
+        )
+
+    async def check(before, after):
+        return await pipeline.check("edit", 1, settings, logchannel, before, after)
+
+    async def run():
+        assert not await check(message("text", [1, 2]), message("text", [1, 2]))
+        assert await check(message("text", [1, 2]), message("text", [2]))
+        assert await check(message("text", []), message("new text", []))
+        assert pipeline.rejected[("edit", "unchanged")] == 1 and pipeline.passed["edit"] == 2
+
+    asyncio.run(run())
@@ -0,0 +1,18 @@
+from pathlib import Path
+
+from redbot.core.utils import chat_formatting as chat
+
+import userroleannouncer.userroleannouncer as announcer
+from ukfurcore import StringTable
+
+
+def test_announcer_strings_are_translated():
+    table = StringTable(
+        Path(announcer.__file__).parent / "locales", announcer.announcement_strings
+    )
+    assert table.get("en-US").user_boosted == "User Boosted"
+    russian = table.get("ru-RU")
+    assert russian.user_boosted == "Пользователь забустил"
+    assert russian.boosted_description == chat.inline("Пользователь забустил сервер")
+    # locales without translations fall back to the untranslated strings
+    assert table.get("de-DE").user_boosted == "User Boosted"
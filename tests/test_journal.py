@@ -0,0 +1,120 @@
+import asyncio
+
+from ukfurcore import OutboxJournal
+
+
+def _embed(n: int) -> dict:
+    return {"title": f"entry {n}", "description": "x" * 100}
+
+
+def _journal(path, **kwargs) -> OutboxJournal:
+    # syncs are driven by the tests
+    return OutboxJournal(path, sync_interval=3600, **kwargs)
+
+
+async def _reopen(path):
+    journal = _journal(path)
+    entries = await journal.open()
+    await journal.close()
+    return entries
+
+
+def test_replays_unacknowledged_entries_in_order(tmp_path):
+    async def run():
+        journal = _journal(tmp_path)
+        assert await journal.open() == []
+        seqs = [journal.append(f"event:{n}", 10, 1, _embed(n)) for n in range(5)]
+        assert seqs == [1, 2, 3, 4, 5]
+        # acknowledged out of order, only 1 and 2 can move the watermark
+        for seq in (2, 4, 1):
+            journal.ack(seq)
+        assert journal.pending == 2
+        await journal.sync()
+        assert journal.syncs == 1
+        await journal.close()
+
+        journal = _journal(tmp_path)
+        entries = await journal.open()
+        assert [entry.seq for entry in entries] == [3, 5]
+        assert entries[0].embed == _embed(2) and entries[0].channel_id == 10
+        assert journal.seen("event:0") and journal.duplicates == 1
+        assert not journal.seen("event:9")
+        assert journal.append("event:5", 10, 1, _embed(5)) == 6
+        await journal.close()
+
+    asyncio.run(run())
+
+
+def test_torn_write_is_dropped(tmp_path):
+    async def run():
+        journal = _journal(tmp_path)
+        await journal.open()
+        journal.append("event:1", 10, 1, _embed(1))
+        journal.append("event:2", 10, 1, _embed(2))
+        await journal.close()
+        segment = next(tmp_path.glob("segment-*.ndjson"))
+        with segment.open("ab") as file:
+            file.write(b'{"seq": 3, "id": "event:3", "chan')
+
+        journal = _journal(tmp_path)
+        entries = await journal.open()
+        assert [entry.seq for entry in entries] == [1, 2]
+        await journal.close()
+
+    asyncio.run(run())
+
+
+def test_rotates_and_compacts_segments(tmp_path):
+    async def run():
+        journal = _journal(tmp_path, segment_bytes=1000)
+        await journal.open()
+        for n in range(40):
+            journal.append(f"event:{n}", 10, 1, _embed(n))
+        await journal.sync()
+        assert len(journal) > 5
+        assert journal.size == sum(path.stat().st_size for path in tmp_path.glob("segment-*"))
+
+        for seq in range(1, 41):
+            journal.ack(seq)
+        await journal.sync()
+        # the newest delivered segments stay to catch duplicates
+        assert len(journal) == 2 and journal.compacted > 0
+        assert len(list(tmp_path.glob("segment-*"))) == 2
+        assert journal.size == sum(path.stat().st_size for path in tmp_path.glob("segment-*"))
+        assert journal.pending == 0
+        await journal.close()
+
+        journal = _journal(tmp_path, segment_bytes=1000)
+        assert await journal.open() == []
+        assert journal.seen("event:39")
+        assert journal.append("event:40", 10, 1, _embed(40)) == 41
+        await journal.close()
+
+    asyncio.run(run())
+
+
+def test_full_journal_refuses_entries(tmp_path):
+    async def run():
+        journal = _journal(tmp_path, max_bytes=500)
+        await journal.open()
+        assert journal.append("event:1", 10, 1, _embed(1)) == 1
+        assert journal.append("event:2", 10, 1, _embed(2)) == 2
+        assert journal.append("event:3", 10, 1, _embed(3)) is None
+        assert journal.full == 1
+        await journal.close()
+
+    asyncio.run(run())
+
+
+def test_sync_loop_batches_appends(tmp_path):
+    async def run():
+        journal = OutboxJournal(tmp_path, sync_interval=0.02)
+        await journal.open()
+        for n in range(20):
+            journal.append(f"event:{n}", 10, 1, _embed(n))
+        await asyncio.sleep(0.05)
+        assert journal.syncs == 1
+        await journal.close()
+        assert len(await _reopen(tmp_path)) == 20
+
+    asyncio.run(run())
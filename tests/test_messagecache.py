@@ -0,0 +1,26 @@
+import types
+
+from useractivitylog.messagecache import MessageStore
+
+
+def _message(message_id: int, guild_id: int, author_id: int, content: str = "hello"):
+    return types.SimpleNamespace(
+        id=message_id,
+        guild=types.SimpleNamespace(id=guild_id),
+        channel=types.SimpleNamespace(id=guild_id * 10),
+        author=types.SimpleNamespace(id=author_id),
+        content=content,
+        attachments=[],
+    )
+
+
+def test_delete_author_removes_records_in_every_guild():
+    store = MessageStore()
+    for message_id, guild_id, author_id in [(1, 1, 5), (2, 1, 6), (3, 2, 5), (4, 2, 6)]:
+        store.add(_message(message_id, guild_id, author_id))
+    size = store.size
+    assert store.delete_author(5) == 2
+    assert store.get(1, 1) is None and store.get(2, 3) is None
+    assert store.get(1, 2).author_id == 6 and len(store) == 2
+    assert store.size == size // 2
+    assert store.delete_author(5) == 0
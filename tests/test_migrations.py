@@ -0,0 +1,32 @@
+import asyncio
+
+from useractivitylog.migrations import LATEST_VERSION, migrate
+from useractivitylog.settings import DEFAULT_GUILD
+
+
+def test_split_channel_writes_only_changed_keys(config):
+    config.register_global(config_version=None, migration_guild=None)
+    config.register_guild(**DEFAULT_GUILD)
+
+    async def run():
+        await config.guild_from_id(1).set_raw("channel", value=123)
+        await config.guild_from_id(2).set_raw("editing", value=False)
+        all_guilds = await migrate(config, await config.all_guilds())
+
+        stored = await config.driver.get(config.guild_from_id(1).identifier_data)
+        assert stored == {
+            "delete_channel": 123,
+            "edit_channel": 123,
+            "bulk_delete_channel": 123,
+            "join_channel": 123,
+            "leave_channel": 123,
+        }
+        assert "channel" not in all_guilds[1]
+        assert all_guilds[1]["join_channel"] == 123
+        assert all_guilds[1]["archive_days"] == DEFAULT_GUILD["archive_days"]
+        stored = await config.driver.get(config.guild_from_id(2).identifier_data)
+        assert stored == {"editing": False}
+        assert await config.config_version() == LATEST_VERSION
+        assert await config.migration_guild() is None
+
+    asyncio.run(run())
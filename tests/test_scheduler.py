@@ -0,0 +1,126 @@
+import asyncio
+import types
+
+import discord
+
+from ukfurcore import FairScheduler, LogDispatcher, OutboxJournal
+
+HOT, QUIET = 1 << 22, 2 << 22
+
+
+class _Channel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.guild = types.SimpleNamespace(id=1)
+        self.sent = []
+
+    async def send(self, embed=None, embeds=None, **kwargs):
+        self.sent.extend(embeds or [embed])
+
+
+async def _send(scheduler, guild_id, order, cost=1, hold=0.0):
+    async with scheduler.slot(guild_id, cost):
+        order.append(guild_id)
+        await asyncio.sleep(hold)
+
+
+def test_quiet_guild_is_not_starved():
+    async def run():
+        scheduler = FairScheduler(concurrency=1)
+        order = []
+        hot = [asyncio.create_task(_send(scheduler, HOT, order)) for _ in range(50)]
+        await asyncio.sleep(0)
+        quiet = [asyncio.create_task(_send(scheduler, QUIET, order)) for _ in range(3)]
+        await asyncio.gather(*hot, *quiet)
+        assert len(order) == 53
+        # the quiet guild alternates with the hot one instead of waiting behind it
+        positions = [n for n, guild_id in enumerate(order) if guild_id == QUIET]
+        assert positions[-1] < 8
+        assert [b - a for a, b in zip(positions, positions[1:])] == [2, 2]
+        assert scheduler.guilds() == [] and scheduler.shards() == {0: (0, 0)}
+
+    asyncio.run(run())
+
+
+def test_uploads_cost_more():
+    async def run():
+        scheduler = FairScheduler(concurrency=1)
+        order = []
+        blocker = asyncio.create_task(_send(scheduler, 3 << 22, order, hold=0.01))
+        await asyncio.sleep(0)
+        tasks = [asyncio.create_task(_send(scheduler, HOT, order, cost=2)) for _ in range(5)]
+        tasks += [asyncio.create_task(_send(scheduler, QUIET, order)) for _ in range(10)]
+        await asyncio.gather(blocker, *tasks)
+        # while both wait, two messages of the quiet guild go out for every upload
+        window = order[1:13]
+        assert window.count(QUIET) == 2 * window.count(HOT)
+
+    asyncio.run(run())
+
+
+def test_per_guild_limit_and_shards():
+    async def run():
+        scheduler = FairScheduler(concurrency=2, per_guild=1, shard_count=lambda: 2)
+        busy = {}
+        peak = {}
+
+        async def send(guild_id):
+            async with scheduler.slot(guild_id):
+                busy[guild_id] = busy.get(guild_id, 0) + 1
+                peak[guild_id] = max(peak.get(guild_id, 0), busy[guild_id])
+                await asyncio.sleep(0.001)
+                busy[guild_id] -= 1
+
+        # guilds 0 and 2 are on shard 0, guild 1 on shard 1
+        guilds = [0, 1 << 22, 2 << 22]
+        await asyncio.gather(*(send(guild_id) for guild_id in guilds for _ in range(10)))
+        assert all(peak[guild_id] == 1 for guild_id in guilds)
+        assert scheduler.shards() == {0: (0, 0), 1: (0, 0)}
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiters_release_everything():
+    async def run():
+        scheduler = FairScheduler(concurrency=1)
+        order = []
+        holder = asyncio.create_task(_send(scheduler, HOT, order, hold=0.02))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(_send(scheduler, QUIET, order)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert scheduler.shards() == {0: (1, 1)}
+        for task in waiters:
+            task.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await holder
+        assert order == [HOT]
+        await _send(scheduler, QUIET, order)
+        assert order == [HOT, QUIET]
+        assert scheduler.guilds() == [] and scheduler.shards() == {0: (0, 0)}
+
+    asyncio.run(run())
+
+
+def test_dispatcher_survives_a_failing_send(tmp_path):
+    async def run():
+        bot = types.SimpleNamespace()
+        scheduler = FairScheduler(shard_count=lambda: bot.shard_count)
+        journal = OutboxJournal(tmp_path, sync_interval=3600)
+        await journal.open()
+        dispatcher = LogDispatcher(
+            window=0, rate=1000, burst=1000, scheduler=scheduler, journal=journal
+        )
+        dispatcher.held = False
+        channel = _Channel(10)
+        dispatcher.enqueue(channel, discord.Embed(title="a"))
+        await dispatcher.flush()
+        # the batch is counted as failed and acknowledged, the queue still drains
+        assert channel.sent == [] and dispatcher.failed == 1 and journal.pending == 0
+        bot.shard_count = 1
+        dispatcher.enqueue(channel, discord.Embed(title="b"))
+        await dispatcher.flush()
+        assert [embed.title for embed in channel.sent] == ["b"]
+        assert dispatcher.failed == 1 and journal.pending == 0
+        await journal.close()
+
+    asyncio.run(run())
@@ -0,0 +1,27 @@
+import asyncio
+import types
+
+from useractivitylog.settings import DEFAULT_GUILD, SettingsCache
+from useractivitylog.useractivitylog import UserActivityLog
+
+
+def test_save_id_sets_writes_only_changed_keys(config):
+    config.register_guild(**DEFAULT_GUILD)
+    cog = types.SimpleNamespace(config=config, settings=SettingsCache())
+    guild = types.SimpleNamespace(id=1)
+
+    async def run():
+        await UserActivityLog._save_id_sets(
+            cog, guild, ignored_users={3, 2}, ignored_channels=set(), ignored_roles={5}
+        )
+        stored = await config.driver.get(config.guild(guild).identifier_data)
+        assert stored == {"ignored_users": [2, 3], "ignored_roles": [5]}
+        settings = cog.settings.get(guild.id)
+        assert settings.ignored_users == {2, 3} and settings.ignored_roles == {5}
+
+        await UserActivityLog._save_id_sets(cog, guild, ignored_users={2}, ignored_roles={5})
+        stored = await config.driver.get(config.guild(guild).identifier_data)
+        assert stored == {"ignored_users": [2], "ignored_roles": [5]}
+        assert cog.settings.get(guild.id).ignored_users == {2}
+
+    asyncio.run(run())
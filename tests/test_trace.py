@@ -0,0 +1,22 @@
+from useractivitylog.trace import SNOWFLAKE_LOW_BITS, Sanitizer
+
+
+def test_sanitized_ids_keep_order_but_not_account_age():
+    sanitizer = Sanitizer(b"salt")
+    other = Sanitizer(b"other salt")
+    messages = [(n << 22) | 0x1234 for n in range(1 << 30, (1 << 30) + 1000, 7)]
+    sanitized = sanitizer.ids(messages)
+    assert [n & ~SNOWFLAKE_LOW_BITS for n in sanitized] == [
+        n & ~SNOWFLAKE_LOW_BITS for n in messages
+    ]
+    assert sanitized != messages and sanitizer.ids(messages) == sanitized
+    assert sanitizer.id(None) is None
+
+    user_id = 80351110224678912
+    hashed = sanitizer.user_id(user_id)
+    assert hashed == sanitizer.user_id(user_id) != other.user_id(user_id)
+    assert 0 < hashed < 1 << 63
+    assert hashed >> 22 != user_id >> 22
+    # neighbouring accounts do not end up next to each other
+    created = sanitizer.user_ids(range(user_id, user_id + 50))
+    assert created != sorted(created)
@@ -0,0 +1,40 @@
+from .breaker import BreakerState, CircuitBreaker, breaker_status
+from .dispatcher import LogDispatcher, OverflowPolicy, Priority
+from .i18n import GuildLocales, StringTable, shared_locales
+from .journal import JournalEntry, OutboxJournal
+from .members import BOOST_KINDS, MemberEvent, MemberEventKind, diff_member
+from .metrics import MetricsExporter, MetricsRegistry, timed
+from .ratelimit import TokenBucket
+from .router import EventRouter, MemberUpdate, shared_router
+from .scheduler import FairScheduler, GuildShare, shared_scheduler
+from .webhooks import WebhookPool, shared_webhooks
+
+__all__ = [
+    "BOOST_KINDS",
+    "BreakerState",
+    "CircuitBreaker",
+    "EventRouter",
+    "FairScheduler",
+    "GuildLocales",
+    "GuildShare",
+    "JournalEntry",
+    "LogDispatcher",
+    "MemberEvent",
+    "MemberEventKind",
+    "MemberUpdate",
+    "MetricsExporter",
+    "MetricsRegistry",
+    "OutboxJournal",
+    "OverflowPolicy",
+    "Priority",
+    "StringTable",
+    "TokenBucket",
+    "WebhookPool",
+    "breaker_status",
+    "diff_member",
+    "shared_locales",
+    "shared_router",
+    "shared_scheduler",
+    "shared_webhooks",
+    "timed",
+]
@@ -0,0 +1,117 @@
+import time
+from enum import Enum
+from typing import Optional
+
+from redbot.core.i18n import Translator
+from redbot.core.utils import chat_formatting as chat
+
+_ = Translator("UkfurCore", __file__)
+
+# consecutive failures before a destination is skipped
+DEFAULT_THRESHOLD = 3
+# seconds before the first retry, doubled after every failed retry
+DEFAULT_BACKOFF = 30.0
+DEFAULT_MAX_BACKOFF = 3600.0
+
+
+class BreakerState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Stops sending to a destination that keeps failing
+
+    After `threshold` failures in a row the breaker opens and sends are
+    skipped without any request. Once the backoff has passed a single send
+    is let through as a probe, success closes the breaker again, failure
+    doubles the backoff up to `max_backoff`.
+
+    `skipped` counts the items the caller dropped while the breaker was open.
+    """
+
+    __slots__ = (
+        "threshold",
+        "backoff",
+        "max_backoff",
+        "state",
+        "failures",
+        "retries",
+        "retry_at",
+        "last_error",
+        "skipped",
+    )
+
+    def __init__(
+            self,
+            threshold: int = DEFAULT_THRESHOLD,
+            backoff: float = DEFAULT_BACKOFF,
+            max_backoff: float = DEFAULT_MAX_BACKOFF,
+    ):
+        self.threshold = threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.retries = 0
+        self.retry_at = 0.0
+        self.last_error: Optional[str] = None
+        self.skipped = 0
+
+    @property
+    def retry_in(self) -> float:
+        return max(0.0, self.retry_at - time.monotonic())
+
+    @property
+    def blocked(self) -> bool:
+        """Whether sends are being skipped right now"""
+        return self.state is not BreakerState.CLOSED and time.monotonic() < self.retry_at
+
+    def _delay(self) -> float:
+        return min(self.max_backoff, self.backoff * 2 ** self.retries)
+
+    def allow(self) -> bool:
+        """Whether a send may be attempted now, the first one after the backoff is the probe"""
+        if self.state is BreakerState.CLOSED:
+            return True
+        now = time.monotonic()
+        if now >= self.retry_at:
+            # a probe that never reported back does not keep the breaker half open
+            self.state = BreakerState.HALF_OPEN
+            self.retry_at = now + self._delay()
+            return True
+        return False
+
+    def success(self):
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.retries = 0
+        self.last_error = None
+
+    def failure(self, error: str):
+        self.failures += 1
+        self.last_error = error
+        if self.state is BreakerState.HALF_OPEN:
+            self.retries += 1
+        elif self.failures < self.threshold:
+            return
+        self.state = BreakerState.OPEN
+        self.retry_at = time.monotonic() + self._delay()
+
+
+def breaker_status(breaker: Optional[CircuitBreaker]) -> str:
+    """Note for channel settings when sends to a channel are being skipped"""
+    if breaker is None or breaker.state is BreakerState.CLOSED:
+        return ""
+    reason = {
+        "forbidden": _("missing permissions"),
+        "not_found": _("channel not found"),
+    }.get(breaker.last_error, breaker.last_error)
+    if not breaker.blocked:
+        return " " + _("(failing: {reason}, retrying now)").format(reason=reason)
+    return " " + _("(paused: {reason}, {skipped} skipped, retrying in {retry})").format(
+        reason=reason,
+        skipped=breaker.skipped,
+        retry=chat.humanize_timedelta(seconds=max(1, int(breaker.retry_in))),
+    )
@@ -0,0 +1,483 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import Counter, deque
+from enum import Enum, IntEnum
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+import discord
+
+from .breaker import CircuitBreaker
+from .journal import JournalEntry, OutboxJournal
+from .metrics import MetricsRegistry
+from .ratelimit import TokenBucket
+from .scheduler import FairScheduler
+from .webhooks import WebhookPool
+
+log = logging.getLogger("red.ukfur-cogs.ukfurcore.dispatcher")
+
+# Discord limits for a single message
+MAX_EMBEDS = 10
+MAX_EMBEDS_LENGTH = 6000
+
+# Discord allows 5 messages per 5 seconds in a channel
+DEFAULT_RATE = 1.0
+DEFAULT_BURST = 5
+DEFAULT_QUEUE_SIZE = 500
+# sends of a batch failing with a server error or rate limit before it is given up
+MAX_ATTEMPTS = 3
+
+
+class Priority(IntEnum):
+    """How important a log entry is, lower priorities are dropped first"""
+
+    LOW = 0
+    NORMAL = 1
+    HIGH = 2
+
+
+class OverflowPolicy(Enum):
+    """What to do when a destination queue is full"""
+
+    DROP_OLDEST = "oldest"
+    DROP_LOWEST = "priority"
+    SUMMARIZE = "summarize"
+
+
+async def send_embeds(channel: discord.TextChannel, embeds: List[discord.Embed], file=None):
+    """Send up to 10 embeds in a single message
+
+    discord.py 1.x only accepts one embed in `send`, so multiple embeds
+    are posted directly to the create message endpoint.
+    """
+    if len(embeds) == 1 or file is not None:
+        return await channel.send(embed=embeds[0] if embeds else None, file=file)
+    route = discord.http.Route(
+        "POST", "/channels/{channel_id}/messages", channel_id=channel.id
+    )
+    return await channel._state.http.request(
+        route, json={"embeds": [embed.to_dict() for embed in embeds]}
+    )
+
+
+class _Item:
+    __slots__ = ("embed", "file", "priority", "queued_at", "seq", "attempts")
+
+    def __init__(
+            self,
+            embed: Optional[discord.Embed],
+            file: Optional[discord.File],
+            priority: Priority,
+    ):
+        self.embed = embed
+        self.file = file
+        self.priority = priority
+        self.queued_at = time.monotonic()
+        # position in the journal, None if not journaled
+        self.seq: Optional[int] = None
+        self.attempts = 0
+
+
+class _ChannelQueue:
+    __slots__ = ("channel", "items", "task", "wake", "bucket", "dropped", "breaker")
+
+    def __init__(self, channel: discord.TextChannel, bucket: TokenBucket):
+        self.channel = channel
+        self.items: Deque[_Item] = deque()
+        self.task: Optional[asyncio.Task] = None
+        self.wake = asyncio.Event()
+        self.bucket = bucket
+        # titles of entries dropped since the last summary
+        self.dropped = Counter()
+        self.breaker = CircuitBreaker()
+
+
+class LogDispatcher:
+    """Coalesces log embeds per channel and sends them in batches
+
+    Embeds queued for the same channel within `window` seconds of the first
+    one are packed into as few messages as possible, keeping their order.
+    Each channel has at most one sender task, so messages are never reordered,
+    and a token bucket keeps that task below the channel's rate limit.
+
+    Queues are bounded, when a channel's queue is full the overflow policy
+    decides what is dropped. `enqueue` never waits, so listeners return
+    immediately no matter how far behind delivery is.
+
+    With a `scheduler`, every message waits for its guild's turn, so channels
+    of a busy guild cannot take the sends of all other guilds. With an open
+    `webhooks` pool, messages are posted through each channel's webhook,
+    falling back to the bot's own send where there is none.
+
+    A channel where sends keep failing as forbidden or not found is skipped
+    by its circuit breaker, entries for it are discarded without a request
+    until a retry after the breaker's backoff succeeds.
+
+    With a `journal`, embeds are also written to disk until they are done
+    with, so whatever was still queued is sent after a restart. Sending
+    waits for `restore` in that case, keeping restored entries ahead of new
+    ones. Embeds of an event id seen before are dropped as duplicates.
+    """
+
+    def __init__(
+            self,
+            window: float = 1.0,
+            *,
+            max_queue: int = DEFAULT_QUEUE_SIZE,
+            policy: OverflowPolicy = OverflowPolicy.DROP_LOWEST,
+            rate: float = DEFAULT_RATE,
+            burst: int = DEFAULT_BURST,
+            summary_factory: Callable[[Counter], discord.Embed] = None,
+            metrics: MetricsRegistry = None,
+            scheduler: FairScheduler = None,
+            webhooks: WebhookPool = None,
+            journal: OutboxJournal = None,
+    ):
+        self.window = window
+        self.max_queue = max_queue
+        self.policy = policy
+        self.rate = rate
+        self.burst = burst
+        self.summary_factory = summary_factory
+        self.metrics = metrics
+        self.scheduler = scheduler
+        self.webhooks = webhooks
+        self.journal = journal
+        # senders wait until journaled entries are restored
+        self.held = journal is not None
+        self._queues: Dict[int, _ChannelQueue] = {}
+        self._closed = False
+        self.batch_sizes = Counter()
+        self.sent_messages = 0
+        self.sent_embeds = 0
+        self.failed = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.max_depth = 0
+
+    @property
+    def depth(self) -> int:
+        """Number of embeds waiting to be sent over all channels"""
+        return sum(len(queue.items) for queue in self._queues.values())
+
+    def channel_depths(self) -> Dict[int, int]:
+        """Number of embeds waiting per channel id"""
+        return {
+            channel_id: len(queue.items)
+            for channel_id, queue in self._queues.items()
+            if queue.items
+        }
+
+    def breaker(self, channel_id: int) -> Optional[CircuitBreaker]:
+        """The channel's circuit breaker, None if nothing was sent to it yet"""
+        queue = self._queues.get(channel_id)
+        return queue.breaker if queue is not None else None
+
+    def guild_backlog(self) -> Dict[int, Tuple[int, float]]:
+        """Guild id -> (embeds waiting, seconds the oldest has waited)"""
+        now = time.monotonic()
+        backlog = {}
+        for queue in self._queues.values():
+            if not queue.items:
+                continue
+            guild_id = queue.channel.guild.id
+            depth, oldest = backlog.get(guild_id, (0, 0.0))
+            backlog[guild_id] = (
+                depth + len(queue.items),
+                max(oldest, now - queue.items[0].queued_at),
+            )
+        return backlog
+
+    def _queue(self, channel: discord.TextChannel) -> _ChannelQueue:
+        queue = self._queues.get(channel.id)
+        if queue is None:
+            queue = self._queues[channel.id] = _ChannelQueue(
+                channel, TokenBucket(self.rate, self.burst)
+            )
+        queue.channel = channel
+        return queue
+
+    def enqueue(
+            self,
+            channel: discord.TextChannel,
+            embed: Optional[discord.Embed] = None,
+            file: Optional[discord.File] = None,
+            priority: Priority = Priority.NORMAL,
+            event_id: str = None,
+    ):
+        """Queue an embed for a log channel without waiting for it to be sent
+
+        `event_id` identifies the event logged, defaulting to a hash of the
+        channel and embed, it is only used with a journal.
+        """
+        queue = self._queue(channel)
+        if queue.breaker.blocked:
+            self._skip(queue, 1)
+            return
+        item = _Item(embed, file, priority)
+        # files are not journaled, after a restart the embed is sent without its file
+        if self.journal is not None and embed is not None:
+            data = embed.to_dict()
+            if event_id is None:
+                event_id = _event_id(channel.id, data)
+            if self.journal.seen(event_id):
+                return
+            item.seq = self.journal.append(event_id, channel.id, int(priority), data)
+        if len(queue.items) >= self.max_queue and not self._make_room(queue, priority):
+            self._drop(queue, item)
+        else:
+            queue.items.append(item)
+        if len(queue.items) > self.max_depth:
+            self.max_depth = len(queue.items)
+        self._wake(queue)
+
+    def _wake(self, queue: _ChannelQueue):
+        if self.held:
+            return
+        if queue.task is None:
+            queue.wake.clear()
+            queue.task = asyncio.create_task(self._drain(queue))
+        elif self._closed or len(queue.items) >= MAX_EMBEDS:
+            # a full batch is ready, no need to wait for the window to pass
+            queue.wake.set()
+
+    def _make_room(self, queue: _ChannelQueue, priority: Priority) -> bool:
+        """Drop a queued item according to the policy
+
+        Returns False if the incoming item is the one that should be dropped.
+        """
+        if self.policy is OverflowPolicy.DROP_LOWEST:
+            lowest = min(queue.items, key=lambda item: item.priority)
+            if lowest.priority > priority:
+                return False
+            # the oldest entry of the lowest priority goes first
+            queue.items.remove(lowest)
+            self._drop(queue, lowest)
+        else:
+            self._drop(queue, queue.items.popleft())
+        return True
+
+    def restore(
+            self,
+            entries: Iterable[JournalEntry],
+            get_channel: Callable[[int], Optional[discord.TextChannel]],
+    ):
+        """Queue journaled entries ahead of anything queued since, then start sending"""
+        restored: Dict[int, List[_Item]] = {}
+        for entry in entries:
+            channel = get_channel(entry.channel_id)
+            if channel is None:
+                # the channel is gone, there is nowhere to deliver it
+                self.journal.ack(entry.seq)
+                continue
+            item = _Item(discord.Embed.from_dict(entry.embed), None, Priority(entry.priority))
+            item.seq = entry.seq
+            restored.setdefault(channel.id, []).append(item)
+            self._queue(channel)
+        for channel_id, items in restored.items():
+            self._queues[channel_id].items.extendleft(reversed(items))
+        self.held = False
+        for queue in self._queues.values():
+            if queue.items:
+                self._wake(queue)
+
+    def _done(self, items: Iterable[_Item]):
+        if self.journal is None:
+            return
+        for item in items:
+            if item.seq is not None:
+                self.journal.ack(item.seq)
+
+    def _drop(self, queue: _ChannelQueue, item: _Item):
+        self.dropped += 1
+        self._done((item,))
+        if self.policy is OverflowPolicy.SUMMARIZE:
+            queue.dropped[item.embed.title if item.embed else None] += 1
+
+    async def flush(self):
+        """Send everything that is queued now and wait for it to be delivered"""
+        tasks = []
+        for queue in self._queues.values():
+            if queue.task is not None:
+                queue.wake.set()
+                tasks.append(queue.task)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def close(self):
+        """Flush all queues, later embeds are sent without waiting for the window"""
+        self._closed = True
+        await self.flush()
+
+    def _skip(self, queue: _ChannelQueue, count: int):
+        """Count items not sent to a channel whose breaker is open"""
+        queue.breaker.skipped += count
+        self.skipped += count
+
+    async def _drain(self, queue: _ChannelQueue):
+        try:
+            if self.window and not self._closed:
+                try:
+                    await asyncio.wait_for(queue.wake.wait(), timeout=self.window)
+                except asyncio.TimeoutError:
+                    pass
+            while queue.items or queue.dropped:
+                if not queue.breaker.allow():
+                    # queued before the breaker opened, nothing can be delivered
+                    self._skip(queue, len(queue.items))
+                    self._done(queue.items)
+                    queue.items.clear()
+                    queue.dropped.clear()
+                    break
+                delay = queue.bucket.reserve()
+                if delay:
+                    await asyncio.sleep(delay)
+                summary = self._take_summary(queue)
+                if summary is None:
+                    batch = self._take_batch(queue.items)
+                else:
+                    batch = self._take_batch(
+                        queue.items, MAX_EMBEDS - 1, MAX_EMBEDS_LENGTH - len(summary)
+                    )
+                try:
+                    outcome = await self._send(queue, batch, summary)
+                except Exception:
+                    # the batch is lost, the queue keeps draining
+                    self.failed += 1
+                    log.exception(
+                        "Unable to send %s log embeds to %s", len(batch), queue.channel.id
+                    )
+                    outcome = "error"
+                if outcome == "http_error" and self._retry(queue, batch):
+                    await asyncio.sleep(2 ** batch[0].attempts)
+                else:
+                    self._done(batch)
+        finally:
+            queue.task = None
+
+    async def _send(
+            self,
+            queue: _ChannelQueue,
+            batch: List[_Item],
+            summary: Optional[discord.Embed],
+    ):
+        if self.scheduler is None:
+            return await self._send_batch(queue, batch, summary)
+        # requests are what is shared, uploads take longer than embeds
+        cost = 2 if batch and batch[0].file is not None else 1
+        waiting = time.perf_counter()
+        async with self.scheduler.slot(queue.channel.guild.id, cost):
+            if self.metrics is not None:
+                self.metrics.observe("slot_wait_seconds", time.perf_counter() - waiting)
+            return await self._send_batch(queue, batch, summary)
+
+    @staticmethod
+    def _retry(queue: _ChannelQueue, batch: List[_Item]) -> bool:
+        """Put a batch back to be sent again, returns False if it is given up"""
+        # discord.py closes files once they were sent
+        if not batch or batch[0].file is not None or batch[0].attempts + 1 >= MAX_ATTEMPTS:
+            return False
+        for item in batch:
+            item.attempts += 1
+        queue.items.extendleft(reversed(batch))
+        return True
+
+    def _take_summary(self, queue: _ChannelQueue) -> Optional[discord.Embed]:
+        # a file can only be sent with its own embed, keep counting until it is out
+        if not queue.dropped or (queue.items and queue.items[0].file is not None):
+            return None
+        dropped, queue.dropped = queue.dropped, Counter()
+        if self.summary_factory is None:
+            return None
+        return self.summary_factory(dropped)
+
+    @staticmethod
+    def _take_batch(
+            items: Deque[_Item],
+            max_embeds: int = MAX_EMBEDS,
+            max_length: int = MAX_EMBEDS_LENGTH,
+    ) -> List[_Item]:
+        """Take the longest run of items that fits into a single message"""
+        if not items:
+            return []
+        first = items.popleft()
+        batch = [first]
+        if first.file is not None or first.embed is None:
+            return batch
+        length = len(first.embed)
+        while items and len(batch) < max_embeds:
+            item = items[0]
+            if item.file is not None or item.embed is None:
+                break
+            if length + len(item.embed) > max_length:
+                break
+            length += len(item.embed)
+            batch.append(items.popleft())
+        return batch
+
+    async def _send_webhook(self, channel: discord.TextChannel, embeds, file) -> bool:
+        """Post through the channel's webhook, returns False if the bot has to send"""
+        if self.webhooks is None or not self.webhooks.is_open:
+            return False
+        webhook = await self.webhooks.get(channel)
+        if webhook is None:
+            return False
+        try:
+            await self.webhooks.send(webhook, embeds, file)
+        except discord.NotFound:
+            # deleted by someone, this message goes out as the bot
+            self.webhooks.forget(channel.id)
+            if file is not None:
+                file.reset()
+            return False
+        return True
+
+    async def _send_batch(
+            self,
+            queue: _ChannelQueue,
+            batch: List[_Item],
+            summary: Optional[discord.Embed] = None,
+    ):
+        embeds = [item.embed for item in batch if item.embed is not None]
+        if summary is not None:
+            embeds.insert(0, summary)
+        if not embeds and not batch:
+            return None
+        file = batch[0].file if batch else None
+        start = time.perf_counter()
+        try:
+            if not await self._send_webhook(queue.channel, embeds, file):
+                await send_embeds(queue.channel, embeds, file=file)
+        except discord.Forbidden:
+            self.failed += 1
+            outcome = "forbidden"
+            queue.breaker.failure(outcome)
+        except discord.NotFound:
+            self.failed += 1
+            outcome = "not_found"
+            queue.breaker.failure(outcome)
+        except discord.HTTPException as e:
+            self.failed += 1
+            outcome = "http_error"
+            log.warning("Unable to send %s log embeds to %s: %s", len(embeds), queue.channel.id, e)
+        else:
+            queue.breaker.success()
+            self.sent_messages += 1
+            self.sent_embeds += len(embeds)
+            self.batch_sizes[len(embeds)] += 1
+            outcome = "ok"
+        if self.metrics is not None:
+            self.metrics.observe("send_seconds", time.perf_counter() - start, outcome=outcome)
+            self.metrics.inc("sends_total", outcome=outcome)
+            self.metrics.inc("sent_embeds_total", len(embeds), outcome=outcome)
+        return outcome
+
+
+def _event_id(channel_id: int, embed: dict) -> str:
+    # timestamps are often the time of logging, they differ between replays of an event
+    data = {key: value for key, value in embed.items() if key != "timestamp"}
+    digest = hashlib.blake2b(
+        json.dumps(data, sort_keys=True).encode("utf-8"), digest_size=12
+    ).hexdigest()
+    return f"{channel_id}:{digest}"
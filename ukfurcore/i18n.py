@@ -0,0 +1,105 @@
+import contextvars
+import time
+import weakref
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict, Optional, Tuple
+
+import discord
+from redbot.core.i18n import get_locale_from_guild, set_contextual_locale
+
+DEFAULT_LOCALE = "en-US"
+
+# commands that change a locale, their completion invalidates cached locales
+LOCALE_COMMANDS = (
+    "set locale",
+    "set serverlocale",
+    "set regionalformat",
+    "set serverregionalformat",
+)
+
+
+class GuildLocales:
+    """Cache of each guild's locale
+
+    Locales are kept until one of Red's locale commands completes, or until
+    `ttl` seconds pass in case the locale was changed another way.
+    """
+
+    def __init__(self, bot, *, ttl: float = 600.0):
+        self.bot = bot
+        self.ttl = ttl
+        self._locales: Dict[Optional[int], Tuple[float, str]] = {}
+
+    async def get(self, guild: Optional[discord.Guild]) -> str:
+        key = guild.id if guild else None
+        cached = self._locales.get(key)
+        now = time.monotonic()
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        locale = await get_locale_from_guild(self.bot, guild)
+        self._locales[key] = (now + self.ttl, locale)
+        return locale
+
+    def invalidate(self, guild: discord.Guild = None):
+        """Forget a guild's locale, or every guild's if none is given"""
+        if guild is None:
+            self._locales.clear()
+        else:
+            self._locales.pop(guild.id, None)
+
+    def on_command_completion(self, ctx):
+        """Invalidate cached locales if the command changed a locale"""
+        if ctx.command.qualified_name.startswith(LOCALE_COMMANDS):
+            # the global locale applies to every guild without its own
+            self.invalidate()
+
+
+_shared_locales: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def shared_locales(bot) -> GuildLocales:
+    """The locale cache shared by all cogs of this repo"""
+    locales = _shared_locales.get(bot)
+    if locales is None:
+        locales = _shared_locales[bot] = GuildLocales(bot)
+    return locales
+
+
+class StringTable:
+    """Strings translated once per locale
+
+    `build` is called under every locale the cog has translations for and
+    returns the strings it needs by name. Building embeds then only needs
+    `table.get(locale).name`, without Translator calls or locale switching.
+    """
+
+    def __init__(self, locales_dir: Path, build: Callable[[], Dict[str, str]]):
+        self.locales_dir = locales_dir
+        self.build = build
+        self._tables: Dict[str, SimpleNamespace] = {}
+
+    @staticmethod
+    def _build_in_locale(build, locale: str) -> SimpleNamespace:
+        set_contextual_locale(locale)
+        return SimpleNamespace(**build())
+
+    def load(self):
+        locales = {DEFAULT_LOCALE}
+        if self.locales_dir.is_dir():
+            locales.update(path.stem for path in self.locales_dir.glob("*.po"))
+        # each build runs in a copied context, so the caller's locale is untouched
+        self._tables = {
+            locale: contextvars.copy_context().run(self._build_in_locale, self.build, locale)
+            for locale in locales
+        }
+
+    def get(self, locale: str) -> SimpleNamespace:
+        table = self._tables.get(locale)
+        if table is None:
+            # Red falls back to the untranslated strings for unknown locales
+            table = self._tables.get(DEFAULT_LOCALE)
+            if table is None:
+                self.load()
+                table = self._tables[DEFAULT_LOCALE]
+        return table
@@ -0,0 +1,281 @@
+import asyncio
+import json
+import logging
+import os
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Set
+
+log = logging.getLogger("red.ukfur-cogs.ukfurcore.journal")
+
+SEGMENT_BYTES = 1024 * 1024
+MAX_BYTES = 64 * 1024 * 1024
+# seconds between writes to disk, entries appended in between share one fsync
+SYNC_INTERVAL = 0.25
+# event ids remembered to drop duplicates, like events replayed after a resume
+REMEMBER = 10000
+
+
+class JournalEntry:
+    """A log entry kept on disk until it has been delivered"""
+
+    __slots__ = ("seq", "event_id", "channel_id", "priority", "embed")
+
+    def __init__(self, seq: int, event_id: str, channel_id: int, priority: int, embed: dict):
+        self.seq = seq
+        self.event_id = event_id
+        self.channel_id = channel_id
+        self.priority = priority
+        self.embed = embed
+
+    def to_line(self) -> bytes:
+        return (
+            json.dumps(
+                {
+                    "seq": self.seq,
+                    "id": self.event_id,
+                    "channel": self.channel_id,
+                    "priority": self.priority,
+                    "embed": self.embed,
+                },
+                separators=(",", ":"),
+            )
+            + "\n"
+        ).encode("utf-8")
+
+    @classmethod
+    def from_line(cls, line: bytes) -> "JournalEntry":
+        data = json.loads(line)
+        return cls(data["seq"], data["id"], data["channel"], data["priority"], data["embed"])
+
+
+class _Segment:
+    __slots__ = ("path", "first_seq", "last_seq", "size")
+
+    def __init__(self, path: Path, first_seq: int):
+        self.path = path
+        self.first_seq = first_seq
+        self.last_seq = first_seq - 1
+        self.size = 0
+
+
+class OutboxJournal:
+    """Append-only journal of log entries waiting to be sent
+
+    Entries are appended to numbered segment files as JSON lines. Appends
+    never wait, they are written and fsynced together every
+    `sync_interval` seconds. Delivered entries are acknowledged by sequence
+    number, in any order, and the highest sequence below which everything
+    was delivered is saved as a checkpoint. Segments entirely below it are
+    deleted. After a restart `open` returns whatever was not acknowledged,
+    so delivery is at least once, entries whose acknowledgement was not
+    saved yet are sent again.
+
+    Event ids are remembered so an event seen twice is only logged once,
+    over a restart for as long as its segment is still on disk.
+    Past `max_bytes` on disk new entries are not journaled.
+    """
+
+    def __init__(
+            self,
+            path: Path,
+            *,
+            segment_bytes: int = SEGMENT_BYTES,
+            max_bytes: int = MAX_BYTES,
+            sync_interval: float = SYNC_INTERVAL,
+            remember: int = REMEMBER,
+    ):
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.sync_interval = sync_interval
+        self.remember = remember
+        self._segments: Deque[_Segment] = deque()
+        # encoded entries waiting to be written, with their sequence numbers
+        self._buffer: List[tuple] = []
+        self._buffer_bytes = 0
+        self._disk_bytes = 0
+        self._next_seq = 1
+        self._watermark = 0
+        self._acked: Set[int] = set()
+        self._checkpoint_dirty = False
+        self._ids: "OrderedDict[str, None]" = OrderedDict()
+        self._file = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.appended = 0
+        self.acked = 0
+        self.duplicates = 0
+        self.full = 0
+        self.syncs = 0
+        self.compacted = 0
+
+    @property
+    def size(self) -> int:
+        """Bytes on disk and waiting to be written"""
+        return self._disk_bytes + self._buffer_bytes
+
+    @property
+    def pending(self) -> int:
+        """Entries appended but not delivered yet"""
+        return self._next_seq - 1 - self._watermark - len(self._acked)
+
+    def __len__(self):
+        return len(self._segments)
+
+    async def open(self) -> List[JournalEntry]:
+        """Recover the journal, returns undelivered entries in order"""
+        entries = await asyncio.get_running_loop().run_in_executor(None, self._recover)
+        self._task = asyncio.create_task(self._sync_loop())
+        return entries
+
+    def _recover(self) -> List[JournalEntry]:
+        self.path.mkdir(parents=True, exist_ok=True)
+        checkpoint = self.path / "checkpoint.json"
+        if checkpoint.exists():
+            data = json.loads(checkpoint.read_text(encoding="utf-8"))
+            self._watermark = data["watermark"]
+            self._acked = set(data["acked"])
+        entries = []
+        for path in sorted(self.path.glob("segment-*.ndjson")):
+            segment = _Segment(path, int(path.stem.split("-")[1]))
+            with path.open("rb") as file:
+                for line in file:
+                    try:
+                        entry = JournalEntry.from_line(line)
+                    except ValueError:
+                        # a torn write from a crash, nothing after it was synced
+                        break
+                    segment.last_seq = entry.seq
+                    segment.size += len(line)
+                    self._disk_bytes += len(line)
+                    self._remember(entry.event_id)
+                    if entry.seq > self._watermark and entry.seq not in self._acked:
+                        entries.append(entry)
+            self._segments.append(segment)
+            self._next_seq = max(self._next_seq, segment.last_seq + 1)
+        log.debug("Recovered %s undelivered log entries", len(entries))
+        return entries
+
+    def _remember(self, event_id: str):
+        self._ids[event_id] = None
+        if len(self._ids) > self.remember:
+            self._ids.popitem(last=False)
+
+    def seen(self, event_id: str) -> bool:
+        """Whether this event was journaled already, counting it as a duplicate if so"""
+        if event_id in self._ids:
+            self.duplicates += 1
+            return True
+        return False
+
+    def append(self, event_id: str, channel_id: int, priority: int, embed: dict) -> Optional[int]:
+        """Journal an entry, returns its sequence number or None if the journal is full"""
+        seq = self._next_seq
+        line = JournalEntry(seq, event_id, channel_id, priority, embed).to_line()
+        if self.size + len(line) > self.max_bytes:
+            self.full += 1
+            return None
+        self._next_seq += 1
+        self._buffer.append((seq, line))
+        self._buffer_bytes += len(line)
+        self._remember(event_id)
+        self.appended += 1
+        return seq
+
+    def ack(self, seq: int):
+        """Mark an entry as done with, delivered or given up on"""
+        if seq <= self._watermark:
+            return
+        self._acked.add(seq)
+        while self._watermark + 1 in self._acked:
+            self._watermark += 1
+            self._acked.remove(self._watermark)
+        self._checkpoint_dirty = True
+        self.acked += 1
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except OSError:
+                log.exception("Unable to write the log journal")
+
+    async def sync(self):
+        """Write appended entries and the checkpoint, then delete delivered segments"""
+        async with self._lock:
+            if not self._buffer and not self._checkpoint_dirty:
+                return
+            entries, self._buffer = self._buffer, []
+            self._buffer_bytes = 0
+            checkpoint = None
+            if self._checkpoint_dirty:
+                checkpoint = {"watermark": self._watermark, "acked": sorted(self._acked)}
+                self._checkpoint_dirty = False
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._sync, entries, checkpoint
+            )
+            self.syncs += 1
+
+    def _sync(self, entries: List[tuple], checkpoint: Optional[dict]):
+        for seq, line in entries:
+            if self._file is None or self._segments[-1].size >= self.segment_bytes:
+                self._rotate(seq)
+            self._file.write(line)
+            segment = self._segments[-1]
+            segment.last_seq = seq
+            segment.size += len(line)
+            self._disk_bytes += len(line)
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        if checkpoint is not None:
+            path = self.path / "checkpoint.json"
+            temporary = path.with_suffix(".tmp")
+            with temporary.open("w", encoding="utf-8") as file:
+                json.dump(checkpoint, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, path)
+            self._compact(checkpoint["watermark"])
+
+    def _rotate(self, first_seq: int):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+        segment = _Segment(self.path / f"segment-{first_seq:012d}.ndjson", first_seq)
+        self._segments.append(segment)
+        self._file = segment.path.open("ab")
+
+    def _compact(self, watermark: int):
+        # the newest delivered segment stays, its event ids still catch duplicates
+        while len(self._segments) > 2 and self._segments[1].last_seq <= watermark:
+            segment = self._segments.popleft()
+            segment.path.unlink()
+            self._disk_bytes -= segment.size
+            self.compacted += 1
+
+    async def close(self):
+        """Write everything out, undelivered entries are sent after the next open"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.sync()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def counts(self) -> Dict[str, int]:
+        return {
+            "appended": self.appended,
+            "acked": self.acked,
+            "pending": self.pending,
+            "duplicates": self.duplicates,
+            "full": self.full,
+            "segments": len(self._segments),
+            "syncs": self.syncs,
+            "compacted": self.compacted,
+        }
@@ -0,0 +1,77 @@
+from enum import Enum
+from typing import Optional, Sequence, Tuple
+
+import discord
+
+
+class MemberEventKind(Enum):
+    ROLE_ADDED = "role_added"
+    ROLE_REMOVED = "role_removed"
+    BOOST_STARTED = "boost_started"
+    BOOST_ENDED = "boost_ended"
+
+
+BOOST_KINDS = frozenset({MemberEventKind.BOOST_STARTED, MemberEventKind.BOOST_ENDED})
+
+
+class MemberEvent:
+    """A single change found between two versions of a member"""
+
+    __slots__ = ("kind", "member", "role_id")
+
+    def __init__(self, kind: MemberEventKind, member: discord.Member, role_id: int = None):
+        self.kind = kind
+        self.member = member
+        self.role_id = role_id
+
+    @property
+    def role(self) -> Optional[discord.Role]:
+        return self.member.guild.get_role(self.role_id) if self.role_id else None
+
+    def __repr__(self):
+        return f"<MemberEvent kind={self.kind.value} member={self.member.id} role={self.role_id}>"
+
+
+def _role_changes(before: Sequence[int], after: Sequence[int]):
+    """Walk two sorted role id lists together, yielding (role_id, added)"""
+    i = j = 0
+    while i < len(before) and j < len(after):
+        if before[i] == after[j]:
+            i += 1
+            j += 1
+        elif before[i] < after[j]:
+            yield before[i], False
+            i += 1
+        else:
+            yield after[j], True
+            j += 1
+    for role_id in before[i:]:
+        yield role_id, False
+    for role_id in after[j:]:
+        yield role_id, True
+
+
+def diff_member(before: discord.Member, after: discord.Member) -> Tuple[MemberEvent, ...]:
+    """Role and boost changes between two versions of a member
+
+    Member updates also fire for nicknames, avatars, pending and timeouts,
+    those return an empty tuple without looking at any role. discord.py
+    keeps role ids in sorted arrays, so equal role lists are rejected by a
+    single array comparison and changed ones are diffed in one pass.
+    """
+    roles_changed = before._roles != after._roles
+    boost_changed = before.premium_since != after.premium_since
+    if not roles_changed and not boost_changed:
+        return ()
+    events = []
+    if roles_changed:
+        for role_id, added in _role_changes(before._roles, after._roles):
+            kind = MemberEventKind.ROLE_ADDED if added else MemberEventKind.ROLE_REMOVED
+            events.append(MemberEvent(kind, after, role_id))
+    if boost_changed:
+        # premium_since also changes when a boost is renewed, that is not a new boost
+        if before.premium_since is None:
+            events.append(MemberEvent(MemberEventKind.BOOST_STARTED, after))
+        elif after.premium_since is None:
+            events.append(MemberEvent(MemberEventKind.BOOST_ENDED, after))
+    return tuple(events)
@@ -0,0 +1,257 @@
+import asyncio
+import functools
+import logging
+import os
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+log = logging.getLogger("red.ukfur-cogs.ukfurcore.metrics")
+
+# upper bounds in seconds, listeners should stay in the low milliseconds
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+# a collected sample: metric name, labels and value
+Sample = Tuple[str, Dict[str, str], float]
+
+
+class Histogram:
+    """Fixed bucket histogram, cumulative like Prometheus expects when rendered"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # one extra bucket for values above the last bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating within its bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[index - 1] if index else 0.0
+                if index == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    @property
+    def average(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    labels = list(labels)
+    if not labels:
+        return ""
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class MetricsRegistry:
+    """Counters and histograms rendered in the Prometheus text format
+
+    Values already counted elsewhere, like filter rejections, are not
+    duplicated here, collectors turn them into samples when rendering.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def describe(self, name: str, kind: str, text: str):
+        self._help[name] = (kind, text)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        values = self._counters.setdefault(name, {})
+        key = _labels(labels)
+        values[key] = values.get(key, 0) + amount
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        histograms = self._histograms.setdefault(name, {})
+        key = _labels(labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram()
+        return histogram
+
+    def observe(self, name: str, value: float, **labels):
+        self.histogram(name, **labels).observe(value)
+
+    def histograms(self, name: str) -> Dict[Labels, Histogram]:
+        return self._histograms.get(name, {})
+
+    def counters(self, name: str) -> Dict[Labels, float]:
+        return self._counters.get(name, {})
+
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]):
+        self._collectors.append(collector)
+
+    def _header(self, lines: List[str], name: str, default_kind: str):
+        kind, text = self._help.get(name, (default_kind, ""))
+        full_name = self.prefix + name
+        if text:
+            lines.append(f"# HELP {full_name} {text}")
+        lines.append(f"# TYPE {full_name} {kind}")
+
+    def render(self) -> str:
+        lines = []
+        for name, values in self._counters.items():
+            self._header(lines, name, "counter")
+            for labels, value in values.items():
+                lines.append(f"{self.prefix}{name}{_format_labels(labels)} {value}")
+        for name, histograms in self._histograms.items():
+            self._header(lines, name, "histogram")
+            for labels, histogram in histograms.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    bucket_labels = _format_labels((*labels, ("le", repr(bound))))
+                    lines.append(f"{self.prefix}{name}_bucket{bucket_labels} {cumulative}")
+                bucket_labels = _format_labels((*labels, ("le", "+Inf")))
+                lines.append(f"{self.prefix}{name}_bucket{bucket_labels} {histogram.count}")
+                lines.append(f"{self.prefix}{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(
+                    f"{self.prefix}{name}_count{_format_labels(labels)} {histogram.count}"
+                )
+        collected: Dict[str, List[Tuple[Dict[str, str], float]]] = {}
+        for collector in self._collectors:
+            try:
+                for name, labels, value in collector():
+                    collected.setdefault(name, []).append((labels, value))
+            except Exception:
+                log.exception("Metrics collector %r failed", collector)
+        for name, samples in collected.items():
+            self._header(lines, name, "gauge")
+            for labels, value in samples:
+                lines.append(f"{self.prefix}{name}{_format_labels(_labels(labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def timed(registry_attr: str, name: str, **labels):
+    """Record how long a cog's coroutine method takes in a histogram
+
+    `registry_attr` names the cog attribute holding the MetricsRegistry.
+    Listener decorators have to be applied on top of this one.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(self, *args, **kwargs)
+            finally:
+                getattr(self, registry_attr).observe(
+                    name, time.perf_counter() - start, **labels
+                )
+
+        return wrapper
+
+    return decorator
+
+
+class MetricsExporter:
+    """Exports a registry to a file or a local HTTP endpoint for scrapers
+
+    The file is replaced atomically every `interval` seconds, so a scraper
+    reading it, like node_exporter's textfile collector, never sees half of it.
+    The HTTP endpoint only listens on the loopback interface.
+    """
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+        self.path: Optional[Path] = None
+        self.port: Optional[int] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def write_file(self):
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        temporary.write_text(self.registry.render(), encoding="utf-8")
+        os.replace(temporary, self.path)
+
+    async def _write_loop(self, interval: float):
+        while True:
+            try:
+                self.write_file()
+            except OSError as e:
+                log.warning("Unable to write metrics to %s: %s", self.path, e)
+            await asyncio.sleep(interval)
+
+    def start_file(self, path: Path, interval: float = 15.0):
+        self.stop_file()
+        self.path = path
+        self._writer = asyncio.create_task(self._write_loop(interval))
+
+    def stop_file(self):
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        self.path = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            # the rest of the headers are not needed
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b""):
+                pass
+            parts = request.split()
+            if len(parts) >= 2 and parts[0] == b"GET" and parts[1] in (b"/", b"/metrics"):
+                status, body = "200 OK", self.registry.render().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b""
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode("ascii")
+                + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start_http(self, port: int, host: str = "127.0.0.1"):
+        await self.stop_http()
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self.port = port
+
+    async def stop_http(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        self.port = None
+
+    async def close(self):
+        self.stop_file()
+        await self.stop_http()
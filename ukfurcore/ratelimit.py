@@ -0,0 +1,35 @@
+import time
+
+
+class TokenBucket:
+    """Token bucket limiting how often a single destination is sent to
+
+    `reserve` takes a token and returns how long the caller has to wait
+    before using it, so a single sender per destination never overshoots.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Take a token, returns the delay in seconds before it may be used"""
+        self._refill()
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self.tokens
@@ -0,0 +1,150 @@
+import logging
+import time
+import weakref
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import discord
+
+from .members import MemberEvent, diff_member
+
+log = logging.getLogger("red.ukfur-cogs.ukfurcore.router")
+
+
+class MemberUpdate:
+    """A member update digested once for every subscribed cog"""
+
+    __slots__ = ("guild", "before", "after", "events")
+
+    def __init__(self, before: discord.Member, after: discord.Member, events):
+        self.guild: discord.Guild = after.guild
+        self.before = before
+        self.after = after
+        self.events: tuple = events
+
+    def of_kind(self, *kinds) -> List[MemberEvent]:
+        return [event for event in self.events if event.kind in kinds]
+
+
+def _digest_member_update(before: discord.Member, after: discord.Member):
+    # nickname, avatar and timeout changes are dropped here for every cog at once
+    events = diff_member(before, after)
+    return MemberUpdate(before, after, events) if events else None
+
+
+# gateway event -> function digesting its arguments, returning None drops the event
+DIGESTERS: Dict[str, Callable[..., Optional[Any]]] = {
+    "member_update": _digest_member_update,
+}
+
+
+class Subscription:
+    """A cog's handler for a routed event and how long it has taken"""
+
+    __slots__ = ("cog", "event", "handler", "accepts", "calls", "skipped", "total", "slowest")
+
+    def __init__(
+            self,
+            cog,
+            event: str,
+            handler: Callable[[Any], Awaitable[None]],
+            accepts: Optional[Callable[[discord.Guild], bool]],
+    ):
+        self.cog = cog
+        self.event = event
+        self.handler = handler
+        self.accepts = accepts
+        self.calls = 0
+        self.skipped = 0
+        self.total = 0.0
+        self.slowest = 0.0
+
+    @property
+    def name(self) -> str:
+        return f"{self.cog.qualified_name}.{self.handler.__name__}"
+
+    @property
+    def average(self) -> float:
+        return self.total / self.calls if self.calls else 0.0
+
+
+class EventRouter:
+    """Receives each gateway event once and fans it out to subscribed cogs
+
+    The event is digested once, events no cog could use are dropped before
+    anything is awaited. `accepts` lets a cog reject guilds from its own
+    in-memory settings, only then is the cog checked to be enabled in the
+    guild and its handler called.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._subscriptions: Dict[str, List[Subscription]] = {}
+        self._listeners: Dict[str, Callable] = {}
+        self.received: Dict[str, int] = {}
+        self.dropped: Dict[str, int] = {}
+
+    def subscribe(
+            self,
+            cog,
+            event: str,
+            handler: Callable[[Any], Awaitable[None]],
+            *,
+            accepts: Callable[[discord.Guild], bool] = None,
+    ) -> Subscription:
+        subscription = Subscription(cog, event, handler, accepts)
+        self._subscriptions.setdefault(event, []).append(subscription)
+        if event not in self._listeners:
+            digest = DIGESTERS[event]
+
+            async def listener(*args):
+                await self._route(event, digest, *args)
+
+            self._listeners[event] = listener
+            self.bot.add_listener(listener, f"on_{event}")
+        return subscription
+
+    def unsubscribe(self, cog):
+        """Remove all of a cog's subscriptions, usually from cog_unload"""
+        for event, subscriptions in list(self._subscriptions.items()):
+            subscriptions[:] = [s for s in subscriptions if s.cog is not cog]
+            if not subscriptions:
+                del self._subscriptions[event]
+                self.bot.remove_listener(self._listeners.pop(event), f"on_{event}")
+
+    def subscriptions(self) -> List[Subscription]:
+        return [s for subscriptions in self._subscriptions.values() for s in subscriptions]
+
+    async def _route(self, event: str, digest, *args):
+        self.received[event] = self.received.get(event, 0) + 1
+        digested = digest(*args)
+        guild = getattr(digested, "guild", None)
+        if digested is None or guild is None or guild.unavailable:
+            self.dropped[event] = self.dropped.get(event, 0) + 1
+            return
+        for subscription in self._subscriptions.get(event, ()):
+            if subscription.accepts is not None and not subscription.accepts(guild):
+                subscription.skipped += 1
+                continue
+            if await self.bot.cog_disabled_in_guild(subscription.cog, guild):
+                subscription.skipped += 1
+                continue
+            start = time.perf_counter()
+            try:
+                await subscription.handler(digested)
+            except Exception:
+                log.exception("Error in %s handling %s", subscription.name, event)
+            elapsed = time.perf_counter() - start
+            subscription.calls += 1
+            subscription.total += elapsed
+            subscription.slowest = max(subscription.slowest, elapsed)
+
+
+_shared_routers: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def shared_router(bot) -> EventRouter:
+    """The event router shared by all cogs of this repo"""
+    router = _shared_routers.get(bot)
+    if router is None:
+        router = _shared_routers[bot] = EventRouter(bot)
+    return router
@@ -0,0 +1,207 @@
+import asyncio
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable, Deque, Dict, List, Tuple
+
+# sends in flight at once on each shard, and for a single guild
+DEFAULT_CONCURRENCY = 4
+DEFAULT_PER_GUILD = 1
+# cost a guild may spend per round, a message costs 1 and a file upload 2
+DEFAULT_QUANTUM = 1
+
+
+class GuildShare:
+    """A guild's place in the scheduler and how long its sends waited"""
+
+    __slots__ = ("guild_id", "shard_id", "deficit", "waiters", "in_flight", "grants", "waited")
+
+    def __init__(self, guild_id: int, shard_id: int):
+        self.guild_id = guild_id
+        self.shard_id = shard_id
+        self.deficit = 0
+        self.waiters: Deque[Tuple[int, float, asyncio.Future]] = deque()
+        self.in_flight = 0
+        self.grants = 0
+        self.waited = 0.0
+
+    @property
+    def average_wait(self) -> float:
+        return self.waited / self.grants if self.grants else 0.0
+
+    @property
+    def oldest_wait(self) -> float:
+        return time.monotonic() - self.waiters[0][1] if self.waiters else 0.0
+
+
+class _Shard:
+    __slots__ = ("ring", "in_flight")
+
+    def __init__(self):
+        # guilds with waiting sends, visited in turn
+        self.ring: Deque[GuildShare] = deque()
+        self.in_flight = 0
+
+
+class FairScheduler:
+    """Deficit round robin over guilds for log sends
+
+    Senders ask for a slot before each message, with a cost for how much of
+    the shared send capacity it takes. Waiting guilds are visited in turn
+    and may spend up to `quantum` per visit, a costlier message waits until
+    its guild has saved enough over several visits. A guild under a raid or
+    purge takes one turn per round like every other guild instead of most
+    of the sends. Each shard
+    has its own ring and `concurrency` slots, a busy shard does not delay
+    guilds on the others, and a single guild never holds more than
+    `per_guild` slots.
+    """
+
+    def __init__(
+            self,
+            *,
+            concurrency: int = DEFAULT_CONCURRENCY,
+            per_guild: int = DEFAULT_PER_GUILD,
+            quantum: int = DEFAULT_QUANTUM,
+            shard_count: Callable[[], int] = lambda: 1,
+    ):
+        self.concurrency = concurrency
+        self.per_guild = per_guild
+        self.quantum = quantum
+        self.shard_count = shard_count
+        self._shards: Dict[int, _Shard] = {}
+        self._guilds: Dict[int, GuildShare] = {}
+
+    def _share(self, guild_id: int) -> GuildShare:
+        share = self._guilds.get(guild_id)
+        if share is None:
+            # the shard a guild is on, as Discord assigns them
+            shard_id = (guild_id >> 22) % max(1, self.shard_count() or 1)
+            share = self._guilds[guild_id] = GuildShare(guild_id, shard_id)
+        return share
+
+    def _shard(self, shard_id: int) -> _Shard:
+        shard = self._shards.get(shard_id)
+        if shard is None:
+            shard = self._shards[shard_id] = _Shard()
+        return shard
+
+    @asynccontextmanager
+    async def slot(self, guild_id: int, cost: int = 1):
+        """Wait for this guild's turn to send a message"""
+        share = self._share(guild_id)
+        await self._acquire(share, max(1, cost))
+        try:
+            yield
+        finally:
+            self._release(share)
+
+    async def _acquire(self, share: GuildShare, cost: int):
+        shard = self._shard(share.shard_id)
+        if (
+                not shard.ring
+                and shard.in_flight < self.concurrency
+                and share.in_flight < self.per_guild
+        ):
+            # nobody is waiting, no turn to take
+            share.in_flight += 1
+            shard.in_flight += 1
+            share.grants += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        share.waiters.append((cost, time.monotonic(), future))
+        if len(share.waiters) == 1:
+            shard.ring.append(share)
+        self._schedule(shard)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # granted just as the sender was cancelled, give the slot back
+                self._release(share)
+            else:
+                self._forget(shard, share, future)
+            raise
+
+    def _forget(self, shard: _Shard, share: GuildShare, future: asyncio.Future):
+        for waiter in share.waiters:
+            if waiter[2] is future:
+                share.waiters.remove(waiter)
+                break
+        if not share.waiters and share in shard.ring:
+            shard.ring.remove(share)
+            share.deficit = 0
+        if not share.in_flight and not share.waiters:
+            self._guilds.pop(share.guild_id, None)
+        self._schedule(shard)
+
+    def _release(self, share: GuildShare):
+        share.in_flight -= 1
+        shard = self._shard(share.shard_id)
+        shard.in_flight -= 1
+        if not share.in_flight and not share.waiters:
+            self._guilds.pop(share.guild_id, None)
+        self._schedule(shard)
+
+    def _schedule(self, shard: _Shard):
+        """Hand free slots to waiting guilds in turn"""
+        idle = 0
+        while shard.ring and shard.in_flight < self.concurrency and idle < len(shard.ring):
+            share = shard.ring[0]
+            if share.in_flight >= self.per_guild:
+                shard.ring.rotate(-1)
+                idle += 1
+                continue
+            cost, queued_at, future = share.waiters[0]
+            if future.done():
+                # cancelled, its sender forgets it once it runs again
+                share.waiters.popleft()
+                if not share.waiters:
+                    shard.ring.popleft()
+                    share.deficit = 0
+                continue
+            if share.deficit < cost:
+                # a new visit, the guild gets its quantum for this round
+                share.deficit += self.quantum
+                if share.deficit < cost:
+                    shard.ring.rotate(-1)
+                    continue
+            share.waiters.popleft()
+            share.deficit -= cost
+            share.in_flight += 1
+            shard.in_flight += 1
+            share.grants += 1
+            share.waited += time.monotonic() - queued_at
+            future.set_result(None)
+            idle = 0
+            if not share.waiters:
+                shard.ring.popleft()
+                share.deficit = 0
+            elif share.deficit < share.waiters[0][0]:
+                # the quantum is spent, the next guild takes its turn
+                shard.ring.rotate(-1)
+
+    def guilds(self) -> List[GuildShare]:
+        """Guilds with sends waiting or in flight"""
+        return list(self._guilds.values())
+
+    def shards(self) -> Dict[int, Tuple[int, int]]:
+        """Shard id -> (guilds waiting, sends in flight)"""
+        return {
+            shard_id: (len(shard.ring), shard.in_flight)
+            for shard_id, shard in sorted(self._shards.items())
+        }
+
+
+_shared_schedulers: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def shared_scheduler(bot) -> FairScheduler:
+    """The send scheduler shared by all cogs of this repo"""
+    scheduler = _shared_schedulers.get(bot)
+    if scheduler is None:
+        scheduler = _shared_schedulers[bot] = FairScheduler(
+            shard_count=lambda: bot.shard_count
+        )
+    return scheduler
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import time
+import weakref
+from typing import Dict, List, Optional, Set
+
+import aiohttp
+import discord
+
+log = logging.getLogger("red.ukfur-cogs.ukfurcore.webhooks")
+
+WEBHOOK_NAME = "Activity log"
+# seconds before trying again in a channel where no webhook could be made
+RETRY_AFTER = 600
+
+
+class WebhookPool:
+    """One managed webhook per log channel, shared by all cogs of this repo
+
+    Webhooks have their own rate limits, so log traffic posted through them
+    does not use up the bot's limits during purges and raids. The webhook
+    is found or created on first use and reused, all of them post through
+    one HTTP session. `get` returns None where the bot cannot manage
+    webhooks, callers then send as the bot instead.
+
+    The session is open while at least one cog uses the pool.
+    """
+
+    def __init__(self, bot, name: str = WEBHOOK_NAME):
+        self.bot = bot
+        self.name = name
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._users: Set[str] = set()
+        self._webhooks: Dict[int, discord.Webhook] = {}
+        # channel id -> when a webhook can be tried again
+        self._unavailable: Dict[int, float] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self.created = 0
+        self.sends = 0
+        self.lost = 0
+
+    def open(self, user: str):
+        self._users.add(user)
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+
+    async def close(self, user: str):
+        self._users.discard(user)
+        if not self._users and self._session is not None:
+            session, self._session = self._session, None
+            self._webhooks.clear()
+            await session.close()
+
+    @property
+    def is_open(self) -> bool:
+        return self._session is not None
+
+    def __len__(self):
+        return len(self._webhooks)
+
+    async def get(self, channel: discord.TextChannel) -> Optional[discord.Webhook]:
+        """The channel's webhook, None if one cannot be used"""
+        if self._session is None:
+            return None
+        webhook = self._webhooks.get(channel.id)
+        if webhook is not None:
+            return webhook
+        if self._unavailable.get(channel.id, 0) > time.monotonic():
+            return None
+        lock = self._locks.setdefault(channel.id, asyncio.Lock())
+        async with lock:
+            # another sender may have made it while we waited
+            if channel.id not in self._webhooks:
+                await self._find_or_create(channel)
+        return self._webhooks.get(channel.id)
+
+    async def _find_or_create(self, channel: discord.TextChannel):
+        if not channel.permissions_for(channel.guild.me).manage_webhooks:
+            self._unavailable[channel.id] = time.monotonic() + RETRY_AFTER
+            return
+        try:
+            webhook = discord.utils.find(
+                lambda w: w.name == self.name and w.user == self.bot.user and w.token,
+                await channel.webhooks(),
+            )
+            if webhook is None:
+                webhook = await channel.create_webhook(
+                    name=self.name, reason="Managed webhook for log messages"
+                )
+                self.created += 1
+        except discord.HTTPException as e:
+            log.warning("Unable to set up a webhook in %s: %s", channel.id, e)
+            self._unavailable[channel.id] = time.monotonic() + RETRY_AFTER
+            return
+        self._webhooks[channel.id] = discord.Webhook.from_url(
+            webhook.url, adapter=discord.AsyncWebhookAdapter(self._session)
+        )
+
+    def forget(self, channel_id: int):
+        """Drop a webhook that was deleted, the next send makes a new one"""
+        if self._webhooks.pop(channel_id, None) is not None:
+            self.lost += 1
+
+    async def send(
+            self,
+            webhook: discord.Webhook,
+            embeds: List[discord.Embed],
+            file: discord.File = None,
+    ):
+        """Post up to 10 embeds as the bot, raises discord.NotFound if the webhook is gone"""
+        user = self.bot.user
+        await webhook.send(
+            embeds=embeds,
+            file=file,
+            username=user.display_name,
+            avatar_url=str(user.avatar_url),
+            wait=True,
+        )
+        self.sends += 1
+
+
+_shared_pools: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def shared_webhooks(bot) -> WebhookPool:
+    """The webhook pool shared by all cogs of this repo"""
+    pool = _shared_pools.get(bot)
+    if pool is None:
+        pool = _shared_pools[bot] = WebhookPool(bot)
+    return pool
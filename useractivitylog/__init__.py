@@ -1,7 +1,8 @@
 from .useractivitylog import UserActivityLog
 
 __red_end_user_data_statement__ = (
-    "This cog does not persistently store data or metadata about users."
+    "This cog can optionally store message content, message IDs and author IDs on disk "
+    "to show deleted messages in moderation logs."
 )
 
 
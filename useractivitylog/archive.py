@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+import discord
+
+log = logging.getLogger("red.ukfur-cogs.useractivitylog.archive")
+
+DISCORD_EPOCH = 1420070400000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    message_id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    author_id INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    attachments TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_guild ON messages (guild_id, message_id);
+CREATE INDEX IF NOT EXISTS messages_author ON messages (author_id);
+CREATE TABLE IF NOT EXISTS guild_counts (
+    guild_id INTEGER PRIMARY KEY,
+    row_count INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS messages_counted_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO guild_counts (guild_id, row_count) VALUES (new.guild_id, 1)
+    ON CONFLICT (guild_id) DO UPDATE SET row_count = row_count + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS messages_counted_delete AFTER DELETE ON messages BEGIN
+    UPDATE guild_counts SET row_count = row_count - 1 WHERE guild_id = old.guild_id;
+END;
+"""
+
+UPSERT = """
+INSERT INTO messages (message_id, guild_id, channel_id, author_id, content, attachments)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (message_id) DO UPDATE
+SET content = excluded.content, attachments = excluded.attachments
+"""
+
+# Row = (message_id, guild_id, channel_id, author_id, content, attachments)
+Row = Tuple[int, int, int, int, str, str]
+
+
+def snowflake_before(timestamp: float) -> int:
+    """Smallest snowflake created at the given unix timestamp"""
+    return max(0, int(timestamp * 1000) - DISCORD_EPOCH) << 22
+
+
+class ArchivedMessage:
+    """Message read back from the archive, same shape as CachedMessage"""
+
+    __slots__ = ("id", "guild_id", "channel_id", "author_id", "content", "attachments")
+
+    def __init__(self, row: Row):
+        self.id, self.guild_id, self.channel_id, self.author_id, self.content, attachments = row
+        self.attachments = tuple(attachments.split("\n")) if attachments else ()
+
+    @property
+    def created_at(self) -> datetime:
+        return discord.utils.snowflake_time(self.id)
+
+
+class MessageArchive:
+    """Durable SQLite archive of messages, written in batches from a background task
+
+    All SQLite work runs on a single worker thread, so the event loop never
+    waits on disk. Messages are buffered and written every `interval` seconds
+    in one transaction, lookups also see messages that are not written yet.
+    """
+
+    def __init__(self, path: Path, *, interval: float = 0.5):
+        self.path = path
+        self.interval = interval
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="useractivitylog")
+        self._db: Optional[sqlite3.Connection] = None
+        self._pending: Dict[int, Row] = {}
+        self._writer: Optional[asyncio.Task] = None
+        self.rows_written = 0
+        self.flushes = 0
+        self.pruned = 0
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _open(self):
+        db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(SCHEMA)
+        self._db = db
+
+    async def open(self):
+        await self._run(self._open)
+        self._writer = asyncio.create_task(self._write_loop())
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        await self.flush()
+        if self._db is not None:
+            await self._run(self._db.close)
+            self._db = None
+        self._executor.shutdown(wait=False)
+
+    def add(self, message: discord.Message):
+        """Buffer a new or edited message to be written with the next batch"""
+        self._pending[message.id] = (
+            message.id,
+            message.guild.id,
+            message.channel.id,
+            message.author.id,
+            message.content,
+            "\n".join(a.url for a in message.attachments),
+        )
+
+    async def _write_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except sqlite3.Error:
+                log.exception("Unable to write messages to the archive")
+
+    def _write(self, rows):
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany(UPSERT, rows)
+
+    async def flush(self):
+        """Write all buffered messages in a single transaction"""
+        if not self._pending or self._db is None:
+            return
+        rows, self._pending = list(self._pending.values()), {}
+        await self._run(self._write, rows)
+        self.rows_written += len(rows)
+        self.flushes += 1
+
+    def _get_many(self, guild_id: int, message_ids) -> Dict[int, ArchivedMessage]:
+        found = {}
+        message_ids = list(message_ids)
+        # stay below SQLite's default limit on bound parameters
+        for start in range(0, len(message_ids), 500):
+            chunk = message_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor = self._db.execute(
+                "SELECT message_id, guild_id, channel_id, author_id, content, attachments "
+                f"FROM messages WHERE guild_id = ? AND message_id IN ({placeholders})",
+                (guild_id, *chunk),
+            )
+            for row in cursor:
+                found[row[0]] = ArchivedMessage(row)
+        return found
+
+    async def get_many(
+            self, guild_id: int, message_ids: Iterable[int]
+    ) -> Dict[int, ArchivedMessage]:
+        """Look up several messages of a guild by id"""
+        found = {}
+        missing = []
+        for message_id in message_ids:
+            row = self._pending.get(message_id)
+            if row is not None and row[1] == guild_id:
+                found[message_id] = ArchivedMessage(row)
+            else:
+                missing.append(message_id)
+        if missing and self._db is not None:
+            found.update(await self._run(self._get_many, guild_id, missing))
+        return found
+
+    async def get(self, guild_id: int, message_id: int) -> Optional[ArchivedMessage]:
+        return (await self.get_many(guild_id, [message_id])).get(message_id)
+
+    def _prune(self, guild_id: int, max_age: float, max_rows: int, batch: int) -> int:
+        deleted = 0
+        with self._db:
+            self._db.execute("BEGIN")
+            if max_age:
+                cutoff = snowflake_before(time.time() - max_age)
+                deleted += self._db.execute(
+                    "DELETE FROM messages WHERE message_id IN ("
+                    "SELECT message_id FROM messages WHERE guild_id = ? AND message_id < ? "
+                    "ORDER BY message_id LIMIT ?)",
+                    (guild_id, cutoff, batch),
+                ).rowcount
+            if max_rows:
+                row = self._db.execute(
+                    "SELECT row_count FROM guild_counts WHERE guild_id = ?", (guild_id,)
+                ).fetchone()
+                excess = min(batch, (row[0] if row else 0) - max_rows)
+                if excess > 0:
+                    deleted += self._db.execute(
+                        "DELETE FROM messages WHERE message_id IN ("
+                        "SELECT message_id FROM messages WHERE guild_id = ? "
+                        "ORDER BY message_id LIMIT ?)",
+                        (guild_id, excess),
+                    ).rowcount
+        return deleted
+
+    async def prune(
+            self, guild_id: int, *, max_age: float = 0, max_rows: int = 0, batch: int = 500
+    ) -> int:
+        """Delete at most `batch` of a guild's oldest messages beyond its retention
+
+        Only the guild's index is walked from its oldest entry, and row counts
+        are kept up to date by triggers, so pruning never scans the whole table.
+        """
+        if self._db is None:
+            return 0
+        deleted = await self._run(self._prune, guild_id, max_age, max_rows, batch)
+        self.pruned += deleted
+        return deleted
+
+    def _delete_author(self, user_id: int):
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM messages WHERE author_id = ?", (user_id,))
+
+    async def delete_author(self, user_id: int):
+        """Remove every archived message by a user"""
+        self._pending = {
+            message_id: row for message_id, row in self._pending.items() if row[3] != user_id
+        }
+        if self._db is not None:
+            await self._run(self._delete_author, user_id)
+
+    def _delete_guild(self, guild_id: int):
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM messages WHERE guild_id = ?", (guild_id,))
+
+    async def delete_guild(self, guild_id: int):
+        """Remove every archived message of a guild"""
+        self._pending = {
+            message_id: row for message_id, row in self._pending.items() if row[1] != guild_id
+        }
+        if self._db is not None:
+            await self._run(self._delete_guild, guild_id)
+
+    def _counts(self) -> Dict[int, int]:
+        return dict(self._db.execute("SELECT guild_id, row_count FROM guild_counts"))
+
+    async def counts(self) -> Dict[int, int]:
+        """Number of archived messages per guild"""
+        if self._db is None:
+            return {}
+        return await self._run(self._counts)
@@ -0,0 +1,316 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path, PurePosixPath
+from typing import Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+import discord
+
+log = logging.getLogger("red.ukfur-cogs.useractivitylog.attachments")
+
+DISCORD_HOSTS = ("cdn.discordapp.com", "media.discordapp.net")
+CONTENT_TYPES = ("image/", "video/", "audio/", "text/plain", "application/pdf")
+CHUNK_SIZE = 64 * 1024
+# seconds between passes removing expired files
+PRUNE_INTERVAL = 3600
+
+
+class StoredAttachment:
+    """An attachment kept on disk under the SHA-256 of its content"""
+
+    __slots__ = ("attachment_id", "author_id", "filename", "sha256", "size", "path")
+
+    def __init__(
+            self,
+            attachment_id: int,
+            author_id: int,
+            filename: str,
+            sha256: str,
+            size: int,
+            path: Path,
+    ):
+        self.attachment_id = attachment_id
+        self.author_id = author_id
+        self.filename = filename
+        self.sha256 = sha256
+        self.size = size
+        self.path = path
+
+    def file(self) -> discord.File:
+        return discord.File(str(self.path), filename=self.filename)
+
+
+class _Job:
+    __slots__ = (
+        "message_id", "author_id", "attachment_id", "url", "filename", "size", "content_type"
+    )
+
+    def __init__(self, message: discord.Message, attachment: discord.Attachment):
+        self.message_id = message.id
+        self.author_id = message.author.id
+        self.attachment_id = attachment.id
+        self.url = attachment.url
+        self.filename = attachment.filename
+        self.size = attachment.size
+        self.content_type = getattr(attachment, "content_type", None)
+
+
+class AttachmentArchive:
+    """Downloads attachments when they are posted, deduplicated by content
+
+    Discord stops serving attachments soon after their message is deleted,
+    so they are fetched right away by a fixed pool of workers sharing one
+    HTTP session. Files are stored as `ab/cd/<sha256><ext>`, a reposted
+    file is stored once no matter how many messages carry it. Jobs beyond
+    the queue size are dropped rather than delaying listeners.
+
+    `allowed_hosts` defaults to Discord's CDN, pass None to allow any host,
+    like a local stand-in server.
+    """
+
+    def __init__(
+            self,
+            root: Path,
+            *,
+            workers: int = 4,
+            queue_size: int = 1000,
+            max_size: int = 8 * 1024 * 1024,
+            max_age: float = 7 * 86400,
+            content_types: Tuple[str, ...] = CONTENT_TYPES,
+            allowed_hosts: Optional[Tuple[str, ...]] = DISCORD_HOSTS,
+            index_size: int = 50000,
+            session: aiohttp.ClientSession = None,
+    ):
+        self.root = root
+        self.workers = workers
+        self.max_size = max_size
+        self.max_age = max_age
+        self.content_types = content_types
+        self.allowed_hosts = allowed_hosts
+        self.index_size = index_size
+        self._queue: "asyncio.Queue[_Job]" = asyncio.Queue(maxsize=queue_size)
+        self._session = session
+        self._owns_session = session is None
+        self._tasks: List[asyncio.Task] = []
+        # message id -> attachments stored for it, oldest messages are forgotten first
+        self._index: "OrderedDict[int, List[StoredAttachment]]" = OrderedDict()
+        # jobs submitted and not finished, and users deleted while there were any
+        self._active = 0
+        self._deleted_authors: Set[int] = set()
+        self.stored = 0
+        self.deduplicated = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.failed = 0
+        self.pruned = 0
+
+    async def start(self):
+        await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self.root.mkdir(parents=True, exist_ok=True)
+        )
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.workers),
+                timeout=aiohttp.ClientTimeout(total=60, sock_connect=10),
+            )
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._prune_loop()))
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def drain(self):
+        """Wait until every queued download has finished"""
+        await self._queue.join()
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _wanted(self, attachment: discord.Attachment) -> bool:
+        if attachment.size > self.max_size:
+            return False
+        content_type = getattr(attachment, "content_type", None)
+        if content_type and not content_type.startswith(self.content_types):
+            return False
+        if self.allowed_hosts is not None:
+            return urlsplit(attachment.url).hostname in self.allowed_hosts
+        return True
+
+    def submit(self, message: discord.Message):
+        """Queue a message's attachments for download, never waits"""
+        for attachment in message.attachments:
+            if not self._wanted(attachment):
+                self.skipped += 1
+                continue
+            try:
+                self._queue.put_nowait(_Job(message, attachment))
+            except asyncio.QueueFull:
+                self.dropped += 1
+            else:
+                self._active += 1
+
+    def get(self, message_id: int) -> List[StoredAttachment]:
+        return self._index.get(message_id, [])
+
+    def pop(self, message_id: int) -> List[StoredAttachment]:
+        return self._index.pop(message_id, [])
+
+    def _remember(self, message_id: int, stored: StoredAttachment):
+        self._index.setdefault(message_id, []).append(stored)
+        self._index.move_to_end(message_id)
+        while len(self._index) > self.index_size:
+            self._index.popitem(last=False)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                stored = await self._fetch(job)
+                if stored is not None and job.author_id in self._deleted_authors:
+                    # the user's data was deleted while this was downloading
+                    await self._remove_unused({stored.path})
+                    stored = None
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                self.failed += 1
+                log.debug("Unable to archive attachment %s: %s", job.attachment_id, e)
+            else:
+                if stored is not None:
+                    self._remember(job.message_id, stored)
+            finally:
+                self._active -= 1
+                if not self._active:
+                    self._deleted_authors.clear()
+                self._queue.task_done()
+
+    async def _fetch(self, job: _Job) -> Optional[StoredAttachment]:
+        digest = hashlib.sha256()
+        data = bytearray()
+        async with self._session.get(job.url) as response:
+            if response.status != 200:
+                self.failed += 1
+                return None
+            if (response.content_length or 0) > self.max_size:
+                self.skipped += 1
+                return None
+            content_type = response.content_type or job.content_type or ""
+            if content_type and not content_type.startswith(self.content_types):
+                self.skipped += 1
+                return None
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                data += chunk
+                if len(data) > self.max_size:
+                    self.skipped += 1
+                    return None
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        extension = PurePosixPath(job.filename).suffix.lower()[:16]
+        path = self.root / sha256[:2] / sha256[2:4] / f"{sha256}{extension}"
+        created = await asyncio.get_running_loop().run_in_executor(
+            None, self._write, path, bytes(data)
+        )
+        if created:
+            self.stored += 1
+        else:
+            self.deduplicated += 1
+        return StoredAttachment(
+            job.attachment_id, job.author_id, job.filename, sha256, len(data), path
+        )
+
+    @staticmethod
+    def _write(path: Path, data: bytes) -> bool:
+        """Store a file unless its content is already stored, returns True if written"""
+        if path.exists():
+            # keeps the shared copy from expiring while it is still being posted
+            os.utime(path)
+            return False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # dot files are skipped by pruning and usage while they are being written
+        temporary = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        temporary.write_bytes(data)
+        os.replace(temporary, path)
+        return True
+
+    def _files(self) -> Iterator[Path]:
+        return (path for path in self.root.glob("*/*/*") if not path.name.startswith("."))
+
+    def _prune(self) -> Set[Path]:
+        cutoff = time.time() - self.max_age
+        removed = set()
+        for path in self._files():
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed.add(path)
+            except FileNotFoundError:
+                pass
+        return removed
+
+    async def prune(self) -> int:
+        """Remove files older than `max_age` and forget the messages they belonged to"""
+        removed = await asyncio.get_running_loop().run_in_executor(None, self._prune)
+        if removed:
+            for message_id in list(self._index):
+                stored = [a for a in self._index[message_id] if a.path not in removed]
+                if stored:
+                    self._index[message_id] = stored
+                else:
+                    del self._index[message_id]
+        self.pruned += len(removed)
+        return len(removed)
+
+    async def delete_author(self, author_id: int) -> int:
+        """Forget a user's attachments and remove the files no other message carries"""
+        if self._active:
+            # downloads already queued for the user are removed once they finish
+            self._deleted_authors.add(author_id)
+        paths = set()
+        for message_id, stored in list(self._index.items()):
+            if stored[0].author_id == author_id:
+                paths.update(a.path for a in self._index.pop(message_id))
+        return await self._remove_unused(paths)
+
+    async def _remove_unused(self, paths: Set[Path]) -> int:
+        paths -= {a.path for stored in self._index.values() for a in stored}
+        return len(await asyncio.get_running_loop().run_in_executor(None, self._unlink, paths))
+
+    @staticmethod
+    def _unlink(paths: Set[Path]) -> Set[Path]:
+        removed = set()
+        for path in paths:
+            try:
+                path.unlink()
+                removed.add(path)
+            except FileNotFoundError:
+                pass
+        return removed
+
+    async def _prune_loop(self):
+        while True:
+            await asyncio.sleep(PRUNE_INTERVAL)
+            if not self.max_age:
+                continue
+            try:
+                await self.prune()
+            except OSError:
+                log.exception("Unable to prune archived attachments")
+
+    def _usage(self) -> Tuple[int, int]:
+        files = [path for path in self._files() if path.is_file()]
+        return len(files), sum(path.stat().st_size for path in files)
+
+    async def usage(self) -> Tuple[int, int]:
+        """Number of stored files and their total size in bytes"""
+        return await asyncio.get_running_loop().run_in_executor(None, self._usage)
+
@@ -0,0 +1,132 @@
+import asyncio
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import discord
+
+
+def account_created(member: discord.abc.User) -> datetime:
+    """Account creation time as an aware datetime"""
+    created = member.created_at
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    return created
+
+
+class BurstMember:
+    """What is kept of a member while a burst is being summarised"""
+
+    __slots__ = ("id", "name", "created_at", "seen_at")
+
+    def __init__(self, member: discord.Member):
+        self.id = member.id
+        self.name = str(member)
+        self.created_at = account_created(member)
+        self.seen_at = datetime.now(timezone.utc)
+
+    @property
+    def account_age(self):
+        return self.seen_at - self.created_at
+
+
+class _Burst:
+    __slots__ = ("times", "active", "members", "task", "guild")
+
+    def __init__(self):
+        self.times: Deque[float] = deque()
+        self.active = False
+        self.members: List[BurstMember] = []
+        self.task: Optional[asyncio.Task] = None
+        self.guild: Optional[discord.Guild] = None
+
+
+class BurstDetector:
+    """Sliding window rate detector for joins and leaves
+
+    While a guild's rate for an event kind stays below the threshold every
+    event is logged on its own. Once `threshold` events happen within
+    `window` seconds the guild switches to summary mode: members are
+    collected and passed to `summarize` every `interval` seconds, until the
+    rate over the last window falls below half the threshold.
+    """
+
+    def __init__(
+            self,
+            summarize: Callable[[discord.Guild, str, List[BurstMember], float], Awaitable[None]],
+    ):
+        self.summarize = summarize
+        self._bursts: Dict[Tuple[int, str], _Burst] = {}
+        self.bursts_started = 0
+
+    def is_active(self, guild_id: int, kind: str) -> bool:
+        burst = self._bursts.get((guild_id, kind))
+        return burst is not None and burst.active
+
+    def hit(
+            self,
+            member: discord.Member,
+            kind: str,
+            *,
+            threshold: int,
+            window: float,
+            interval: float,
+    ) -> bool:
+        """Record an event, returns True if it was taken into a summary"""
+        if not threshold:
+            return False
+        key = (member.guild.id, kind)
+        burst = self._bursts.get(key)
+        if burst is None:
+            burst = self._bursts[key] = _Burst()
+        now = time.monotonic()
+        times = burst.times
+        times.append(now)
+        while times and times[0] <= now - window:
+            times.popleft()
+        if not burst.active:
+            if len(times) < threshold:
+                return False
+            burst.active = True
+            burst.guild = member.guild
+            self.bursts_started += 1
+            burst.task = asyncio.create_task(
+                self._summarize_loop(key, burst, threshold, window, interval)
+            )
+        burst.members.append(BurstMember(member))
+        return True
+
+    async def _summarize_loop(
+            self,
+            key: Tuple[int, str],
+            burst: _Burst,
+            threshold: int,
+            window: float,
+            interval: float,
+    ):
+        try:
+            while burst.active:
+                await asyncio.sleep(interval)
+                now = time.monotonic()
+                while burst.times and burst.times[0] <= now - window:
+                    burst.times.popleft()
+                if len(burst.times) < threshold / 2:
+                    burst.active = False
+                members, burst.members = burst.members, []
+                if members:
+                    await self.summarize(burst.guild, key[1], members, window)
+        finally:
+            burst.active = False
+            burst.task = None
+            if not burst.times:
+                self._bursts.pop(key, None)
+
+    async def close(self):
+        """Stop all summaries, members collected so far are summarised right away"""
+        for (guild_id, kind), burst in list(self._bursts.items()):
+            if burst.task is not None:
+                burst.task.cancel()
+            members, burst.members = burst.members, []
+            if members:
+                await self.summarize(burst.guild, kind, members, 0)
@@ -0,0 +1,66 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import discord
+
+
+class CommandDetector:
+    """Tells whether a message invoked a command without building a Context
+
+    Messages that do not start with one of the guild's prefixes can never be
+    commands, so `bot.get_context` only runs once a prefix matches.
+    Prefixes are cached per guild for `prefix_ttl` seconds, and results are
+    remembered per message id, including messages seen by `on_command`.
+    """
+
+    def __init__(self, bot, *, prefix_ttl: float = 60.0, cache_size: int = 4096):
+        self.bot = bot
+        self.prefix_ttl = prefix_ttl
+        self.cache_size = cache_size
+        self._prefixes: Dict[Optional[int], Tuple[float, Tuple[str, ...]]] = {}
+        # message id -> (content, is_command)
+        self._results: "OrderedDict[int, Tuple[str, bool]]" = OrderedDict()
+        self.context_calls = 0
+
+    def remember(self, message: discord.Message, is_command: bool):
+        """Record whether a message is a command"""
+        self._results[message.id] = (message.content, is_command)
+        self._results.move_to_end(message.id)
+        if len(self._results) > self.cache_size:
+            self._results.popitem(last=False)
+
+    def invalidate_prefixes(self, guild: discord.Guild = None):
+        """Forget cached prefixes for a guild, or for every guild"""
+        if guild is None:
+            self._prefixes.clear()
+        else:
+            self._prefixes.pop(guild.id, None)
+
+    async def prefixes(self, guild: Optional[discord.Guild]) -> Tuple[str, ...]:
+        """Valid prefixes for a guild, longest first like Red matches them"""
+        key = guild.id if guild else None
+        cached = self._prefixes.get(key)
+        now = time.monotonic()
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        prefixes = tuple(
+            sorted(await self.bot.get_valid_prefixes(guild), key=len, reverse=True)
+        )
+        self._prefixes[key] = (now + self.prefix_ttl, prefixes)
+        return prefixes
+
+    async def is_command(self, message: discord.Message) -> bool:
+        """Whether a message invoked one of the bot's commands"""
+        cached = self._results.get(message.id)
+        if cached is not None and cached[0] == message.content:
+            return cached[1]
+        if not message.content or not message.content.startswith(
+                await self.prefixes(message.guild)
+        ):
+            is_command = False
+        else:
+            self.context_calls += 1
+            is_command = (await self.bot.get_context(message)).command is not None
+        self.remember(message, is_command)
+        return is_command
@@ -0,0 +1,185 @@
+import gzip
+import json
+from pprint import pformat
+from tempfile import SpooledTemporaryFile
+from typing import List, Optional
+
+import discord
+
+# keep small dumps in memory, larger ones roll over to disk
+SPOOL_SIZE = 1024 * 1024
+# room for data still buffered inside the gzip compressor
+GZIP_MARGIN = 64 * 1024
+
+FORMATS = ("text", "ndjson")
+
+
+def text_record(message: discord.Message) -> str:
+    """Format a message the way bulk deletion dumps always have"""
+    n = "\n"
+    return (
+        f"[{message.id}]\n"
+        f"[Author]:     {message.author}\n"
+        f"[Channel]:    {message.channel.name} ({message.channel.id})\n"
+        f"[Created at]: {message.created_at}\n"
+        f"[Content]:\n"
+        f"{message.system_content}\n"
+        f"[Embeds]:\n"
+        f"{n.join([pformat(e.to_dict()) for e in message.embeds])}"
+    )
+
+
+def ndjson_record(message: discord.Message) -> str:
+    """Format a message as a single line of JSON"""
+    reference = message.reference
+    return json.dumps(
+        {
+            "id": message.id,
+            "author_id": message.author.id,
+            "author": str(message.author),
+            "channel_id": message.channel.id,
+            "created_at": message.created_at.isoformat(),
+            "edited_at": message.edited_at.isoformat() if message.edited_at else None,
+            "content": message.system_content,
+            "attachments": [
+                {
+                    "filename": a.filename,
+                    "url": a.url,
+                    "proxy_url": a.proxy_url,
+                    "size": a.size,
+                }
+                for a in message.attachments
+            ],
+            "embeds": [e.to_dict() for e in message.embeds],
+            "reference": {
+                "message_id": reference.message_id,
+                "channel_id": reference.channel_id,
+                "guild_id": reference.guild_id,
+            }
+            if reference
+            else None,
+        },
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+
+
+def cached_text_record(record, channel: discord.TextChannel, author) -> str:
+    """Format a stored message record like `text_record`"""
+    n = "\n"
+    return (
+        f"[{record.id}]\n"
+        f"[Author]:     {author or record.author_id}\n"
+        f"[Channel]:    {channel.name} ({channel.id})\n"
+        f"[Created at]: {record.created_at}\n"
+        f"[Content]:\n"
+        f"{record.content}\n"
+        f"[Attachments]:\n"
+        f"{n.join(record.attachments)}"
+    )
+
+
+def cached_ndjson_record(record, channel: discord.TextChannel, author) -> str:
+    """Format a stored message record like `ndjson_record`"""
+    return json.dumps(
+        {
+            "id": record.id,
+            "author_id": record.author_id,
+            "author": str(author) if author else None,
+            "channel_id": channel.id,
+            "created_at": record.created_at.isoformat(),
+            "content": record.content,
+            "attachments": [{"url": url} for url in record.attachments],
+        },
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+
+
+class DumpWriter:
+    """Writes a bulk deletion dump incrementally to spooled temporary files
+
+    Records are written one at a time, so the whole dump never has to be
+    held as a single string. Once a file would grow past `limit` bytes a
+    new one is started, so every part can be uploaded to the guild.
+    """
+
+    def __init__(
+            self,
+            basename: str,
+            *,
+            fmt: str = "text",
+            compress: bool = False,
+            limit: int = 8 * 1024 * 1024,
+    ):
+        self.basename = basename
+        self.fmt = fmt
+        self.compress = compress
+        self.limit = limit - GZIP_MARGIN if compress else limit
+        self.records = 0
+        self._parts: List[SpooledTemporaryFile] = []
+        self._raw: Optional[SpooledTemporaryFile] = None
+        self._stream = None
+        self._part_records = 0
+
+    @property
+    def extension(self) -> str:
+        extension = ".txt" if self.fmt == "text" else ".ndjson"
+        return extension + ".gz" if self.compress else extension
+
+    def _open_part(self):
+        self._close_stream()
+        self._raw = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        self._parts.append(self._raw)
+        self._stream = (
+            gzip.GzipFile(fileobj=self._raw, mode="wb") if self.compress else self._raw
+        )
+        self._part_records = 0
+
+    def _close_stream(self):
+        if self.compress and self._stream is not None:
+            self._stream.close()
+        self._stream = None
+
+    def write(self, message: discord.Message):
+        if self.fmt == "text":
+            self._write(text_record(message))
+        else:
+            self._write(ndjson_record(message))
+
+    def write_cached(self, record, channel: discord.TextChannel, author=None):
+        """Write a message record from the cog's own message store"""
+        if self.fmt == "text":
+            self._write(cached_text_record(record, channel, author))
+        else:
+            self._write(cached_ndjson_record(record, channel, author))
+
+    def _write(self, record: str):
+        data = record.encode("utf-8")
+        if self._stream is None:
+            self._open_part()
+        elif self._part_records and self._raw.tell() + len(data) > self.limit:
+            self._open_part()
+        if self.fmt == "text":
+            if self._part_records:
+                self._stream.write(b"\n\n")
+            self._stream.write(data)
+        else:
+            self._stream.write(data)
+            self._stream.write(b"\n")
+        self._part_records += 1
+        self.records += 1
+
+    def files(self) -> List[discord.File]:
+        """Finish writing and return the dump as uploadable files"""
+        self._close_stream()
+        files = []
+        for number, part in enumerate(self._parts, start=1):
+            part.seek(0)
+            if len(self._parts) == 1:
+                filename = f"{self.basename}{self.extension}"
+            else:
+                filename = f"{self.basename}-{number}{self.extension}"
+            files.append(discord.File(part, filename=filename))
+        self._parts = []
+        return files
@@ -0,0 +1,207 @@
+import asyncio
+import re
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import discord
+
+# words and the whitespace between them, whitespace is kept so text renders as typed
+TOKEN = re.compile(r"\s+|\S+")
+
+EQUAL, DELETE, INSERT = 0, 1, 2
+
+
+def _myers(a: List[str], b: List[str], max_edits: int, deadline: float):
+    """Shortest edit script between token lists, None if over the edit or time budget
+
+    Myers' O(ND) algorithm, its cost grows with the number of edits rather
+    than with the length of the texts, so it is cut off after `max_edits`.
+    """
+    n, m = len(a), len(b)
+    v = {1: 0}
+    trace = []
+    for d in range(min(max_edits, n + m) + 1):
+        if time.perf_counter() > deadline:
+            return None
+        trace.append(v.copy())
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[k] = x
+            if x >= n and y >= m:
+                return _backtrack(a, b, trace)
+    return None
+
+
+def _backtrack(a: List[str], b: List[str], trace) -> List[Tuple[int, str]]:
+    ops = []
+    x, y = len(a), len(b)
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[k - 1] < v[k + 1]):
+            previous_k = k + 1
+        else:
+            previous_k = k - 1
+        previous_x = v[previous_k]
+        previous_y = previous_x - previous_k
+        while x > previous_x and y > previous_y:
+            ops.append((EQUAL, a[x - 1]))
+            x -= 1
+            y -= 1
+        if d:
+            if x == previous_x:
+                ops.append((INSERT, b[y - 1]))
+            else:
+                ops.append((DELETE, a[x - 1]))
+        x, y = previous_x, previous_y
+    ops.reverse()
+    return ops
+
+
+def word_diff(
+        before: str,
+        after: str,
+        *,
+        max_tokens: int = 1000,
+        max_edits: int = 200,
+        budget: float = 0.005,
+) -> Optional[List[Tuple[int, str]]]:
+    """Word level changes from `before` to `after` as (op, text) runs
+
+    Returns None when the texts are too long or too different to diff within
+    `budget` seconds, callers then show both texts as they are.
+    """
+    a = TOKEN.findall(before)
+    b = TOKEN.findall(after)
+    # unchanged starts and ends are common and cost nothing to skip
+    prefix = 0
+    while prefix < len(a) and prefix < len(b) and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while (
+            suffix < len(a) - prefix
+            and suffix < len(b) - prefix
+            and a[-1 - suffix] == b[-1 - suffix]
+    ):
+        suffix += 1
+    middle_a = a[prefix:len(a) - suffix]
+    middle_b = b[prefix:len(b) - suffix]
+    if len(middle_a) > max_tokens or len(middle_b) > max_tokens:
+        return None
+    ops = _myers(middle_a, middle_b, max_edits, time.perf_counter() + budget)
+    if ops is None:
+        return None
+    ops = [(EQUAL, t) for t in a[:prefix]] + ops + [(EQUAL, t) for t in a[len(a) - suffix:]]
+    runs: List[Tuple[int, str]] = []
+    for op, text in ops:
+        if runs and runs[-1][0] == op:
+            runs[-1] = (op, runs[-1][1] + text)
+        else:
+            runs.append((op, text))
+    return runs
+
+
+def render_diff(runs: List[Tuple[int, str]], limit: int) -> Optional[str]:
+    """Markdown with removed words struck through and added words in bold
+
+    Returns None if it does not fit in `limit` characters.
+    """
+    parts = []
+    for op, text in runs:
+        text = discord.utils.escape_markdown(text)
+        if op == EQUAL or not text.strip():
+            parts.append(text)
+            continue
+        # markers only work directly around the words, whitespace stays outside
+        core = text.strip()
+        start = text.index(core)
+        mark = "~~" if op == DELETE else "**"
+        parts.append(f"{text[:start]}{mark}{core}{mark}{text[start + len(core):]}")
+    rendered = "".join(parts)
+    return rendered if len(rendered) <= limit else None
+
+
+class PendingEdit:
+    """Edits of one message waiting to be logged as a single entry"""
+
+    __slots__ = ("logchannel", "before", "after", "edits", "deadline", "task")
+
+    def __init__(self, logchannel: discord.TextChannel, before: discord.Message):
+        self.logchannel = logchannel
+        self.before = before
+        self.after = before
+        self.edits = 0
+        self.deadline = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+
+class EditDebouncer:
+    """Coalesces repeated edits of a message into one log entry
+
+    The entry is logged once the message has not been edited for `window`
+    seconds, keeping the content from before the first edit and after the
+    last. A message edited without pause is still logged after four windows.
+    Past `max_pending` messages edits are logged right away.
+    """
+
+    def __init__(
+            self,
+            log_edit: Callable[[PendingEdit], Awaitable[None]],
+            *,
+            max_pending: int = 5000,
+    ):
+        self.log_edit = log_edit
+        self.max_pending = max_pending
+        self._pending: Dict[int, PendingEdit] = {}
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(
+            self,
+            logchannel: discord.TextChannel,
+            before: discord.Message,
+            after: discord.Message,
+            window: float,
+    ) -> bool:
+        """Record an edit, returns False if it should be logged right away"""
+        pending = self._pending.get(after.id)
+        if pending is None:
+            if not window or len(self._pending) >= self.max_pending:
+                return False
+            pending = self._pending[after.id] = PendingEdit(logchannel, before)
+            pending.task = asyncio.create_task(
+                self._wait(after.id, pending, time.monotonic() + window * 4)
+            )
+        else:
+            self.coalesced += 1
+        pending.logchannel = logchannel
+        pending.after = after
+        pending.edits += 1
+        pending.deadline = time.monotonic() + window
+        return True
+
+    async def _wait(self, message_id: int, pending: PendingEdit, latest: float):
+        try:
+            while (now := time.monotonic()) < min(pending.deadline, latest):
+                await asyncio.sleep(min(pending.deadline, latest) - now)
+        finally:
+            self._pending.pop(message_id, None)
+        await self.log_edit(pending)
+
+    async def close(self):
+        """Log every pending edit right away"""
+        pending, self._pending = list(self._pending.values()), {}
+        for edit in pending:
+            edit.task.cancel()
+        await asyncio.gather(*(edit.task for edit in pending), return_exceptions=True)
+        for edit in pending:
+            await self.log_edit(edit)
@@ -0,0 +1,280 @@
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from .settings import GuildSettings
+
+# A check gets the cog, the guild's settings, the resolved log channel and the
+# event arguments, and returns True to reject the event.
+
+
+class Stage:
+    """A single filter in a chain
+
+    `enabled` is evaluated when the chain is compiled for a guild, stages
+    that cannot reject anything with the guild's settings are left out.
+    """
+
+    __slots__ = ("name", "check", "is_async", "enabled")
+
+    def __init__(
+            self,
+            name: str,
+            check: Callable[..., bool],
+            *,
+            is_async: bool = False,
+            enabled: Callable[[GuildSettings], bool] = None,
+    ):
+        self.name = name
+        self.check = check
+        self.is_async = is_async
+        self.enabled = enabled
+
+
+class FilterChain:
+    """Declarative filters for one event type
+
+    `static` checks only look at settings and are evaluated once per guild,
+    if any of them rejects, every event of this type is rejected without
+    running the stages. Stages should be listed cheapest and most selective
+    first, async stages always run after the sync ones.
+    """
+
+    __slots__ = ("event", "static", "stages")
+
+    def __init__(
+            self,
+            event: str,
+            static: Sequence[Tuple[str, Callable[[GuildSettings], bool]]],
+            stages: Sequence[Stage],
+    ):
+        self.event = event
+        self.static = tuple(static)
+        self.stages = tuple(sorted(stages, key=lambda stage: stage.is_async))
+
+    def compile(self, settings: GuildSettings) -> "CompiledChain":
+        for name, check in self.static:
+            if check(settings):
+                return CompiledChain(self.event, settings, rejected_by=name)
+        return CompiledChain(
+            self.event,
+            settings,
+            stages=tuple(
+                stage
+                for stage in self.stages
+                if stage.enabled is None or stage.enabled(settings)
+            ),
+        )
+
+
+class CompiledChain:
+    """A filter chain specialised for one guild's settings"""
+
+    __slots__ = ("event", "settings", "version", "stages", "rejected_by")
+
+    def __init__(
+            self,
+            event: str,
+            settings: GuildSettings,
+            *,
+            stages: Tuple[Stage, ...] = (),
+            rejected_by: Optional[str] = None,
+    ):
+        self.event = event
+        self.settings = settings
+        self.version = settings.version
+        self.stages = stages
+        self.rejected_by = rejected_by
+
+    def is_current(self, settings: GuildSettings) -> bool:
+        return self.settings is settings and self.version == settings.version
+
+
+class FilterPipeline:
+    """Runs compiled filter chains and counts which stage rejected each event"""
+
+    def __init__(self, cog, chains: Sequence[FilterChain], metrics=None):
+        self.cog = cog
+        self.metrics = metrics
+        self.chains: Dict[str, FilterChain] = {chain.event: chain for chain in chains}
+        self._compiled: Dict[Tuple[str, int], CompiledChain] = {}
+        self.rejected = Counter()
+        self.passed = Counter()
+
+    def compiled(self, event: str, guild_id: int, settings: GuildSettings) -> CompiledChain:
+        compiled = self._compiled.get((event, guild_id))
+        if compiled is None or not compiled.is_current(settings):
+            compiled = self._compiled[(event, guild_id)] = self.chains[event].compile(settings)
+        return compiled
+
+    def accepts(self, event: str, guild_id: int, settings: GuildSettings) -> bool:
+        """Whether any event of this type could be logged for the guild"""
+        compiled = self.compiled(event, guild_id, settings)
+        if compiled.rejected_by is not None:
+            self.rejected[(event, compiled.rejected_by)] += 1
+            return False
+        return True
+
+    async def check(self, event: str, guild_id: int, settings: GuildSettings, logchannel, *args):
+        """Run an event through its guild's chain, returns True if it should be logged"""
+        compiled = self.compiled(event, guild_id, settings)
+        if compiled.rejected_by is not None:
+            self.rejected[(event, compiled.rejected_by)] += 1
+            return False
+        start = time.perf_counter()
+        try:
+            for stage in compiled.stages:
+                result = stage.check(self.cog, settings, logchannel, *args)
+                if stage.is_async:
+                    result = await result
+                if result:
+                    self.rejected[(event, stage.name)] += 1
+                    return False
+            self.passed[event] += 1
+            return True
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe("filter_seconds", time.perf_counter() - start, event=event)
+
+
+def _no_channel(cog, settings, logchannel, *args):
+    return logchannel is None
+
+
+def _message_author(cog, settings, logchannel, message, *args):
+    return settings.ignores_author(message.author)
+
+
+def _message_channel(cog, settings, logchannel, message, *args):
+    return settings.ignores_channel(message.channel)
+
+
+def _message_nsfw(cog, settings, logchannel, message, *args):
+    return message.channel.nsfw and not logchannel.nsfw
+
+
+def _message_cog_disabled(cog, settings, logchannel, message, *args):
+    return cog.bot.cog_disabled_in_guild(cog, message.guild)
+
+
+def _message_command(cog, settings, logchannel, message, *args):
+    return cog.command_detector.is_command(message)
+
+
+def _raw_channel(cog, settings, logchannel, payload, channel):
+    return settings.ignores_channel(channel)
+
+
+def _raw_nsfw(cog, settings, logchannel, payload, channel):
+    return channel.nsfw and not logchannel.nsfw
+
+
+def _raw_cog_disabled(cog, settings, logchannel, payload, channel):
+    return cog.bot.cog_disabled_in_guild_raw(cog.qualified_name, payload.guild_id)
+
+
+def _member_cog_disabled(cog, settings, logchannel, member, *args):
+    return cog.bot.cog_disabled_in_guild(cog, member.guild)
+
+
+def _edit_unchanged(cog, settings, logchannel, before, after):
+    # attachments can only be removed by an edit, the same count means the same ones
+    return before.content == after.content and len(before.attachments) == len(after.attachments)
+
+
+def _has_ignored_ids(settings):
+    return bool(settings.ignored_channels or settings.ignored_categories)
+
+
+CHAINS = (
+    FilterChain(
+        "delete",
+        static=(
+            ("disabled", lambda settings: not settings.deletion),
+            ("no_channel", lambda settings: settings.delete_channel is None),
+        ),
+        stages=(
+            Stage("no_channel", _no_channel),
+            Stage("ignored_author", _message_author),
+            Stage("ignored_channel", _message_channel, enabled=_has_ignored_ids),
+            Stage("nsfw", _message_nsfw),
+            Stage("cog_disabled", _message_cog_disabled, is_async=True),
+            Stage("command", _message_command, is_async=True),
+        ),
+    ),
+    FilterChain(
+        "raw_delete",
+        static=(
+            ("disabled", lambda settings: not settings.deletion),
+            ("no_channel", lambda settings: settings.delete_channel is None),
+        ),
+        stages=(
+            Stage("no_channel", _no_channel),
+            Stage("ignored_channel", _raw_channel, enabled=_has_ignored_ids),
+            Stage("nsfw", _raw_nsfw),
+            Stage("cog_disabled", _raw_cog_disabled, is_async=True),
+        ),
+    ),
+    FilterChain(
+        "bulk_delete",
+        static=(
+            ("disabled", lambda settings: not settings.deletion),
+            ("no_channel", lambda settings: settings.bulk_delete_channel is None),
+        ),
+        stages=(
+            Stage("no_channel", _no_channel),
+            Stage("ignored_channel", _raw_channel, enabled=_has_ignored_ids),
+            Stage("nsfw", _raw_nsfw),
+            Stage("cog_disabled", _raw_cog_disabled, is_async=True),
+        ),
+    ),
+    FilterChain(
+        "edit",
+        static=(
+            ("disabled", lambda settings: not settings.editing),
+            ("no_channel", lambda settings: settings.edit_channel is None),
+        ),
+        stages=(
+            # most edit events are embeds being unfurled, the content is the same
+            Stage("unchanged", _edit_unchanged),
+            Stage("no_channel", _no_channel),
+            Stage("ignored_author", _message_author),
+            Stage("ignored_channel", _message_channel, enabled=_has_ignored_ids),
+            Stage("nsfw", _message_nsfw),
+            Stage("cog_disabled", _message_cog_disabled, is_async=True),
+            Stage("command", _message_command, is_async=True),
+        ),
+    ),
+    FilterChain(
+        "join",
+        static=(
+            ("disabled", lambda settings: not settings.joining),
+            ("no_channel", lambda settings: settings.join_channel is None),
+        ),
+        stages=(
+            Stage("no_channel", _no_channel),
+            Stage("cog_disabled", _member_cog_disabled, is_async=True),
+        ),
+    ),
+    FilterChain(
+        "leave",
+        static=(
+            ("disabled", lambda settings: not settings.leaving),
+            ("no_channel", lambda settings: settings.leave_channel is None),
+        ),
+        stages=(
+            Stage("no_channel", _no_channel),
+            Stage("cog_disabled", _member_cog_disabled, is_async=True),
+        ),
+    ),
+    FilterChain(
+        "boost",
+        static=(
+            ("disabled", lambda settings: not settings.boosting),
+            ("no_channel", lambda settings: settings.boost_channel is None),
+        ),
+        # routed through the shared EventRouter, which drops updates without a boost
+        # change and checks the cog is enabled in the guild
+        stages=(Stage("no_channel", _no_channel),),
+    ),
+)
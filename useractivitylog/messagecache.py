@@ -0,0 +1,125 @@
+import sys
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import discord
+
+# rough size of a record and its bookkeeping, excluding the strings it holds
+RECORD_OVERHEAD = 200
+
+
+class CachedMessage:
+    """Compact copy of a message, enough to log it once it is deleted"""
+
+    __slots__ = ("id", "author_id", "channel_id", "content", "attachments", "size")
+
+    def __init__(self, message: discord.Message):
+        self.id: int = message.id
+        self.author_id: int = message.author.id
+        self.channel_id: int = message.channel.id
+        self.update(message)
+
+    def update(self, message: discord.Message):
+        self.content: str = message.content
+        self.attachments: Tuple[str, ...] = tuple(a.url for a in message.attachments)
+        self.size = (
+            RECORD_OVERHEAD
+            + sys.getsizeof(self.content)
+            + sum(sys.getsizeof(url) for url in self.attachments)
+        )
+
+    @property
+    def created_at(self) -> datetime:
+        # creation time is part of the snowflake, no need to store it
+        return discord.utils.snowflake_time(self.id)
+
+
+class _GuildStore:
+    __slots__ = ("messages", "size")
+
+    def __init__(self):
+        self.messages: "OrderedDict[int, CachedMessage]" = OrderedDict()
+        self.size = 0
+
+
+class MessageStore:
+    """LRU store of compact message records, bounded by bytes per guild
+
+    Used to show the content of deleted messages that have already been
+    evicted from discord.py's own message cache.
+    """
+
+    def __init__(self, max_bytes: int = 2 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._guilds: Dict[int, _GuildStore] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return sum(len(store.messages) for store in self._guilds.values())
+
+    @property
+    def size(self) -> int:
+        """Approximate memory used by all records in bytes"""
+        return sum(store.size for store in self._guilds.values())
+
+    def add(self, message: discord.Message):
+        """Store a message, or update it if it is already stored"""
+        if not self.max_bytes:
+            return
+        store = self._guilds.get(message.guild.id)
+        if store is None:
+            store = self._guilds[message.guild.id] = _GuildStore()
+        record = store.messages.get(message.id)
+        if record is None:
+            record = store.messages[message.id] = CachedMessage(message)
+        else:
+            store.size -= record.size
+            record.update(message)
+            store.messages.move_to_end(message.id)
+        store.size += record.size
+        while store.size > self.max_bytes and len(store.messages) > 1:
+            _, evicted = store.messages.popitem(last=False)
+            store.size -= evicted.size
+
+    def get(self, guild_id: int, message_id: int) -> Optional[CachedMessage]:
+        store = self._guilds.get(guild_id)
+        return store.messages.get(message_id) if store else None
+
+    def pop(self, guild_id: int, message_id: int) -> Optional[CachedMessage]:
+        """Remove a record and return it, counting hits and misses"""
+        store = self._guilds.get(guild_id)
+        record = store.messages.pop(message_id, None) if store else None
+        if record is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            store.size -= record.size
+        return record
+
+    def discard(self, guild_id: int, message_id: int):
+        """Remove a record without counting it as a lookup"""
+        store = self._guilds.get(guild_id)
+        if store and (record := store.messages.pop(message_id, None)):
+            store.size -= record.size
+
+    def clear_guild(self, guild_id: int):
+        self._guilds.pop(guild_id, None)
+
+    def delete_author(self, author_id: int) -> int:
+        """Remove every record of a user's messages, returns how many were removed"""
+        removed = 0
+        for store in self._guilds.values():
+            for message_id in [m.id for m in store.messages.values() if m.author_id == author_id]:
+                store.size -= store.messages.pop(message_id).size
+                removed += 1
+        return removed
+
+    def resize(self, max_bytes: int):
+        """Change the per-guild limit, evicting the oldest records if needed"""
+        self.max_bytes = max_bytes
+        for store in self._guilds.values():
+            while store.size > max_bytes and store.messages:
+                _, evicted = store.messages.popitem(last=False)
+                store.size -= evicted.size
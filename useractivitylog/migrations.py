@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from copy import deepcopy
+from typing import Any, Callable, Dict, Optional
+
+from redbot.core.config import Config
+
+from .settings import DEFAULT_GUILD
+
+log = logging.getLogger("red.ukfur-cogs.useractivitylog.migrations")
+
+# guilds written concurrently, and how often progress is saved
+BATCH_SIZE = 50
+
+# a step gets a guild's stored data and returns the keys to change, or None to leave it,
+# keys changed to None are cleared so they follow their registered default
+Step = Callable[[dict], Optional[Dict[str, Any]]]
+
+
+class Migration:
+    """A versioned change to every guild's data
+
+    Steps must give the same result when run again on data they already
+    changed, since an interrupted migration resumes from its last saved
+    batch and may see some guilds twice.
+    """
+
+    __slots__ = ("version", "description", "step")
+
+    def __init__(self, version: int, description: str, step: Step):
+        self.version = version
+        self.description = description
+        self.step = step
+
+
+def _split_channel(data: dict) -> Optional[dict]:
+    channel = data.get("channel")
+    if not channel:
+        return None
+    changes = {
+        key: channel
+        for key in (
+            "delete_channel",
+            "edit_channel",
+            "bulk_delete_channel",
+            "join_channel",
+            "leave_channel",
+        )
+    }
+    changes["channel"] = None
+    return changes
+
+
+MIGRATIONS = (Migration(2, "Copy channel to channel types", _split_channel),)
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+async def _migrate_batch(config: Config, migration: Migration, batch, all_guilds):
+    writes = []
+    changed = 0
+    for guild_id in batch:
+        changes = migration.step(all_guilds[guild_id])
+        if changes is None:
+            continue
+        changed += 1
+        data = all_guilds[guild_id]
+        group = config.guild_from_id(guild_id)
+        # only the changed keys are written, the others keep following their defaults
+        for key, value in changes.items():
+            if value is None:
+                writes.append(group.get_attr(key).clear())
+                if key in DEFAULT_GUILD:
+                    data[key] = deepcopy(DEFAULT_GUILD[key])
+                else:
+                    data.pop(key, None)
+            else:
+                writes.append(group.get_attr(key).set(value))
+                data[key] = value
+    await asyncio.gather(*writes)
+    return changed
+
+
+async def migrate(config: Config, all_guilds: Dict[int, dict]) -> Dict[int, dict]:
+    """Run pending migrations, resuming one that was interrupted
+
+    `all_guilds` is updated in place and returned, so the caller can warm
+    its caches from it without reading Config again.
+    """
+    version = await config.config_version() or 1
+    resume_after = await config.migration_guild()
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+        log.info("Updating config to version %s: %s", migration.version, migration.description)
+        guild_ids = sorted(all_guilds)
+        if resume_after is not None:
+            log.info("Resuming after guild %s", resume_after)
+            guild_ids = [guild_id for guild_id in guild_ids if guild_id > resume_after]
+        changed = 0
+        for start in range(0, len(guild_ids), BATCH_SIZE):
+            batch = guild_ids[start:start + BATCH_SIZE]
+            changed += await _migrate_batch(config, migration, batch, all_guilds)
+            await config.migration_guild.set(batch[-1])
+        await config.config_version.set(migration.version)
+        await config.migration_guild.clear()
+        resume_after = None
+        version = migration.version
+        log.info("Config updated to version %s, %s guilds changed", version, changed)
+    return all_guilds
@@ -0,0 +1,124 @@
+from copy import deepcopy
+from typing import Dict
+
+DEFAULT_GUILD = {
+    "delete_channel": None,
+    "edit_channel": None,
+    "bulk_delete_channel": None,
+    "join_channel": None,
+    "leave_channel": None,
+    "boost_channel": None,
+    "deletion": True,
+    "editing": True,
+    "joining": True,
+    "leaving": True,
+    "boosting": True,
+    "save_bulk": False,
+    "bulk_format": "text",
+    "bulk_compress": False,
+    "archive_days": 7,
+    "archive_rows": 50000,
+    "archive_attachments": False,
+    "burst_threshold": 10,
+    "burst_window": 60,
+    "burst_interval": 5,
+    "edit_window": 10,
+    "ignore_nsfw": False,
+    "ignored_channels": [],
+    "ignored_users": [],
+    "ignored_categories": [],
+    "ignored_roles": [],
+    "allowed_bots": [],
+}
+
+# stored as JSON lists in Config, held as sets in the snapshot
+ID_SET_KEYS = (
+    "ignored_channels",
+    "ignored_users",
+    "ignored_categories",
+    "ignored_roles",
+    "allowed_bots",
+)
+
+
+class GuildSettings:
+    """Snapshot of a single guild's logging settings
+
+    Attributes mirror the registered guild defaults so listeners can read
+    them synchronously instead of awaiting Config for every value.
+    ID lists are held as frozensets for constant time membership checks.
+    """
+
+    __slots__ = tuple(DEFAULT_GUILD) + ("version",)
+
+    def __init__(self, data: dict = None):
+        data = data or {}
+        # bumped on every in-place update, so derived caches know to rebuild
+        self.version = 0
+        for key, default in DEFAULT_GUILD.items():
+            value = data.get(key, default)
+            if key in ID_SET_KEYS:
+                value = frozenset(value)
+            else:
+                value = deepcopy(value)
+            setattr(self, key, value)
+
+    def ignores_channel(self, channel) -> bool:
+        """Whether messages in this channel or its category are ignored"""
+        return (
+            channel.id in self.ignored_channels
+            or getattr(channel, "category_id", None) in self.ignored_categories
+        )
+
+    def ignores_author(self, author) -> bool:
+        """Whether messages by this user are ignored
+
+        Bots are ignored unless they are allowed, members are ignored
+        by id or by any of their roles.
+        """
+        if author.id in self.ignored_users:
+            return True
+        if author.bot:
+            return author.id not in self.allowed_bots
+        # member._roles is a list of role ids, users outside the guild have none
+        roles = getattr(author, "_roles", None)
+        return bool(roles) and not self.ignored_roles.isdisjoint(roles)
+
+    def __repr__(self):
+        return "<GuildSettings {}>".format(
+            " ".join(f"{key}={getattr(self, key)!r}" for key in self.__slots__)
+        )
+
+
+class SettingsCache:
+    """In-memory per-guild settings, loaded once and kept in sync by commands"""
+
+    def __init__(self):
+        self._guilds: Dict[int, GuildSettings] = {}
+        self._default = GuildSettings()
+
+    def load(self, all_guilds: Dict[int, dict]):
+        """Replace the cache with the output of `Config.all_guilds()`"""
+        self._guilds = {
+            guild_id: GuildSettings(data) for guild_id, data in all_guilds.items()
+        }
+
+    def get(self, guild_id: int) -> GuildSettings:
+        """Get settings for a guild, falling back to the defaults
+
+        The returned object must be treated as read-only, use `update` to change it.
+        """
+        return self._guilds.get(guild_id, self._default)
+
+    def set(self, guild_id: int, data: dict):
+        """Replace a guild's snapshot with freshly read Config data"""
+        self._guilds[guild_id] = GuildSettings(data)
+
+    def update(self, guild_id: int, **changes):
+        """Update values of a guild's snapshot in place"""
+        settings = self._guilds.get(guild_id)
+        if settings is None:
+            settings = self._guilds[guild_id] = GuildSettings()
+        for key, value in changes.items():
+            setattr(settings, key, value)
+        settings.version += 1
@@ -0,0 +1,47 @@
+from pathlib import Path
+
+from redbot.core.i18n import Translator
+from redbot.core.utils import chat_formatting as chat
+from ukfurcore.i18n import StringTable
+
+_ = Translator("MessagesLog", __file__)
+
+
+def embed_strings() -> dict:
+    """Strings used in log embeds, translated by `StringTable` once per locale"""
+    return {
+        "message_deleted": _("Message deleted"),
+        "old_message_deleted": _("Old message deleted"),
+        "multiple_deleted": _("Multiple messages deleted"),
+        "messages_removed": _("{} messages removed"),
+        "messages_saved": _("{} messages saved to file above"),
+        "message_edited": _("Message edited"),
+        "no_text": chat.inline(_("No text")),
+        "attachments": _("Attachments"),
+        "attachment": _("[{0.filename}]({0.url}) ([Cached]({0.proxy_url}))"),
+        "archived": _("{} (archived copy attached)"),
+        "footer": _("ID: {} • Sent at"),
+        "channel": _("Channel"),
+        "now": _("Now"),
+        "edited_to": _("Edited to"),
+        "edits": _("Edits"),
+        "view_message": _("[View message]({})"),
+        "user_joined": _("User Joined"),
+        "joined_description": chat.inline(_("User has joined the server")),
+        "user_left": _("User Left"),
+        "left_description": chat.inline(_("User has left the server")),
+        "user_boosted": _("User Boosted"),
+        "boosted_description": chat.inline(_("User has boosted the server")),
+        "user_unboosted": _("User Stopped Boosting"),
+        "unboosted_description": chat.inline(_("User has stopped boosting the server")),
+        "users_joined": _("Users Joined"),
+        "users_joined_description": _("{} users have joined the server"),
+        "users_left": _("Users Left"),
+        "users_left_description": _("{} users have left the server"),
+        "burst_member": _("<@{id}> {name} • account age {age}"),
+        "age_now": _("now"),
+        "and_more": _("...and {} more"),
+    }
+
+
+STRINGS = StringTable(Path(__file__).parent / "locales", embed_strings)
@@ -0,0 +1,199 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Iterator, Optional, Set
+
+import discord
+
+# listener name -> gateway event recorded by it
+EVENTS = (
+    "message",
+    "message_delete",
+    "raw_message_delete",
+    "raw_bulk_message_delete",
+    "message_edit",
+    "member_join",
+    "member_remove",
+    "member_update",
+)
+
+# the low 22 bits of a snowflake are worker, process and sequence numbers
+SNOWFLAKE_LOW_BITS = 0x3FFFFF
+
+
+class Sanitizer:
+    """Removes personal data from recorded events, consistently within a trace
+
+    Guild, channel and message IDs keep their timestamp bits, so ordering
+    survives, and their low bits are replaced by a salted hash. User and
+    role IDs are hashed whole, the creation time of an account would
+    identify its owner. Message content is replaced by filler of the same
+    length, keeping a leading command prefix so command detection behaves
+    the same on replay.
+    """
+
+    def __init__(self, salt: bytes = None):
+        self.salt = salt or os.urandom(16)
+
+    def id(self, snowflake: Optional[int]) -> Optional[int]:
+        if snowflake is None:
+            return None
+        digest = hashlib.blake2b(
+            snowflake.to_bytes(8, "big"), key=self.salt, digest_size=4
+        ).digest()
+        return snowflake & ~SNOWFLAKE_LOW_BITS | int.from_bytes(digest, "big") & SNOWFLAKE_LOW_BITS
+
+    def ids(self, snowflakes) -> list:
+        return [self.id(snowflake) for snowflake in snowflakes]
+
+    def user_id(self, snowflake: int) -> int:
+        """A user or role ID replaced by a salted hash, keeping nothing of it"""
+        digest = hashlib.blake2b(
+            snowflake.to_bytes(8, "big"), key=self.salt, digest_size=8, person=b"user"
+        ).digest()
+        return int.from_bytes(digest, "big") >> 1
+
+    def user_ids(self, snowflakes) -> list:
+        return [self.user_id(snowflake) for snowflake in snowflakes]
+
+    @staticmethod
+    def content(content: str, prefixes=()) -> str:
+        if not content:
+            return ""
+        prefix = next((p for p in prefixes if content.startswith(p)), "")
+        # keep word boundaries, the length of words is all a diff depends on
+        filler = "".join(" " if char.isspace() else "x" for char in content[len(prefix):])
+        return prefix + filler
+
+
+class TraceRecorder:
+    """Records the gateway events the cog listens to as sanitized NDJSON
+
+    Listeners are only registered while recording, so the cog pays nothing
+    when no trace is being taken. Files ending in `.gz` are compressed.
+    """
+
+    def __init__(self, bot, path: Path, *, guild_ids: Set[int] = None, prefixes=("!",)):
+        self.bot = bot
+        self.path = path
+        self.guild_ids = guild_ids or set()
+        self.prefixes = tuple(prefixes)
+        self.sanitizer = Sanitizer()
+        self.events = 0
+        self._file = None
+        self._started = 0.0
+        self._listeners = {}
+
+    def start(self):
+        opener = gzip.open if self.path.suffix == ".gz" else open
+        self._file = opener(self.path, "wt", encoding="utf-8")
+        self._started = time.monotonic()
+        for event in EVENTS:
+            listener = getattr(self, f"_on_{event}")
+            self._listeners[event] = listener
+            self.bot.add_listener(listener, f"on_{event}")
+
+    def stop(self):
+        for event, listener in self._listeners.items():
+            self.bot.remove_listener(listener, f"on_{event}")
+        self._listeners = {}
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _records(self, guild_id: Optional[int]) -> bool:
+        return guild_id is not None and (not self.guild_ids or guild_id in self.guild_ids)
+
+    def _write(self, event: str, **fields):
+        fields["at"] = round(time.monotonic() - self._started, 6)
+        fields["event"] = event
+        self._file.write(json.dumps(fields, separators=(",", ":")) + "\n")
+        self.events += 1
+
+    def _message(self, message: discord.Message) -> dict:
+        s = self.sanitizer
+        author = message.author
+        return {
+            "guild": s.id(message.guild.id),
+            "channel": s.id(message.channel.id),
+            "category": s.id(getattr(message.channel, "category_id", None)),
+            "nsfw": getattr(message.channel, "nsfw", False),
+            "id": s.id(message.id),
+            "author": s.user_id(author.id),
+            "bot": author.bot,
+            "roles": s.user_ids(getattr(author, "_roles", ())),
+            "content": s.content(message.content, self.prefixes),
+            "attachments": len(message.attachments),
+        }
+
+    def _member(self, member: discord.Member) -> dict:
+        s = self.sanitizer
+        return {
+            "guild": s.id(member.guild.id),
+            "id": s.user_id(member.id),
+            "bot": member.bot,
+            "roles": s.user_ids(member._roles),
+            "premium_since": member.premium_since.isoformat() if member.premium_since else None,
+        }
+
+    async def _on_message(self, message: discord.Message):
+        if message.guild and self._records(message.guild.id):
+            self._write("message", **self._message(message))
+
+    async def _on_message_delete(self, message: discord.Message):
+        if message.guild and self._records(message.guild.id):
+            self._write("message_delete", **self._message(message))
+
+    async def _on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        if self._records(payload.guild_id):
+            s = self.sanitizer
+            self._write(
+                "raw_message_delete",
+                guild=s.id(payload.guild_id),
+                channel=s.id(payload.channel_id),
+                id=s.id(payload.message_id),
+                cached=payload.cached_message is not None,
+            )
+
+    async def _on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        if self._records(payload.guild_id):
+            s = self.sanitizer
+            self._write(
+                "raw_bulk_message_delete",
+                guild=s.id(payload.guild_id),
+                channel=s.id(payload.channel_id),
+                ids=sorted(s.ids(payload.message_ids)),
+                cached=[self._message(m) for m in payload.cached_messages],
+            )
+
+    async def _on_message_edit(self, before: discord.Message, after: discord.Message):
+        if after.guild and self._records(after.guild.id):
+            self._write(
+                "message_edit",
+                before=self._message(before),
+                after=self._message(after),
+            )
+
+    async def _on_member_join(self, member: discord.Member):
+        if self._records(member.guild.id):
+            self._write("member_join", **self._member(member))
+
+    async def _on_member_remove(self, member: discord.Member):
+        if self._records(member.guild.id):
+            self._write("member_remove", **self._member(member))
+
+    async def _on_member_update(self, before: discord.Member, after: discord.Member):
+        if self._records(after.guild.id):
+            self._write("member_update", before=self._member(before), after=self._member(after))
+
+
+def read_trace(path: Path) -> Iterator[dict]:
+    """Events of a recorded trace in order"""
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
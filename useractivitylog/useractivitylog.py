@@ -1,15 +1,49 @@
+import asyncio
 import logging
+import sqlite3
+from pathlib import Path
 from datetime import datetime, timezone
-from pprint import pformat
+from collections import Counter
 from typing import Union
 
 import discord
 from redbot.core import commands
 from redbot.core.config import Config
-from redbot.core.i18n import Translator, cog_i18n, set_contextual_locales_from_guild
+from redbot.core.data_manager import cog_data_path
+from redbot.core.i18n import Translator, cog_i18n
 from redbot.core.utils import AsyncIter
 from redbot.core.utils import chat_formatting as chat
 from redbot.core.utils.menus import DEFAULT_CONTROLS, menu
+from ukfurcore import (
+    BOOST_KINDS,
+    LogDispatcher,
+    MemberEventKind,
+    MemberUpdate,
+    MetricsExporter,
+    MetricsRegistry,
+    OutboxJournal,
+    OverflowPolicy,
+    Priority,
+    breaker_status,
+    shared_locales,
+    shared_router,
+    shared_scheduler,
+    shared_webhooks,
+    timed,
+)
+
+from .archive import MessageArchive
+from .attachments import AttachmentArchive
+from .bursts import BurstDetector
+from .commanddetect import CommandDetector
+from .dump import FORMATS, DumpWriter
+from .edits import EditDebouncer, PendingEdit, render_diff, word_diff
+from .filters import CHAINS, FilterPipeline
+from .messagecache import MessageStore
+from .migrations import migrate
+from .settings import DEFAULT_GUILD, SettingsCache
+from .strings import STRINGS
+from .trace import TraceRecorder
 
 
 def is_channel_set(channel_type: str):
@@ -18,23 +52,26 @@ def is_channel_set(channel_type: str):
     async def predicate(ctx):
         if ctx.guild:
             return ctx.guild.get_channel(
-                await getattr(ctx.cog.config.guild(ctx.guild), f"{channel_type}_channel")()
+                getattr(ctx.cog.settings.get(ctx.guild.id), f"{channel_type}_channel")
             )
 
     return commands.check(predicate)
 
 
-async def ignore_config_add(config: list, item):
-    """Adds item to provided config list"""
-    if item.id in config:
-        config.remove(item.id)
+def ignore_config_add(config: set, item_id: int):
+    """Adds item to provided config set, or removes it if already present"""
+    if item_id in config:
+        config.remove(item_id)
     else:
-        config.append(item.id)
+        config.add(item_id)
 
 
 log = logging.getLogger("red.ukfur-cogs.useractivitylog")
 _ = Translator("MessagesLog", __file__)
 
+# seconds between archive retention passes
+ARCHIVE_PRUNE_INTERVAL = 60
+
 
 @cog_i18n(_)
 class UserActivityLog(commands.Cog):
@@ -47,54 +84,380 @@ class UserActivityLog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.config = Config.get_conf(self, identifier=0x91daa6db0fac6024f04fd179)
-        default_guild = {
-            "delete_channel": None,
-            "edit_channel": None,
-            "bulk_delete_channel": None,
-            "join_channel": None,
-            "leave_channel": None,
-            "boost_channel": None,
-            "deletion": True,
-            "editing": True,
-            "joining": True,
-            "leaving": True,
-            "boosting": True,
-            "save_bulk": False,
-            "ignore_nsfw": False,
-            "ignored_channels": [],
-            "ignored_users": [],
-            "ignored_categories": [],
-        }
-        self.config.register_guild(**default_guild)
+        self.config.register_global(
+            batch_window=1.0,
+            queue_size=500,
+            overflow_policy="priority",
+            message_cache_size=2 * 1024 * 1024,
+            archive_enabled=False,
+            archive_interval=500,
+            attachments_enabled=False,
+            attachments_max_size=8 * 1024 * 1024,
+            attachments_days=7,
+            metrics_file=None,
+            metrics_port=None,
+            webhooks=False,
+            outbox_enabled=False,
+            outbox_max_size=64 * 1024 * 1024,
+            migration_guild=None,
+        )
+        self.config.register_guild(**DEFAULT_GUILD)
+        self.settings = SettingsCache()
+        self.metrics = MetricsRegistry("useractivitylog_")
+        self._describe_metrics()
+        self.exporter = MetricsExporter(self.metrics)
+        self.scheduler = shared_scheduler(bot)
+        self.dispatcher = LogDispatcher(
+            summary_factory=self._dropped_summary,
+            metrics=self.metrics,
+            scheduler=self.scheduler,
+        )
+        self.webhooks = shared_webhooks(bot)
+        self.command_detector = CommandDetector(bot)
+        self.filters = FilterPipeline(self, CHAINS, metrics=self.metrics)
+        self.message_store = MessageStore()
+        self.bursts = BurstDetector(self._burst_summary)
+        self.edits = EditDebouncer(self._log_edit)
+        self.archive = None
+        self._archive_pruner = None
+        self.attachments = None
+        self.outbox = None
+        self._restorer = None
+        self.recorder = None
+        self._warmer = None
+        self.locales = shared_locales(bot)
+        self.strings = STRINGS
+        self.router = shared_router(bot)
+        self.router.subscribe(
+            self, "member_update", self.message_user_boost, accepts=self._logs_boosts
+        )
 
-    async def initialize(self):  # sourcery skip: last-if-guard
+    async def initialize(self):
         """
-        Update configs if required
+        Update configs if required and warm up caches
+
+        Versions are listed in `migrations.MIGRATIONS`
+        """
+        # anything logged from here on goes behind what the journal still holds
+        if await self.config.outbox_enabled():
+            await self._open_outbox()
+        all_guilds = await migrate(self.config, await self.config.all_guilds())
+        self.settings.load(all_guilds)
+        for guild_id in all_guilds:
+            self._compile_filters(guild_id)
+        self._warmer = asyncio.create_task(self._warm_up(list(all_guilds)))
+        self.dispatcher.window = await self.config.batch_window()
+        self.dispatcher.max_queue = await self.config.queue_size()
+        self.dispatcher.policy = OverflowPolicy(await self.config.overflow_policy())
+        self.message_store.resize(await self.config.message_cache_size())
+        self.strings.load()
+        if await self.config.archive_enabled():
+            await self._open_archive()
+        if await self.config.webhooks():
+            self._open_webhooks()
+        if await self.config.attachments_enabled():
+            await self._open_attachments()
+        if metrics_file := await self.config.metrics_file():
+            self.exporter.start_file(Path(metrics_file))
+        if metrics_port := await self.config.metrics_port():
+            try:
+                await self.exporter.start_http(metrics_port)
+            except OSError as e:
+                log.error("Unable to serve metrics on port %s: %s", metrics_port, e)
+
+    def cog_unload(self):
+        self.router.unsubscribe(self)
+        if self._warmer is not None:
+            self._warmer.cancel()
+        if self._restorer is not None:
+            self._restorer.cancel()
+        if self.recorder is not None:
+            self.recorder.stop()
+        asyncio.create_task(self._shutdown())
+
+    async def _shutdown(self):
+        # summaries go through the dispatcher, so they are closed first
+        await self.bursts.close()
+        await self.edits.close()
+        await self.dispatcher.close()
+        await self.webhooks.close(self.qualified_name)
+        if self.outbox is not None:
+            await self._close_outbox()
+        if self.archive is not None:
+            await self._close_archive()
+        if self.attachments is not None:
+            await self._close_attachments()
+        await self.exporter.close()
+
+    def _compile_filters(self, guild_id: int):
+        settings = self.settings.get(guild_id)
+        for event in self.filters.chains:
+            self.filters.compiled(event, guild_id, settings)
+
+    async def _warm_up(self, guild_ids):
+        """Load prefixes and locales of configured guilds once the bot is ready
+
+        Filter chains are compiled during initialize, prefixes and locales
+        need the guild objects, which only exist once the bot is connected.
+        """
+        await self.bot.wait_until_red_ready()
+        guilds = [
+            guild
+            for guild_id in guild_ids
+            if (guild := self.bot.get_guild(guild_id)) and self._logs_any(guild_id)
+        ]
+        for start in range(0, len(guilds), 50):
+            batch = guilds[start:start + 50]
+            await asyncio.gather(
+                *(self.command_detector.prefixes(guild) for guild in batch),
+                *(self.locales.get(guild) for guild in batch),
+            )
+        log.debug("Warmed up caches for %s guilds", len(guilds))
+
+    def _logs_any(self, guild_id: int) -> bool:
+        settings = self.settings.get(guild_id)
+        return any(
+            (
+                settings.delete_channel,
+                settings.edit_channel,
+                settings.bulk_delete_channel,
+                settings.join_channel,
+                settings.leave_channel,
+                settings.boost_channel,
+            )
+        )
+
+    def _describe_metrics(self):
+        metrics = self.metrics
+        metrics.describe("listener_seconds", "histogram", "Time spent in each listener")
+        metrics.describe(
+            "filter_seconds", "histogram", "Time spent resolving settings and filters"
+        )
+        metrics.describe("send_seconds", "histogram", "Time spent sending log messages")
+        metrics.describe(
+            "slot_wait_seconds", "histogram", "Time log messages waited for their guild's turn"
+        )
+        metrics.describe("sends_total", "counter", "Log messages sent by outcome")
+        metrics.describe("sent_embeds_total", "counter", "Log embeds sent by outcome")
+        metrics.describe("listener_exits_total", "counter", "Events not logged by reason")
+        metrics.describe("listener_logged_total", "counter", "Events that passed all filters")
+        metrics.describe("queue_depth", "gauge", "Log embeds waiting to be sent")
+        metrics.describe("dropped_total", "counter", "Log embeds dropped from full queues")
+        metrics.describe(
+            "skipped_total", "counter", "Log embeds skipped for channels that keep failing"
+        )
+        metrics.describe("edits_pending", "gauge", "Edited messages waiting to be logged")
+        metrics.describe("edits_coalesced_total", "counter", "Edits logged with an earlier edit")
+        metrics.add_collector(self._collect_metrics)
+
+    def _collect_metrics(self):
+        for (event, reason), count in self.filters.rejected.items():
+            yield "listener_exits_total", {"event": event, "reason": reason}, count
+        for event, count in self.filters.passed.items():
+            yield "listener_logged_total", {"event": event}, count
+        yield "queue_depth", {}, self.dispatcher.depth
+        yield "dropped_total", {}, self.dispatcher.dropped
+        yield "skipped_total", {}, self.dispatcher.skipped
+        yield "edits_pending", {}, len(self.edits)
+        yield "edits_coalesced_total", {}, self.edits.coalesced
+
+    async def _strings(self, guild: discord.Guild):
+        """Embed strings in the guild's locale"""
+        return self.strings.get(await self.locales.get(guild))
+
+    async def _burst_summary(self, guild: discord.Guild, kind: str, members, window: float):
+        """Log a single summary for members collected during a join or leave burst"""
+        settings = self.settings.get(guild.id)
+        logchannel = guild.get_channel(
+            settings.join_channel if kind == "join" else settings.leave_channel
+        )
+        if not logchannel:
+            return
 
-        Versions:
-        1. Copy channel to channel types
+        strings = await self._strings(guild)
+        if kind == "join":
+            title = strings.users_joined
+            description = strings.users_joined_description.format(len(members))
+            colour = discord.Colour.green()
+        else:
+            title = strings.users_left
+            description = strings.users_left_description.format(len(members))
+            colour = discord.Colour.red()
+
+        lines = []
+        length = len(description)
+        for member in members:
+            line = strings.burst_member.format(
+                id=member.id,
+                name=chat.escape(member.name, formatting=True),
+                age=chat.humanize_timedelta(timedelta=member.account_age) or strings.age_now,
+            )
+            # leave room for the "and more" line within the description limit
+            if length + len(line) > 1900:
+                lines.append(strings.and_more.format(len(members) - len(lines)))
+                break
+            lines.append(line)
+            length += len(line) + 1
+
+        embed = discord.Embed(
+            title=title,
+            description=description + "\n\n" + "\n".join(lines),
+            timestamp=datetime.now(timezone.utc),
+            colour=colour,
+        )
+        members_list = chat.text_to_file(
+            "\n".join(
+                f"{m.id}\t{m.name}\t{m.created_at.isoformat()}\t{m.seen_at.isoformat()}"
+                for m in members
+            ),
+            filename=f"{kind}-{guild.id}.tsv",
+        )
+        self.dispatcher.enqueue(logchannel, embed, file=members_list)
+
+    async def _open_archive(self):
+        self.archive = MessageArchive(
+            cog_data_path(self) / "archive.sqlite3",
+            interval=await self.config.archive_interval() / 1000,
+        )
+        await self.archive.open()
+        self._archive_pruner = asyncio.create_task(self._prune_archive())
+
+    async def _close_archive(self):
+        archive, self.archive = self.archive, None
+        if self._archive_pruner is not None:
+            self._archive_pruner.cancel()
+            self._archive_pruner = None
+        await archive.close()
+
+    async def _prune_archive(self):
+        """Enforce each guild's archive retention a batch at a time"""
+        while True:
+            await asyncio.sleep(ARCHIVE_PRUNE_INTERVAL)
+            try:
+                for guild_id in await self.archive.counts():
+                    settings = self.settings.get(guild_id)
+                    # keep going while whole batches are deleted, yielding in between
+                    while await self.archive.prune(
+                            guild_id,
+                            max_age=settings.archive_days * 86400,
+                            max_rows=settings.archive_rows,
+                    ) >= 500:
+                        await asyncio.sleep(0)
+            except sqlite3.Error:
+                log.exception("Unable to prune the message archive")
+
+    async def _open_outbox(self):
+        self.outbox = OutboxJournal(
+            cog_data_path(self) / "outbox", max_bytes=await self.config.outbox_max_size()
+        )
+        entries = await self.outbox.open()
+        self.dispatcher.journal = self.outbox
+        self.dispatcher.held = True
+        self._restorer = asyncio.create_task(self._restore_outbox(entries))
+
+    async def _restore_outbox(self, entries):
+        """Send what was not delivered before the last shutdown, once channels are known"""
+        await self.bot.wait_until_red_ready()
+        self.dispatcher.restore(entries, self.bot.get_channel)
+        if entries:
+            log.info("Restored %s undelivered log entries", len(entries))
+
+    async def _close_outbox(self):
+        outbox, self.outbox = self.outbox, None
+        if self._restorer is not None:
+            self._restorer.cancel()
+            self._restorer = None
+        self.dispatcher.journal = None
+        if self.dispatcher.held:
+            self.dispatcher.restore((), self.bot.get_channel)
+        await outbox.close()
+
+    def _open_webhooks(self):
+        self.webhooks.open(self.qualified_name)
+        self.dispatcher.webhooks = self.webhooks
+
+    async def _close_webhooks(self):
+        self.dispatcher.webhooks = None
+        await self.webhooks.close(self.qualified_name)
+
+    async def _open_attachments(self):
+        self.attachments = AttachmentArchive(
+            cog_data_path(self) / "attachments",
+            max_size=await self.config.attachments_max_size(),
+            max_age=await self.config.attachments_days() * 86400,
+        )
+        await self.attachments.start()
+
+    async def _close_attachments(self):
+        attachments, self.attachments = self.attachments, None
+        await attachments.close()
+
+    def _archived_files(self, guild: discord.Guild, message_id: int, attachment_ids=None):
+        """Archived copies of a message's attachments that can be uploaded to the guild
+
+        Only attachments in `attachment_ids` are returned if given, the others
+        are kept for a later deletion of the message.
         """
-        if not await self.config.config_version() or await self.config.config_version() < 1:
-            log.info("Updating config from version 1 to version 2")
-            for guild, data in (await self.config.all_guilds()).items():
-                if data["channel"]:
-                    log.info(f"Updating config for guild {guild}")
-                    guild_config = self.config.guild_from_id(guild)
-                    await guild_config.delete_channel.set(data["channel"])
-                    await guild_config.edit_channel.set(data["channel"])
-                    await guild_config.bulk_delete_channel.set(data["channel"])
-                    await guild_config.join_channel.set(data["channel"])
-                    await guild_config.leave_channel.set(data["channel"])
-                    await guild_config.channel.clear()
-            log.info("Config updated to version 2")
-            await self.config.config_version.set(2)
+        if self.attachments is None:
+            return {}
+        if attachment_ids is None:
+            stored = self.attachments.pop(message_id)
+        else:
+            stored = self.attachments.get(message_id)
+        return {
+            a.attachment_id: a
+            for a in stored
+            if a.size <= guild.filesize_limit
+            and (attachment_ids is None or a.attachment_id in attachment_ids)
+            and a.path.is_file()
+        }
+
+    def _enqueue_with_files(
+            self, logchannel, embed, archived: dict, priority: Priority, event_id: str
+    ):
+        """Queue an embed with the first archived file, further files follow it"""
+        files = []
+        for stored in archived.values():
+            try:
+                files.append(stored.file())
+            except FileNotFoundError:
+                # pruned since it was looked up, the embed is logged without it
+                pass
+        self.dispatcher.enqueue(
+            logchannel,
+            embed,
+            file=files[0] if files else None,
+            priority=priority,
+            event_id=event_id,
+        )
+        for file in files[1:]:
+            self.dispatcher.enqueue(logchannel, file=file, priority=priority)
+
+    @staticmethod
+    def _dropped_summary(dropped: Counter) -> discord.Embed:
+        """Embed sent in place of log entries dropped from a full queue"""
+        embed = discord.Embed(
+            title=_("Log entries dropped"),
+            description=_(
+                "{} log entries were dropped while this channel was rate limited"
+            ).format(sum(dropped.values())),
+            timestamp=datetime.now(timezone.utc),
+            colour=discord.Colour.dark_grey(),
+        )
+        for title, count in dropped.most_common(25):
+            embed.add_field(name=title or _("Other"), value=str(count))
+        return embed
 
     def format_help_for_context(self, ctx: commands.Context) -> str:
         pre_processed = super().format_help_for_context(ctx)
         return f"{pre_processed}\n\n**Version**: {self.__version__}"
 
-    async def red_delete_data_for_user(self, **kwargs):
-        return
+    async def red_delete_data_for_user(self, *, requester, user_id: int):
+        self.message_store.delete_author(user_id)
+        if self.archive is not None:
+            await self.archive.delete_author(user_id)
+        if self.attachments is not None:
+            await self.attachments.delete_author(user_id)
 
     @commands.group(autohelp=True, aliases=["useractivitieslog", "useractivitylogs"])
     @commands.admin_or_permissions(manage_guild=True)
@@ -102,6 +465,535 @@ class UserActivityLog(commands.Cog):
         """Manage message logging"""
         pass
 
+    @useractivitylog.command(name="batchwindow")
+    @commands.is_owner()
+    async def batch_window(self, ctx, seconds: float = None):
+        """Set how long log embeds are gathered before being sent
+
+        Embeds for the same channel are packed up to 10 per message
+        Shows the current window and queue statistics if no value provided
+        Use 0 to send as soon as possible
+        """
+        if seconds is None:
+            dispatcher = self.dispatcher
+            sizes = ", ".join(
+                f"{size}: {count}" for size, count in sorted(dispatcher.batch_sizes.items())
+            )
+            await ctx.send(
+                chat.box(
+                    _(
+                        "Window: {window}s\n"
+                        "Queued embeds: {depth} (max {max_depth})\n"
+                        "Messages sent: {messages}\n"
+                        "Embeds sent: {embeds}\n"
+                        "Failed sends: {failed}\n"
+                        "Dropped embeds: {dropped}\n"
+                        "Batch sizes: {sizes}"
+                    ).format(
+                        window=dispatcher.window,
+                        depth=dispatcher.depth,
+                        max_depth=dispatcher.max_depth,
+                        messages=dispatcher.sent_messages,
+                        embeds=dispatcher.sent_embeds,
+                        failed=dispatcher.failed,
+                        dropped=dispatcher.dropped,
+                        sizes=sizes or "-",
+                    )
+                )
+            )
+            return
+        seconds = max(0.0, min(seconds, 10.0))
+        await self.config.batch_window.set(seconds)
+        self.dispatcher.window = seconds
+        await ctx.tick()
+
+    @useractivitylog.command(name="stats")
+    @commands.is_owner()
+    async def stats(self, ctx):
+        """Show how many events each filter stage rejected
+
+        Also shows how long listeners take, how log sends ended
+        and how long each cog took to handle routed events
+        """
+        filters = self.filters
+        lines = []
+        for event in filters.chains:
+            rejected = {
+                stage: count for (name, stage), count in filters.rejected.items() if name == event
+            }
+            if not rejected and not filters.passed[event]:
+                continue
+            lines.append(
+                _("{event}: {count} logged").format(event=event, count=filters.passed[event])
+            )
+            lines.extend(
+                f"  {stage:<16} {count}"
+                for stage, count in sorted(rejected.items(), key=lambda item: -item[1])
+            )
+        for labels, histogram in sorted(self.metrics.histograms("listener_seconds").items()):
+            lines.append(
+                _(
+                    "{listener}: {count} calls, p50 {p50:.2f}ms, p99 {p99:.2f}ms, "
+                    "{average:.2f}ms average"
+                ).format(
+                    listener=dict(labels)["listener"],
+                    count=histogram.count,
+                    p50=histogram.quantile(0.5) * 1000,
+                    p99=histogram.quantile(0.99) * 1000,
+                    average=histogram.average * 1000,
+                )
+            )
+        for labels, count in sorted(self.metrics.counters("sends_total").items()):
+            lines.append(
+                _("sends {outcome}: {count}").format(
+                    outcome=dict(labels)["outcome"], count=int(count)
+                )
+            )
+        if self.dispatcher.webhooks is not None:
+            lines.append(
+                _("webhooks: {count} channels, {sends} sends, {lost} deleted").format(
+                    count=len(self.webhooks), sends=self.webhooks.sends, lost=self.webhooks.lost
+                )
+            )
+        for subscription in self.router.subscriptions():
+            lines.append(
+                _(
+                    "{name}: {calls} handled, {skipped} skipped, "
+                    "{average:.2f}ms average, {slowest:.2f}ms slowest"
+                ).format(
+                    name=subscription.name,
+                    calls=subscription.calls,
+                    skipped=subscription.skipped,
+                    average=subscription.average * 1000,
+                    slowest=subscription.slowest * 1000,
+                )
+            )
+        if not lines:
+            await ctx.send(chat.info(_("No events seen yet")))
+            return
+        for page in chat.pagify("\n".join(lines)):
+            await ctx.send(chat.box(page))
+
+    @useractivitylog.command(name="webhooks")
+    @commands.is_owner()
+    async def webhooks_toggle(self, ctx):
+        """Toggle posting logs through a webhook in each log channel
+
+        Webhooks have their own rate limits, so logs keep flowing during purges and raids
+        Channels where the bot cannot manage webhooks are logged to as before
+        """
+        enabled = self.dispatcher.webhooks is None
+        await self.config.webhooks.set(enabled)
+        if enabled:
+            self._open_webhooks()
+        else:
+            await self._close_webhooks()
+        state = _("enabled") if enabled else _("disabled")
+        await ctx.send(chat.info(_("Webhook delivery {}").format(state)))
+
+    @useractivitylog.command(name="backlog")
+    @commands.is_owner()
+    async def backlog(self, ctx, count: int = 15):
+        """Show the guilds with the most log entries waiting to be sent
+
+        Also shows how long their sends waited for a turn
+        and how busy each shard is
+        """
+        backlog = self.dispatcher.guild_backlog()
+        shares = {share.guild_id: share for share in self.scheduler.guilds()}
+        guild_ids = sorted(
+            set(backlog) | set(shares),
+            key=lambda guild_id: backlog.get(guild_id, (0, 0.0)),
+            reverse=True,
+        )
+        lines = [
+            _("Shard {shard}: {waiting} guilds waiting, {in_flight} sends").format(
+                shard=shard_id, waiting=waiting, in_flight=in_flight
+            )
+            for shard_id, (waiting, in_flight) in self.scheduler.shards().items()
+        ]
+        for guild_id in guild_ids[:max(1, count)]:
+            depth, oldest = backlog.get(guild_id, (0, 0.0))
+            share = shares.get(guild_id)
+            guild = self.bot.get_guild(guild_id)
+            lines.append(
+                _(
+                    "{guild}: {depth} queued, oldest {oldest:.1f}s, "
+                    "{waiting} sends waiting, {in_flight} sending, {average:.2f}s average wait"
+                ).format(
+                    guild=guild.name if guild else guild_id,
+                    depth=depth,
+                    oldest=oldest,
+                    waiting=len(share.waiters) if share else 0,
+                    in_flight=share.in_flight if share else 0,
+                    average=share.average_wait if share else 0.0,
+                )
+            )
+        if not guild_ids:
+            lines.append(_("Nothing is waiting to be sent"))
+        for page in chat.pagify("\n".join(lines)):
+            await ctx.send(chat.box(page))
+
+    @useractivitylog.command(name="cachesize")
+    @commands.is_owner()
+    async def cache_size(self, ctx, kilobytes: int = None):
+        """Set how much message content is kept per server
+
+        Kept messages can still be shown after discord.py's own cache has forgotten them
+        Shows current usage if no size provided, use 0 to disable
+        """
+        if kilobytes is None:
+            store = self.message_store
+            await ctx.send(
+                chat.box(
+                    _(
+                        "Limit per server: {limit} KiB\n"
+                        "Messages kept: {count}\n"
+                        "Memory used: {size} KiB\n"
+                        "Deletions found: {hits}\n"
+                        "Deletions missed: {misses}"
+                    ).format(
+                        limit=store.max_bytes // 1024,
+                        count=len(store),
+                        size=store.size // 1024,
+                        hits=store.hits,
+                        misses=store.misses,
+                    )
+                )
+            )
+            return
+        max_bytes = max(0, kilobytes) * 1024
+        await self.config.message_cache_size.set(max_bytes)
+        self.message_store.resize(max_bytes)
+        await ctx.tick()
+
+    @useractivitylog.group(name="archive")
+    async def archive_group(self, ctx):
+        """Manage the message archive
+
+        When enabled, messages are kept on disk so deletions can be shown days later
+        """
+        pass
+
+    @archive_group.command(name="toggle")
+    @commands.is_owner()
+    async def archive_toggle(self, ctx):
+        """Toggle the message archive for all servers"""
+        enabled = self.archive is None
+        await self.config.archive_enabled.set(enabled)
+        if enabled:
+            await self._open_archive()
+        else:
+            await self._close_archive()
+        state = _("enabled") if enabled else _("disabled")
+        await ctx.send(chat.info(_("Message archive {}").format(state)))
+
+    @archive_group.command(name="interval")
+    @commands.is_owner()
+    async def archive_interval(self, ctx, milliseconds: int):
+        """Set how often archived messages are written to disk"""
+        milliseconds = max(50, min(milliseconds, 60000))
+        await self.config.archive_interval.set(milliseconds)
+        if self.archive is not None:
+            self.archive.interval = milliseconds / 1000
+        await ctx.tick()
+
+    @archive_group.command(name="retention")
+    async def archive_retention(self, ctx, days: int, messages: int = None):
+        """Set how long and how many messages are archived for this server
+
+        Use 0 for no limit
+        """
+        changes = {"archive_days": max(0, days)}
+        if messages is not None:
+            changes["archive_rows"] = max(0, messages)
+        guild = self.config.guild(ctx.guild)
+        for key, value in changes.items():
+            await getattr(guild, key).set(value)
+        self.settings.update(ctx.guild.id, **changes)
+        await ctx.tick()
+
+    @archive_group.command(name="stats")
+    @commands.is_owner()
+    async def archive_stats(self, ctx):
+        """Show message archive statistics"""
+        if self.archive is None:
+            await ctx.send(chat.info(_("Message archive is disabled")))
+            return
+        counts = await self.archive.counts()
+        await ctx.send(
+            chat.box(
+                _(
+                    "Messages archived: {total}\n"
+                    "This server: {guild}\n"
+                    "Messages written: {written} in {flushes} batches\n"
+                    "Messages pruned: {pruned}"
+                ).format(
+                    total=sum(counts.values()),
+                    guild=counts.get(ctx.guild.id, 0),
+                    written=self.archive.rows_written,
+                    flushes=self.archive.flushes,
+                    pruned=self.archive.pruned,
+                )
+            )
+        )
+
+    @useractivitylog.group(name="attachments")
+    async def attachments_group(self, ctx):
+        """Manage archiving of attachments
+
+        Attachments are downloaded when posted, so deleted messages can be logged with them
+        Identical files are stored once
+        """
+        pass
+
+    @attachments_group.command(name="toggle")
+    @commands.is_owner()
+    async def attachments_toggle(self, ctx):
+        """Toggle archiving of attachments for all servers"""
+        enabled = self.attachments is None
+        await self.config.attachments_enabled.set(enabled)
+        if enabled:
+            await self._open_attachments()
+        else:
+            await self._close_attachments()
+        state = _("enabled") if enabled else _("disabled")
+        await ctx.send(chat.info(_("Attachment archive {}").format(state)))
+
+    @attachments_group.command(name="server")
+    async def attachments_server(self, ctx):
+        """Toggle archiving of attachments posted in this server"""
+        archive_attachments = not self.settings.get(ctx.guild.id).archive_attachments
+        await self.config.guild(ctx.guild).archive_attachments.set(archive_attachments)
+        self.settings.update(ctx.guild.id, archive_attachments=archive_attachments)
+        state = _("enabled") if archive_attachments else _("disabled")
+        await ctx.send(chat.info(_("Attachment archiving for this server {}").format(state)))
+
+    @attachments_group.command(name="limits")
+    @commands.is_owner()
+    async def attachments_limits(self, ctx, megabytes: float, days: int):
+        """Set the largest attachment archived and how long files are kept
+
+        Use 0 days to keep files forever
+        """
+        max_size = int(max(0.0, min(megabytes, 100.0)) * 1024 * 1024)
+        days = max(0, days)
+        await self.config.attachments_max_size.set(max_size)
+        await self.config.attachments_days.set(days)
+        if self.attachments is not None:
+            self.attachments.max_size = max_size
+            self.attachments.max_age = days * 86400
+        await ctx.tick()
+
+    @attachments_group.command(name="stats")
+    @commands.is_owner()
+    async def attachments_stats(self, ctx):
+        """Show attachment archive statistics"""
+        attachments = self.attachments
+        if attachments is None:
+            await ctx.send(chat.info(_("Attachment archive is disabled")))
+            return
+        files, size = await attachments.usage()
+        await ctx.send(
+            chat.box(
+                _(
+                    "Files stored: {files} ({size} KiB)\n"
+                    "Downloads stored: {stored}\n"
+                    "Downloads already stored: {deduplicated}\n"
+                    "Skipped by size or type: {skipped}\n"
+                    "Failed: {failed}\n"
+                    "Dropped from a full queue: {dropped}\n"
+                    "Waiting: {pending}\n"
+                    "Files pruned: {pruned}"
+                ).format(
+                    files=files,
+                    size=size // 1024,
+                    stored=attachments.stored,
+                    deduplicated=attachments.deduplicated,
+                    skipped=attachments.skipped,
+                    failed=attachments.failed,
+                    dropped=attachments.dropped,
+                    pending=attachments.pending,
+                    pruned=attachments.pruned,
+                )
+            )
+        )
+
+    @useractivitylog.group(name="outbox")
+    @commands.is_owner()
+    async def outbox_group(self, ctx):
+        """Manage the outbox keeping unsent logs on disk
+
+        Logs still waiting to be sent when the bot stops are sent after it starts again
+        """
+        pass
+
+    @outbox_group.command(name="toggle")
+    async def outbox_toggle(self, ctx):
+        """Toggle keeping unsent logs on disk"""
+        enabled = self.outbox is None
+        await self.config.outbox_enabled.set(enabled)
+        if enabled:
+            await self._open_outbox()
+        else:
+            await self._close_outbox()
+        state = _("enabled") if enabled else _("disabled")
+        await ctx.send(chat.info(_("Outbox {}").format(state)))
+
+    @outbox_group.command(name="size")
+    async def outbox_size(self, ctx, megabytes: int):
+        """Set how much disk space unsent logs may take
+
+        Logs past the limit are still sent, but lost if the bot stops first
+        """
+        max_bytes = max(1, megabytes) * 1024 * 1024
+        await self.config.outbox_max_size.set(max_bytes)
+        if self.outbox is not None:
+            self.outbox.max_bytes = max_bytes
+        await ctx.tick()
+
+    @outbox_group.command(name="stats")
+    async def outbox_stats(self, ctx):
+        """Show outbox statistics"""
+        if self.outbox is None:
+            await ctx.send(chat.info(_("Outbox is disabled")))
+            return
+        counts = self.outbox.counts()
+        await ctx.send(
+            chat.box(
+                _(
+                    "Logs written: {appended}\n"
+                    "Logs done with: {acked}\n"
+                    "Logs waiting: {pending}\n"
+                    "Duplicates dropped: {duplicates}\n"
+                    "Not written, disk limit reached: {full}\n"
+                    "Disk used: {size} of {limit} KiB in {segments} segments\n"
+                    "Writes: {syncs}, segments removed: {compacted}"
+                ).format(
+                    size=self.outbox.size // 1024,
+                    limit=self.outbox.max_bytes // 1024,
+                    **counts,
+                )
+            )
+        )
+
+    @useractivitylog.group(name="metrics")
+    @commands.is_owner()
+    async def metrics_group(self, ctx):
+        """Export listener metrics in the Prometheus text format"""
+        pass
+
+    @metrics_group.command(name="file")
+    async def metrics_file(self, ctx, *, path: str = None):
+        """Write metrics to a file every 15 seconds
+
+        Relative paths are placed in the cog's data folder
+        If path is not specified, then the file will no longer be written"""
+        if path is None:
+            self.exporter.stop_file()
+            await self.config.metrics_file.clear()
+            await ctx.tick()
+            return
+        path = cog_data_path(self) / path
+        if not path.parent.is_dir():
+            await ctx.send(chat.error(_("Folder {} does not exist").format(path.parent)))
+            return
+        await self.config.metrics_file.set(str(path))
+        self.exporter.start_file(path)
+        await ctx.send(chat.info(_("Metrics are written to {}").format(chat.inline(str(path)))))
+
+    @metrics_group.command(name="port")
+    async def metrics_port(self, ctx, port: int = None):
+        """Serve metrics over HTTP on a local port
+
+        The endpoint only listens on 127.0.0.1, at `/metrics`
+        If port is not specified, then the endpoint will be stopped"""
+        if port is None:
+            await self.exporter.stop_http()
+            await self.config.metrics_port.clear()
+            await ctx.tick()
+            return
+        try:
+            await self.exporter.start_http(port)
+        except OSError as e:
+            await ctx.send(chat.error(_("Unable to listen on port {}: {}").format(port, e)))
+            return
+        await self.config.metrics_port.set(port)
+        await ctx.send(
+            chat.info(_("Metrics are served at http://127.0.0.1:{}/metrics").format(port))
+        )
+
+    @useractivitylog.group(name="trace")
+    @commands.is_owner()
+    async def trace_group(self, ctx):
+        """Record sanitized gateway events for offline replay
+
+        Traces are replayed with `python -m benchmarks.replay`
+        """
+        pass
+
+    @trace_group.command(name="start")
+    async def trace_start(self, ctx, *guilds: int):
+        """Start recording events of the given server IDs, or of all servers
+
+        IDs are hashed and message content is replaced, only lengths are kept
+        """
+        if self.recorder is not None:
+            await ctx.send(chat.warning(_("A trace is already being recorded")))
+            return
+        folder = cog_data_path(self) / "traces"
+        folder.mkdir(exist_ok=True)
+        path = folder / f"trace-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.ndjson.gz"
+        self.recorder = TraceRecorder(
+            self.bot,
+            path,
+            guild_ids=set(guilds),
+            prefixes=sorted(await self.bot.get_valid_prefixes(), key=len, reverse=True),
+        )
+        self.recorder.start()
+        await ctx.send(chat.info(_("Recording a trace to {}").format(chat.inline(str(path)))))
+
+    @trace_group.command(name="stop")
+    async def trace_stop(self, ctx):
+        """Stop recording events"""
+        if self.recorder is None:
+            await ctx.send(chat.warning(_("No trace is being recorded")))
+            return
+        recorder, self.recorder = self.recorder, None
+        recorder.stop()
+        await ctx.send(
+            chat.info(
+                _("Recorded {count} events to {path}").format(
+                    count=recorder.events, path=chat.inline(str(recorder.path))
+                )
+            )
+        )
+
+    @useractivitylog.command(name="overflow")
+    @commands.is_owner()
+    async def overflow(self, ctx, policy: str, queue_size: int = None):
+        """Set what happens when a log channel falls too far behind
+
+        Policies:
+        `oldest` - drop the oldest queued log entries
+        `priority` - drop edits before joins and leaves, and those before deletions
+        `summarize` - drop the oldest entries and post a summary of what was dropped
+
+        Queue size is the maximum number of entries waiting per log channel
+        """
+        try:
+            policy = OverflowPolicy(policy.lower())
+        except ValueError:
+            await ctx.send_help()
+            return
+        await self.config.overflow_policy.set(policy.value)
+        self.dispatcher.policy = policy
+        if queue_size is not None:
+            queue_size = max(10, queue_size)
+            await self.config.queue_size.set(queue_size)
+            self.dispatcher.max_queue = queue_size
+        await ctx.tick()
+
     @useractivitylog.group(name="channel")
     async def set_channel(self, ctx):
         """Set the channels for logs"""
@@ -113,6 +1005,7 @@ class UserActivityLog(commands.Cog):
 
         If channel is not specified, then logging will be disabled"""
         await self.config.guild(ctx.guild).delete_channel.set(channel.id if channel else None)
+        self.settings.update(ctx.guild.id, delete_channel=channel.id if channel else None)
         await ctx.tick()
 
     @set_channel.command(name="edit")
@@ -121,6 +1014,7 @@ class UserActivityLog(commands.Cog):
 
         If channel is not specified, then logging will be disabled"""
         await self.config.guild(ctx.guild).edit_channel.set(channel.id if channel else None)
+        self.settings.update(ctx.guild.id, edit_channel=channel.id if channel else None)
         await ctx.tick()
 
     @set_channel.command(name="bulk")
@@ -129,6 +1023,7 @@ class UserActivityLog(commands.Cog):
 
         If channel is not specified, then logging will be disabled"""
         await self.config.guild(ctx.guild).bulk_delete_channel.set(channel.id if channel else None)
+        self.settings.update(ctx.guild.id, bulk_delete_channel=channel.id if channel else None)
         await ctx.tick()
 
     @set_channel.command(name="join")
@@ -137,6 +1032,7 @@ class UserActivityLog(commands.Cog):
 
         If channel is not specified, then logging will be disabled"""
         await self.config.guild(ctx.guild).join_channel.set(channel.id if channel else None)
+        self.settings.update(ctx.guild.id, join_channel=channel.id if channel else None)
         await ctx.tick()
 
     @set_channel.command(name="leave")
@@ -145,6 +1041,7 @@ class UserActivityLog(commands.Cog):
 
         If channel is not specified, then logging will be disabled"""
         await self.config.guild(ctx.guild).leave_channel.set(channel.id if channel else None)
+        self.settings.update(ctx.guild.id, leave_channel=channel.id if channel else None)
         await ctx.tick()
 
     @set_channel.command(name="boost")
@@ -153,6 +1050,7 @@ class UserActivityLog(commands.Cog):
 
         If channel is not specified, then logging will be disabled"""
         await self.config.guild(ctx.guild).boost_channel.set(channel.id if channel else None)
+        self.settings.update(ctx.guild.id, boost_channel=channel.id if channel else None)
         await ctx.tick()
 
     @set_channel.command(name="all")
@@ -166,24 +1064,35 @@ class UserActivityLog(commands.Cog):
         await self.config.guild(ctx.guild).join_channel.set(channel.id if channel else None)
         await self.config.guild(ctx.guild).leave_channel.set(channel.id if channel else None)
         await self.config.guild(ctx.guild).boost_channel.set(channel.id if channel else None)
+        self.settings.update(
+            ctx.guild.id,
+            delete_channel=channel.id if channel else None,
+            edit_channel=channel.id if channel else None,
+            bulk_delete_channel=channel.id if channel else None,
+            join_channel=channel.id if channel else None,
+            leave_channel=channel.id if channel else None,
+            boost_channel=channel.id if channel else None,
+        )
         await ctx.tick()
 
     @set_channel.command(name="settings")
     async def channel_settings(self, ctx):
         """View current channels settings"""
+        guild_settings = self.settings.get(ctx.guild.id)
         settings = []
-        if delete := await self.config.guild(ctx.guild).delete_channel():
-            settings.append(_("Deletion: {}").format(ctx.guild.get_channel(delete)))
-        if edit := await self.config.guild(ctx.guild).edit_channel():
-            settings.append(_("Edit: {}").format(ctx.guild.get_channel(edit)))
-        if bulk := await self.config.guild(ctx.guild).bulk_delete_channel():
-            settings.append(_("Bulk deletion: {}").format(ctx.guild.get_channel(bulk)))
-        if join := await self.config.guild(ctx.guild).join_channel():
-            settings.append(_("Join: {}").format(ctx.guild.get_channel(join)))
-        if leave := await self.config.guild(ctx.guild).leave_channel():
-            settings.append(_("Leave: {}").format(ctx.guild.get_channel(leave)))
-        if boost := await self.config.guild(ctx.guild).boost_channel():
-            settings.append(_("Boost: {}").format(ctx.guild.get_channel(boost)))
+        for label, channel_id in (
+                (_("Deletion: {}"), guild_settings.delete_channel),
+                (_("Edit: {}"), guild_settings.edit_channel),
+                (_("Bulk deletion: {}"), guild_settings.bulk_delete_channel),
+                (_("Join: {}"), guild_settings.join_channel),
+                (_("Leave: {}"), guild_settings.leave_channel),
+                (_("Boost: {}"), guild_settings.boost_channel),
+        ):
+            if channel_id:
+                settings.append(
+                    label.format(ctx.guild.get_channel(channel_id))
+                    + breaker_status(self.dispatcher.breaker(channel_id))
+                )
         await ctx.send("\n".join(settings) or chat.info(_("No channels set")))
 
     @useractivitylog.group()
@@ -195,89 +1104,181 @@ class UserActivityLog(commands.Cog):
     @is_channel_set("delete")
     async def mess_delete(self, ctx):
         """Toggle logging of message deletion"""
-        deletion = self.config.guild(ctx.guild).deletion
-        await deletion.set(not await deletion())
-        state = _("enabled") if await self.config.guild(ctx.guild).deletion() else _("disabled")
+        deletion = not self.settings.get(ctx.guild.id).deletion
+        await self.config.guild(ctx.guild).deletion.set(deletion)
+        self.settings.update(ctx.guild.id, deletion=deletion)
+        state = _("enabled") if deletion else _("disabled")
         await ctx.send(chat.info(_("Message deletion logging {}").format(state)))
 
     @toggle.command(name="edit")
     @is_channel_set("edit")
     async def mess_edit(self, ctx):
         """Toggle logging of message editing"""
-        editing = self.config.guild(ctx.guild).editing
-        await editing.set(not await editing())
-        state = _("enabled") if await self.config.guild(ctx.guild).editing() else _("disabled")
+        editing = not self.settings.get(ctx.guild.id).editing
+        await self.config.guild(ctx.guild).editing.set(editing)
+        self.settings.update(ctx.guild.id, editing=editing)
+        state = _("enabled") if editing else _("disabled")
         await ctx.send(chat.info(_("Message editing logging {}").format(state)))
 
     @toggle.command(name="bulk", alias=["savebulk"])
     @is_channel_set("bulk_delete")
     async def mess_bulk(self, ctx):
         """Toggle saving of bulk message deletion"""
-        save_bulk = self.config.guild(ctx.guild).save_bulk
-        await save_bulk.set(not await save_bulk())
-        state = _("enabled") if await self.config.guild(ctx.guild).save_bulk() else _("disabled")
+        save_bulk = not self.settings.get(ctx.guild.id).save_bulk
+        await self.config.guild(ctx.guild).save_bulk.set(save_bulk)
+        self.settings.update(ctx.guild.id, save_bulk=save_bulk)
+        state = _("enabled") if save_bulk else _("disabled")
         await ctx.send(chat.info(_("Bulk message removal saving {}").format(state)))
 
+    @toggle.command(name="compress", aliases=["gzip"])
+    @is_channel_set("bulk_delete")
+    async def mess_bulk_compress(self, ctx):
+        """Toggle gzip compression of saved bulk message removals"""
+        bulk_compress = not self.settings.get(ctx.guild.id).bulk_compress
+        await self.config.guild(ctx.guild).bulk_compress.set(bulk_compress)
+        self.settings.update(ctx.guild.id, bulk_compress=bulk_compress)
+        state = _("enabled") if bulk_compress else _("disabled")
+        await ctx.send(chat.info(_("Bulk message removal compression {}").format(state)))
+
     @toggle.command(name="join")
     @is_channel_set("join")
     async def mess_join(self, ctx):
         """Toggle logging of join message"""
-        joining = self.config.guild(ctx.guild).joining
-        await joining.set(not await joining())
-        state = _("enabled") if await self.config.guild(ctx.guild).joining() else _("disabled")
+        joining = not self.settings.get(ctx.guild.id).joining
+        await self.config.guild(ctx.guild).joining.set(joining)
+        self.settings.update(ctx.guild.id, joining=joining)
+        state = _("enabled") if joining else _("disabled")
         await ctx.send(chat.info(_("Join logging {}").format(state)))
 
     @toggle.command(name="leave")
     @is_channel_set("leave")
     async def mess_leave(self, ctx):
         """Toggle logging of leave message"""
-        leaving = self.config.guild(ctx.guild).leaving
-        await leaving.set(not await leaving())
-        state = _("enabled") if await self.config.guild(ctx.guild).leaving() else _("disabled")
+        leaving = not self.settings.get(ctx.guild.id).leaving
+        await self.config.guild(ctx.guild).leaving.set(leaving)
+        self.settings.update(ctx.guild.id, leaving=leaving)
+        state = _("enabled") if leaving else _("disabled")
         await ctx.send(chat.info(_("Leave logging {}").format(state)))
 
     @toggle.command(name="boost")
     @is_channel_set("boost")
     async def mess_leave(self, ctx):
         """Toggle logging of boost message"""
-        boosting = self.config.guild(ctx.guild).boosting
-        await boosting.set(not await boosting())
-        state = _("enabled") if await self.config.guild(ctx.guild).boosting() else _("disabled")
+        boosting = not self.settings.get(ctx.guild.id).boosting
+        await self.config.guild(ctx.guild).boosting.set(boosting)
+        self.settings.update(ctx.guild.id, boosting=boosting)
+        state = _("enabled") if boosting else _("disabled")
         await ctx.send(chat.info(_("Boost logging {}").format(state)))
 
     @toggle.command(name="nsfw")
     async def nsfw_ignore(self, ctx):
         """Toggle logging of nsfw messages"""
-        ignore_nsfw = self.config.guild(ctx.guild).ignore_nsfw
-        await ignore_nsfw.set(not await ignore_nsfw())
-        state = _("enabled") if await self.config.guild(ctx.guild).ignore_nsfw() else _("disabled")
+        ignore_nsfw = not self.settings.get(ctx.guild.id).ignore_nsfw
+        await self.config.guild(ctx.guild).ignore_nsfw.set(ignore_nsfw)
+        self.settings.update(ctx.guild.id, ignore_nsfw=ignore_nsfw)
+        state = _("enabled") if ignore_nsfw else _("disabled")
         await ctx.send(chat.info(_("Ignore nsfw logging {}").format(state)))
 
+    async def _save_id_sets(self, guild: discord.Guild, **id_sets):
+        """Write the ignore sets that changed to Config and update the snapshot"""
+        current = self.settings.get(guild.id)
+        changed = {
+            key: frozenset(ids)
+            for key, ids in id_sets.items()
+            if frozenset(ids) != getattr(current, key)
+        }
+        group = self.config.guild(guild)
+        for key, ids in changed.items():
+            await group.get_attr(key).set(sorted(ids))
+        self.settings.update(guild.id, **changed)
+
+    @useractivitylog.command(name="bulkformat")
+    async def bulk_format(self, ctx, fmt: str):
+        """Set the file format of saved bulk message removals
+
+        `text` - readable text, one block per message
+        `ndjson` - one JSON object per line, with attachment URLs and replies
+        """
+        fmt = fmt.lower()
+        if fmt not in FORMATS:
+            await ctx.send_help()
+            return
+        await self.config.guild(ctx.guild).bulk_format.set(fmt)
+        self.settings.update(ctx.guild.id, bulk_format=fmt)
+        await ctx.tick()
+
+    @useractivitylog.command(name="burst", aliases=["raid"])
+    async def burst(self, ctx, threshold: int, window: int = 60, interval: int = 5):
+        """Set when joins and leaves are logged as summaries
+
+        When `threshold` members join or leave within `window` seconds,
+        one summary is logged every `interval` seconds instead of one log per member
+        Logging per member resumes when the rate drops below half the threshold
+        Use a threshold of 0 to always log every member
+        """
+        changes = {
+            "burst_threshold": max(0, threshold),
+            "burst_window": max(1, window),
+            "burst_interval": max(1, interval),
+        }
+        guild = self.config.guild(ctx.guild)
+        for key, value in changes.items():
+            await getattr(guild, key).set(value)
+        self.settings.update(ctx.guild.id, **changes)
+        await ctx.tick()
+
+    @useractivitylog.command(name="editwindow")
+    async def edit_window(self, ctx, seconds: int):
+        """Set how long edits of a message are collected into one log entry
+
+        The entry is logged once the message has not been edited for `seconds`
+        and shows the text before the first edit and after the last
+        Use 0 to log every edit on its own
+        """
+        edit_window = max(0, min(seconds, 300))
+        await self.config.guild(ctx.guild).edit_window.set(edit_window)
+        self.settings.update(ctx.guild.id, edit_window=edit_window)
+        await ctx.tick()
+
     @useractivitylog.command()
     async def ignore(
             self,
             ctx,
-            *ignore: Union[discord.Member, discord.TextChannel, discord.CategoryChannel],
+            *ignore: Union[
+                discord.Member, discord.TextChannel, discord.CategoryChannel, discord.Role, int
+            ],
     ):
         """
         Manage message logging blocklist
 
         Shows blocklist if no arguments provided
-        You can ignore text channels, categories and members
+        You can ignore text channels, categories, roles and members
+        Raw IDs are treated as user IDs, so members who left can be ignored too
         If item is in blocklist, removes it
         """
+        guild_settings = self.settings.get(ctx.guild.id)
         if not ignore:
-            users = await self.config.guild(ctx.guild).ignored_users()
-            channels = await self.config.guild(ctx.guild).ignored_channels()
-            categories = await self.config.guild(ctx.guild).ignored_categories()
-            users = [ctx.guild.get_member(m).mention for m in users if ctx.guild.get_member(m)]
+            users = [
+                ctx.guild.get_member(m).mention
+                for m in guild_settings.ignored_users
+                if ctx.guild.get_member(m)
+            ]
             channels = [
-                ctx.guild.get_channel(m).mention for m in channels if ctx.guild.get_channel(m)
+                ctx.guild.get_channel(m).mention
+                for m in guild_settings.ignored_channels
+                if ctx.guild.get_channel(m)
             ]
             categories = [
-                ctx.guild.get_channel(m).mention for m in categories if ctx.guild.get_channel(m)
+                ctx.guild.get_channel(m).mention
+                for m in guild_settings.ignored_categories
+                if ctx.guild.get_channel(m)
             ]
-            if not any([users, channels, categories]):
+            roles = [
+                ctx.guild.get_role(m).mention
+                for m in guild_settings.ignored_roles
+                if ctx.guild.get_role(m)
+            ]
+            if not any([users, channels, categories, roles]):
                 await ctx.send(chat.info(_("Nothing is ignored")))
                 return
             users_pages = [
@@ -295,296 +1296,434 @@ class UserActivityLog(commands.Cog):
                 for page in chat.pagify("\n".join(categories), page_length=2048)
             ]
 
-            pages = users_pages + channels_pages + categories_pages
+            roles_pages = [
+                discord.Embed(title=_("Ignored roles"), description=page)
+                for page in chat.pagify("\n".join(roles), page_length=2048)
+            ]
+
+            pages = users_pages + channels_pages + categories_pages + roles_pages
             await menu(ctx, pages, DEFAULT_CONTROLS)
         else:
-            guild = self.config.guild(ctx.guild)
+            users = set(guild_settings.ignored_users)
+            channels = set(guild_settings.ignored_channels)
+            categories = set(guild_settings.ignored_categories)
+            roles = set(guild_settings.ignored_roles)
             for item in ignore:
                 if isinstance(item, discord.Member):
-                    async with guild.ignored_users() as ignored_users:
-                        await ignore_config_add(ignored_users, item)
+                    ignore_config_add(users, item.id)
                 elif isinstance(item, discord.TextChannel):
-                    async with guild.ignored_channels() as ignored_channels:
-                        await ignore_config_add(ignored_channels, item)
+                    ignore_config_add(channels, item.id)
                 elif isinstance(item, discord.CategoryChannel):
-                    async with guild.ignored_categories() as ignored_categories:
-                        await ignore_config_add(ignored_categories, item)
+                    ignore_config_add(categories, item.id)
+                elif isinstance(item, discord.Role):
+                    ignore_config_add(roles, item.id)
+                else:
+                    ignore_config_add(users, item)
+            await self._save_id_sets(
+                ctx.guild,
+                ignored_users=users,
+                ignored_channels=channels,
+                ignored_categories=categories,
+                ignored_roles=roles,
+            )
             await ctx.tick()
 
+    @useractivitylog.command(name="allowbot", aliases=["allowbots"])
+    async def allow_bot(self, ctx, *bots: discord.Member):
+        """
+        Manage bots whose messages are logged
+
+        Messages from bots are ignored, except for bots in this list
+        Shows the list if no arguments provided
+        If bot is in the list, removes it
+        """
+        guild_settings = self.settings.get(ctx.guild.id)
+        if not bots:
+            allowed = [
+                ctx.guild.get_member(m).mention
+                for m in guild_settings.allowed_bots
+                if ctx.guild.get_member(m)
+            ]
+            if not allowed:
+                await ctx.send(chat.info(_("All bots are ignored")))
+                return
+            pages = [
+                discord.Embed(title=_("Logged bots"), description=page)
+                for page in chat.pagify("\n".join(allowed), page_length=2048)
+            ]
+            await menu(ctx, pages, DEFAULT_CONTROLS)
+            return
+        allowed = set(guild_settings.allowed_bots)
+        for bot in bots:
+            if bot.bot:
+                ignore_config_add(allowed, bot.id)
+        await self._save_id_sets(ctx.guild, allowed_bots=allowed)
+        await ctx.tick()
+
+    """
+    This is our listener for locale changes, so log embeds follow them
+    """
+    @commands.Cog.listener("on_command_completion")
+    async def locale_changed(self, ctx: commands.Context):
+        self.locales.on_command_completion(ctx)
+
+    """
+    These are our listeners keeping copies of messages, so they can be shown once deleted
+    """
+    @commands.Cog.listener("on_message")
+    @timed("metrics", "listener_seconds", listener="message_stored")
+    async def message_stored(self, message: discord.Message):
+        if message.guild and self._stores_message(message):
+            self.message_store.add(message)
+            if self.archive is not None:
+                self.archive.add(message)
+            if (
+                    message.attachments
+                    and self.attachments is not None
+                    and self.settings.get(message.guild.id).archive_attachments
+            ):
+                self.attachments.submit(message)
+
+    @commands.Cog.listener("on_message_edit")
+    @timed("metrics", "listener_seconds", listener="message_store_edited")
+    async def message_store_edited(self, before: discord.Message, after: discord.Message):
+        if after.guild and before.content != after.content and self._stores_message(after):
+            self.message_store.add(after)
+            if self.archive is not None:
+                self.archive.add(after)
+
+    @commands.Cog.listener("on_guild_remove")
+    async def guild_left(self, guild: discord.Guild):
+        # deletions in a guild the bot left can no longer be logged
+        self.message_store.clear_guild(guild.id)
+        if self.archive is not None:
+            await self.archive.delete_guild(guild.id)
+
+    def _stores_message(self, message: discord.Message) -> bool:
+        """Whether a deletion of this message could be logged"""
+        settings = self.settings.get(message.guild.id)
+        return (
+                settings.deletion
+                and (settings.delete_channel or settings.bulk_delete_channel)
+                and not settings.ignores_channel(message.channel)
+                and not settings.ignores_author(message.author)
+        )
+
+    """
+    This is our listener for commands, so their messages are known when deleted
+    """
+    @commands.Cog.listener("on_command")
+    async def command_invoked(self, ctx: commands.Context):
+        if ctx.guild:
+            self.command_detector.remember(ctx.message, True)
+
     """
     This is our listener for members deleting messages
     """
     @commands.Cog.listener("on_message_delete")
+    @timed("metrics", "listener_seconds", listener="message_deleted")
     async def message_deleted(self, message: discord.Message):
         if not message.guild:
             return
-        if await self.bot.cog_disabled_in_guild(self, message.guild):
-            return
 
-        logchannel = message.guild.get_channel(
-            await self.config.guild(message.guild).delete_channel()
-        )
-        if not logchannel:
-            return
-
-        if (
-                message.channel.category
-                and message.channel.category.id
-                in await self.config.guild(message.guild).ignored_categories()
-        ):
-            return
-        if any(
-                [
-                    not await self.config.guild(message.guild).deletion(),
-                    (await self.bot.get_context(message)).command,
-                    message.channel.id in await self.config.guild(message.guild).ignored_channels(),
-                    message.author.id in await self.config.guild(message.guild).ignored_users(),
-                    message.author.bot,
-                    message.channel.nsfw and not logchannel.nsfw,
-                ]
+        settings = self.settings.get(message.guild.id)
+        logchannel = message.guild.get_channel(settings.delete_channel)
+        if not await self.filters.check(
+                "delete", message.guild.id, settings, logchannel, message
         ):
             return
 
-        await set_contextual_locales_from_guild(self.bot, message.guild)
+        strings = await self._strings(message.guild)
+        archived = self._archived_files(message.guild, message.id)
 
         embed = discord.Embed(
-            title=_("Message deleted"),
-            description=message.system_content or chat.inline(_("No text")),
+            title=strings.message_deleted,
+            description=message.system_content or strings.no_text,
             timestamp=message.created_at,
             color=discord.Colour.orange(),
         )
         if message.attachments:
             embed.add_field(
-                name=_("Attachments"),
+                name=strings.attachments,
                 value="\n".join(
-                    _("[{0.filename}]({0.url}) ([Cached]({0.proxy_url}))").format(a)
+                    strings.archived.format(strings.attachment.format(a))
+                    if a.id in archived
+                    else strings.attachment.format(a)
                     for a in message.attachments
                 ),
             )
 
         embed.set_author(name=message.author, icon_url=message.author.avatar_url)
-        embed.set_footer(text=_("ID: {} • Sent at").format(message.id))
-        embed.add_field(name=_("Channel"), value=message.channel.mention)
+        embed.set_footer(text=strings.footer.format(message.id))
+        embed.add_field(name=strings.channel, value=message.channel.mention)
 
-        try:
-            await logchannel.send(embed=embed)
-        except discord.Forbidden:
-            pass
+        self._enqueue_with_files(
+            logchannel, embed, archived, Priority.HIGH, f"delete:{message.id}"
+        )
 
     """
     This is our second listener for members deleting messages
     """
     @commands.Cog.listener("on_raw_message_delete")
+    @timed("metrics", "listener_seconds", listener="raw_message_deleted")
     async def raw_message_deleted(self, payload: discord.RawMessageDeleteEvent):
-        if payload.cached_message:
-            return
         if not payload.guild_id:
             return
-        if await self.bot.cog_disabled_in_guild_raw(self.qualified_name, payload.guild_id):
+        if payload.cached_message:
+            # logged by message_deleted, only our own copy has to go
+            self.message_store.discard(payload.guild_id, payload.message_id)
             return
 
+        record = self.message_store.pop(payload.guild_id, payload.message_id)
+
         guild = self.bot.get_guild(payload.guild_id)
         channel = self.bot.get_channel(payload.channel_id)
 
-        logchannel = guild.get_channel(await self.config.guild(guild).delete_channel())
-        if not logchannel:
-            return
-
-        if (
-                channel.category
-                and channel.category.id in await self.config.guild(guild).ignored_categories()
+        settings = self.settings.get(guild.id)
+        logchannel = guild.get_channel(settings.delete_channel)
+        if not await self.filters.check(
+                "raw_delete", guild.id, settings, logchannel, payload, channel
         ):
             return
 
-        if any(
-                [
-                    not await self.config.guild(guild).deletion(),
-                    channel.id in await self.config.guild(guild).ignored_channels(),
-                    channel.nsfw and not logchannel.nsfw,
-                ]
-        ):
-            return
+        if record is None and self.archive is not None:
+            record = await self.archive.get(guild.id, payload.message_id)
 
-        await set_contextual_locales_from_guild(self.bot, guild)
-        embed = discord.Embed(
-            title=_("Old message deleted"),
-            timestamp=discord.utils.snowflake_time(payload.message_id),
-            color=discord.Colour.orange(),
-        )
-        embed.set_footer(text=_("ID: {} • Sent at").format(payload.message_id))
-        embed.add_field(name=_("Channel"), value=channel.mention)
+        strings = await self._strings(guild)
+        archived = self._archived_files(guild, payload.message_id)
+        if record is None:
+            embed = discord.Embed(
+                title=strings.old_message_deleted,
+                timestamp=discord.utils.snowflake_time(payload.message_id),
+                color=discord.Colour.orange(),
+            )
+        else:
+            embed = discord.Embed(
+                title=strings.message_deleted,
+                description=record.content or strings.no_text,
+                timestamp=record.created_at,
+                color=discord.Colour.orange(),
+            )
+            if record.attachments:
+                embed.add_field(name=strings.attachments, value="\n".join(record.attachments))
+            author = guild.get_member(record.author_id) or self.bot.get_user(record.author_id)
+            if author:
+                embed.set_author(name=author, icon_url=author.avatar_url)
+            else:
+                embed.set_author(name=str(record.author_id))
+        if archived and (record is None or not record.attachments):
+            embed.add_field(
+                name=strings.attachments,
+                value="\n".join(strings.archived.format(a.filename) for a in archived.values()),
+            )
+        embed.set_footer(text=strings.footer.format(payload.message_id))
+        embed.add_field(name=strings.channel, value=channel.mention)
 
-        try:
-            await logchannel.send(embed=embed)
-        except discord.Forbidden:
-            pass
+        self._enqueue_with_files(
+            logchannel, embed, archived, Priority.HIGH, f"delete:{payload.message_id}"
+        )
 
     """
     This is our listener for members bulk deleting messages
     """
     @commands.Cog.listener("on_raw_bulk_message_delete")
+    @timed("metrics", "listener_seconds", listener="raw_bulk_message_deleted")
     async def raw_bulk_message_deleted(self, payload: discord.RawBulkMessageDeleteEvent):
-        # sourcery skip: comprehension-to-generator
         if not payload.guild_id:
             return
-        if await self.bot.cog_disabled_in_guild_raw(self.qualified_name, payload.guild_id):
-            return
+
+        # take our own copies of messages discord.py no longer has cached
+        cached_ids = {m.id for m in payload.cached_messages}
+        records = []
+        missing = []
+        for message_id in sorted(payload.message_ids):
+            if message_id in cached_ids:
+                self.message_store.discard(payload.guild_id, message_id)
+            elif record := self.message_store.pop(payload.guild_id, message_id):
+                records.append(record)
+            else:
+                missing.append(message_id)
 
         guild = self.bot.get_guild(payload.guild_id)
         channel = self.bot.get_channel(payload.channel_id)
 
-        logchannel = guild.get_channel(await self.config.guild(guild).bulk_delete_channel())
-        if not logchannel:
-            return
-
-        if (
-                channel.category
-                and channel.category.id in await self.config.guild(guild).ignored_categories()
-        ):
-            return
-        if any(
-                [
-                    not await self.config.guild(guild).deletion(),
-                    channel.id in await self.config.guild(guild).ignored_channels(),
-                    channel.nsfw and not logchannel.nsfw,
-                ]
+        settings = self.settings.get(guild.id)
+        logchannel = guild.get_channel(settings.bulk_delete_channel)
+        if not await self.filters.check(
+                "bulk_delete", guild.id, settings, logchannel, payload, channel
         ):
             return
 
-        await set_contextual_locales_from_guild(self.bot, guild)
-
-        save_bulk = await self.config.guild(guild).save_bulk()
-
-        messages_dump = None
-
-        if payload.cached_messages and save_bulk:
-            n = "\n"
-            messages_dump = chat.text_to_file(
-                "\n\n".join(
-                    [
-                        f"[{m.id}]\n"
-                        f"[Author]:     {m.author}\n"
-                        f"[Channel]:    {m.channel.name} ({m.channel.id})\n"
-                        f"[Created at]: {m.created_at}\n"
-                        f"[Content]:\n"
-                        f"{m.system_content}\n"
-                        f"[Embeds]:\n"
-                        f"{n.join([pformat(e.to_dict()) for e in m.embeds])}"
-                        async for m in AsyncIter(payload.cached_messages)
-                        if m.guild.id == guild.id
-                    ]
-                ),
-                filename=f"{guild.id}.txt",
+        strings = await self._strings(guild)
+
+        save_bulk = settings.save_bulk
+
+        messages_dump = []
+        saved = 0
+
+        if missing and save_bulk and self.archive is not None:
+            archived = await self.archive.get_many(guild.id, missing)
+            records = sorted([*records, *archived.values()], key=lambda record: record.id)
+
+        if (payload.cached_messages or records) and save_bulk:
+            writer = DumpWriter(
+                str(guild.id),
+                fmt=settings.bulk_format,
+                compress=settings.bulk_compress,
+                limit=guild.filesize_limit,
+            )
+            # our own copies and discord.py's cached messages are written together, oldest first
+            dump = sorted(
+                [(record.id, record, None) for record in records]
+                + [(m.id, None, m) for m in payload.cached_messages if m.guild.id == guild.id],
+                key=lambda entry: entry[0],
             )
+            async for message_id, record, message in AsyncIter(dump):
+                if message is not None:
+                    writer.write(message)
+                    continue
+                author = guild.get_member(record.author_id) or self.bot.get_user(record.author_id)
+                writer.write_cached(record, channel, author)
+            saved = writer.records
+            messages_dump = writer.files()
 
         embed = discord.Embed(
-            title=_("Multiple messages deleted"),
-            description=_("{} messages removed").format(len(payload.message_ids))
+            title=strings.multiple_deleted,
+            description=strings.messages_removed.format(len(payload.message_ids))
                         + (
-                            "\n" + _("{} messages saved to file above").format(len(payload.cached_messages))
-                            if payload.cached_messages and save_bulk
+                            "\n" + strings.messages_saved.format(saved)
+                            if saved
                             else ""
                         ),
             timestamp=datetime.now(timezone.utc),
             color=discord.Colour.orange(),
         )
 
-        embed.add_field(name=_("Channel"), value=channel.mention)
+        embed.add_field(name=strings.channel, value=channel.mention)
 
-        try:
-            await logchannel.send(embed=embed, file=messages_dump)
-        except discord.Forbidden:
-            pass
+        # the first part is attached to the embed, any further parts follow it
+        self.dispatcher.enqueue(
+            logchannel,
+            embed,
+            file=messages_dump[0] if messages_dump else None,
+            priority=Priority.HIGH,
+            event_id=f"bulk:{channel.id}:{min(payload.message_ids)}",
+        )
+        for part in messages_dump[1:]:
+            self.dispatcher.enqueue(logchannel, file=part, priority=Priority.HIGH)
 
     """
     This is our listener for members editing messages
     """
     @commands.Cog.listener("on_message_edit")
+    @timed("metrics", "listener_seconds", listener="message_edited")
     async def message_edited(self, before: discord.Message, after: discord.Message):
         if not before.guild:
             return
-        if await self.bot.cog_disabled_in_guild(self, before.guild):
-            return
 
-        logchannel = before.guild.get_channel(await self.config.guild(before.guild).edit_channel())
-        if not logchannel:
+        settings = self.settings.get(before.guild.id)
+        logchannel = before.guild.get_channel(settings.edit_channel)
+        if not await self.filters.check(
+                "edit", before.guild.id, settings, logchannel, before, after
+        ):
             return
 
-        if (
-                before.channel.category
-                and before.channel.category.id
-                in await self.config.guild(before.guild).ignored_categories()
-        ):
+        # quick successive edits are logged together once the message settles
+        if self.edits.add(logchannel, before, after, settings.edit_window):
             return
-        if any(
-                [
-                    not await self.config.guild(before.guild).editing(),
-                    (await self.bot.get_context(before)).command,
-                    before.channel.id in await self.config.guild(before.guild).ignored_channels(),
-                    before.author.id in await self.config.guild(before.guild).ignored_users(),
-                    before.content == after.content,
-                    before.author.bot,
-                    before.channel.nsfw and not logchannel.nsfw,
-                ]
-        ):
+        pending = PendingEdit(logchannel, before)
+        pending.after = after
+        pending.edits = 1
+        await self._log_edit(pending)
+
+    async def _log_edit(self, pending: PendingEdit):
+        """Log a message's edits, from its content before the first to after the last"""
+        before, after = pending.before, pending.after
+        # attachments can only be removed by an edit, the removed ones get their copies
+        removed = {a.id for a in before.attachments} - {a.id for a in after.attachments}
+        if before.content == after.content and not removed:
+            # edited back to where it started
             return
-
-        await set_contextual_locales_from_guild(self.bot, before.guild)
+        strings = await self._strings(before.guild)
+        archived = self._archived_files(before.guild, before.id, removed) if removed else {}
+        diff = None
+        if before.content and after.content:
+            runs = word_diff(before.content, after.content)
+            diff = render_diff(runs, 2000) if runs is not None else None
         embed = discord.Embed(
-            title=_("Message edited"),
-            description=before.content or chat.inline(_("No text")),
+            title=strings.message_edited,
+            description=diff or before.content or strings.no_text,
             timestamp=before.created_at,
             color=discord.Colour.teal(),
         )
-        embed.add_field(name=_("Now"), value=_("[View message]({})").format(after.jump_url))
+        if diff is None and after.content != before.content:
+            embed.add_field(
+                name=strings.edited_to,
+                value=chat.escape(after.content[:1000], formatting=True) or strings.no_text,
+                inline=False,
+            )
+        if pending.edits > 1:
+            embed.add_field(name=strings.edits, value=str(pending.edits))
+        embed.add_field(name=strings.now, value=strings.view_message.format(after.jump_url))
         if before.attachments:
             embed.add_field(
-                name=_("Attachments"),
+                name=strings.attachments,
                 value="\n".join(
-                    _("[{0.filename}]({0.url}) ([Cached]({0.proxy_url}))").format(a)
+                    strings.archived.format(strings.attachment.format(a))
+                    if a.id in archived
+                    else strings.attachment.format(a)
                     for a in before.attachments
                 ),
             )
         embed.set_author(name=before.author, icon_url=before.author.avatar_url)
-        embed.set_footer(text=_("ID: {} • Sent at").format(before.id))
-
-        try:
-            await logchannel.send(embed=embed)
-        except discord.Forbidden:
-            pass
+        embed.set_footer(text=strings.footer.format(before.id))
+
+        self._enqueue_with_files(
+            pending.logchannel,
+            embed,
+            archived,
+            Priority.LOW,
+            f"edit:{before.id}:{after.edited_at and after.edited_at.timestamp()}",
+        )
 
     """
     This is our listener for members joining
     """
     @commands.Cog.listener("on_member_join")
+    @timed("metrics", "listener_seconds", listener="message_user_join")
     async def message_user_join(self, message: discord.Message):
         # If there is no message then return
         if not message.guild:
             log.debug("user_join: not message.guild return")
             return
 
-        #  if the bot is disabled in the message server then return
-        if await self.bot.cog_disabled_in_guild(self, message.guild):
-            log.debug("user_join: cog disabled in guild return")
-            return
-
         # try to get the logging channel for the messages server
-        logchannel = message.guild.get_channel(
-            await self.config.guild(message.guild).join_channel()
-        )
+        settings = self.settings.get(message.guild.id)
+        logchannel = message.guild.get_channel(settings.join_channel)
 
-        # if the logging channel isn't set then return
-        if not logchannel:
-            log.debug("user_join: No logchannel return")
+        # if logging is off, the channel is missing or the cog is disabled then return
+        if not await self.filters.check("join", message.guild.id, settings, logchannel, message):
+            log.debug("user_join: filtered return")
+            return
+
+        # during a raid members are collected into periodic summaries instead
+        if self.bursts.hit(
+                message,
+                "join",
+                threshold=settings.burst_threshold,
+                window=settings.burst_window,
+                interval=settings.burst_interval,
+        ):
+            log.debug("user_join: burst summary return")
             return
 
-        # translate the message to be logged based on server locale
-        await set_contextual_locales_from_guild(self.bot, message.guild)
+        # strings of the message to be logged in the server locale
+        strings = await self._strings(message.guild)
 
         # start building the log message
         embed = discord.Embed(
-            title=_("User Joined"),
-            description=chat.inline(_("User has joined the server")),
+            title=strings.user_joined,
+            description=strings.joined_description,
             timestamp=datetime.now(timezone.utc),
             colour=discord.Colour.green(),
         )
@@ -592,45 +1731,51 @@ class UserActivityLog(commands.Cog):
         # get message author from incoming message
         embed.set_author(name=message.name, icon_url=message.avatar_url)
 
-        # try to send the message
-        try:
-            await logchannel.send(embed=embed)
-        # if we don't have permission then ignore it
-        except discord.Forbidden:
-            pass
+        # queue the message, it is sent together with other logs for the channel
+        self.dispatcher.enqueue(
+            logchannel,
+            embed,
+            event_id=f"join:{message.guild.id}:{message.id}:{message.joined_at}",
+        )
 
     """
     This is our listener for members leaving.
     """
-    @commands.Cog.listener("on_member_leave")
+    @commands.Cog.listener("on_member_remove")
+    @timed("metrics", "listener_seconds", listener="message_user_leave")
     async def message_user_leave(self, message: discord.Message):
         # If there is no message then return
         if not message.guild:
             log.debug("user_leave: not message.guild return")
             return
 
-        #  if the bot is disabled in the message server then return
-        if await self.bot.cog_disabled_in_guild(self, message.guild):
-            log.debug("user_leave: cog disabled in guild return")
-            return
-
         # try to get the logging channel for the messages server
-        logchannel = message.guild.get_channel(
-            await self.config.guild(message.guild).leave_channel()
-        )
+        settings = self.settings.get(message.guild.id)
+        logchannel = message.guild.get_channel(settings.leave_channel)
 
-        # if the logging channel isn't set then return
-        if not logchannel:
-            log.debug("user_leave: No logchannel return")
+        # if logging is off, the channel is missing or the cog is disabled then return
+        if not await self.filters.check("leave", message.guild.id, settings, logchannel, message):
+            log.debug("user_leave: filtered return")
+            return
+
+        # during a raid members are collected into periodic summaries instead
+        if self.bursts.hit(
+                message,
+                "leave",
+                threshold=settings.burst_threshold,
+                window=settings.burst_window,
+                interval=settings.burst_interval,
+        ):
+            log.debug("user_leave: burst summary return")
             return
 
-        # translate the message to be logged based on server locale
-        await set_contextual_locales_from_guild(self.bot, message.guild)
+        # strings of the message to be logged in the server locale
+        strings = await self._strings(message.guild)
 
         # start building the log message
         embed = discord.Embed(
-            title=_("User Left"),
-            description=chat.inline(_("User has left the server")),
+            title=strings.user_left,
+            description=strings.left_description,
             timestamp=datetime.now(timezone.utc),
             colour=discord.Colour.red(),
         )
@@ -638,65 +1783,65 @@ class UserActivityLog(commands.Cog):
         # get message author from incoming message
         embed.set_author(name=message.name, icon_url=message.avatar_url)
 
-        # try to send the message
-        try:
-            await logchannel.send(embed=embed)
-        # if we don't have permission then ignore it
-        except discord.Forbidden:
-            pass
+        # queue the message, it is sent together with other logs for the channel
+        self.dispatcher.enqueue(
+            logchannel,
+            embed,
+            event_id=f"leave:{message.guild.id}:{message.id}:{message.joined_at}",
+        )
 
     """
-    This is our listener for members boosting.
+    This is our handler for members boosting, routed from on_member_update
     """
-    @commands.Cog.listener("on_member_update")
-    async def message_user_boost(self, before: discord.Member, after: discord.Member):
-        # If there is no message then return
-        if not before.guild or not after.guild:
-            log.debug("user_boost: not member.guild return")
-            return
-
-        #  if the bot is disabled in the message server then return
-        if await self.bot.cog_disabled_in_guild(self, before.guild):
-            log.debug("user_boost: cog disabled in guild return")
+    def _logs_boosts(self, guild: discord.Guild) -> bool:
+        return self.filters.accepts("boost", guild.id, self.settings.get(guild.id))
+
+    @timed("metrics", "listener_seconds", listener="message_user_boost")
+    async def message_user_boost(self, update: MemberUpdate):
+        # the router only passes on updates with role or boost changes
+        boosts = update.of_kind(*BOOST_KINDS)
+        if not boosts:
+            log.debug("user_boost: boost unchanged return")
             return
+        after = update.after
 
         # try to get the logging channel for the messages server
-        logchannel = before.guild.get_channel(
-            await self.config.guild(before.guild).boost_channel()
-        )
+        settings = self.settings.get(after.guild.id)
+        logchannel = after.guild.get_channel(settings.boost_channel)
 
-        # if the logging channel isn't set then return
-        if not logchannel:
-            log.debug("user_boost: No logchannel return")
+        # if logging is off or the channel is missing then return
+        if not await self.filters.check("boost", after.guild.id, settings, logchannel, after):
+            log.debug("user_boost: filtered return")
             return
 
-        # translate the message to be logged based on server locale
-        await set_contextual_locales_from_guild(self.bot, before.guild)
-
-        # check the users before and after roles are different
-        if before.roles == after.roles:
-            log.debug("user_boost: roles are equal return")
-            return
+        # strings of the message to be logged in the server locale
+        strings = await self._strings(after.guild)
 
-        # check if the supporter role is in before.roles
-        if 'Supporter' in before.roles:
-            log.debug("user_boost: User already boosting return")
-            return
-
-        # start building the log message
-        embed = discord.Embed(
-            title=_("User Boosted"),
-            description=chat.inline(_("User has boosted the server")),
-            timestamp=datetime.now(timezone.utc),
-            colour=discord.Colour.purple(),
-        )
+        # start building the log message, renewed boosts are not reported by diff_member
+        if boosts[0].kind is MemberEventKind.BOOST_STARTED:
+            embed = discord.Embed(
+                title=strings.user_boosted,
+                description=strings.boosted_description,
+                timestamp=after.premium_since,
+                colour=discord.Colour.purple(),
+            )
+        else:
+            embed = discord.Embed(
+                title=strings.user_unboosted,
+                description=strings.unboosted_description,
+                timestamp=datetime.now(timezone.utc),
+                colour=discord.Colour.dark_purple(),
+            )
 
         # get message author from incoming message
-        embed.set_author(name=before.name, icon_url=before.avatar_url)
-
-        # try to send the message
-        try:
-            await logchannel.send(embed=embed)
-        # if we don't have permission then ignore it
-        except discord.Forbidden:
-            pass
+        embed.set_author(name=after.name, icon_url=after.avatar_url)
+
+        # queue the message, it is sent together with other logs for the channel
+        self.dispatcher.enqueue(
+            logchannel,
+            embed,
+            event_id=(
+                f"{boosts[0].kind.value}:{after.guild.id}:{after.id}:"
+                f"{after.premium_since or update.before.premium_since}"
+            ),
+        )
@@ -1,15 +1,27 @@
+import asyncio
 import logging
-from datetime import datetime, timezone
+from pathlib import Path
 from pprint import pformat
-from typing import Union
+from typing import Dict, FrozenSet, Tuple, Union
 
 import discord
 from redbot.core import commands
 from redbot.core.config import Config
-from redbot.core.i18n import Translator, cog_i18n, set_contextual_locales_from_guild
+from redbot.core.i18n import Translator, cog_i18n
 from redbot.core.utils import AsyncIter
 from redbot.core.utils import chat_formatting as chat
 from redbot.core.utils.menus import DEFAULT_CONTROLS, menu
+from ukfurcore import (
+    LogDispatcher,
+    MemberEventKind,
+    MemberUpdate,
+    StringTable,
+    breaker_status,
+    shared_locales,
+    shared_router,
+    shared_scheduler,
+    shared_webhooks,
+)
 
 
 def is_channel_set(channel_type: str):
@@ -36,6 +48,14 @@ log = logging.getLogger("red.ukfur-cogs.userroleannouncer")
 _ = Translator("MessagesLog", __file__)
 
 
+def announcement_strings() -> dict:
+    """Strings used in announcement embeds, translated once per locale"""
+    return {
+        "user_boosted": _("User Boosted"),
+        "boosted_description": chat.inline(_("User has boosted the server")),
+    }
+
+
 @cog_i18n(_)
 class UserRoleAnnouncer(commands.Cog):
     """Joins and boosts announced to specific channel"""
@@ -54,7 +74,19 @@ class UserRoleAnnouncer(commands.Cog):
             "boosting": True,
             "ignored_users": [],
         }
+        self.config.register_global(webhooks=False)
         self.config.register_guild(**default_guild)
+        # announcements are not batched, only rate limited
+        self.dispatcher = LogDispatcher(window=0, scheduler=shared_scheduler(bot))
+        self.webhooks = shared_webhooks(bot)
+        self.locales = shared_locales(bot)
+        self.strings = StringTable(Path(__file__).parent / "locales", announcement_strings)
+        # guild id -> boost channel id and ignored members, for guilds announcing boosts
+        self.boost_settings: Dict[int, Tuple[int, FrozenSet[int]]] = {}
+        self.router = shared_router(bot)
+        self.router.subscribe(
+            self, "member_update", self.message_user_boost, accepts=self._announces_boosts
+        )
 
     async def initialize(self):
         """
@@ -62,7 +94,33 @@ class UserRoleAnnouncer(commands.Cog):
 
         Versions:
         """
-        pass
+        self.strings.load()
+        for guild_id, settings in (await self.config.all_guilds()).items():
+            self._cache_boost_settings(guild_id, settings)
+        if await self.config.webhooks():
+            self.webhooks.open(self.qualified_name)
+            self.dispatcher.webhooks = self.webhooks
+
+    def cog_unload(self):
+        self.router.unsubscribe(self)
+        asyncio.create_task(self._shutdown())
+
+    async def _shutdown(self):
+        await self.dispatcher.close()
+        await self.webhooks.close(self.qualified_name)
+
+    def _cache_boost_settings(self, guild_id: int, settings: dict):
+        if settings["boosting"] and settings["boost_channel"]:
+            self.boost_settings[guild_id] = (
+                settings["boost_channel"],
+                frozenset(settings["ignored_users"]),
+            )
+        else:
+            self.boost_settings.pop(guild_id, None)
+
+    async def _refresh_boost_settings(self, guild: discord.Guild):
+        """Re-read the settings boost announcements use after a command changed them"""
+        self._cache_boost_settings(guild.id, await self.config.guild(guild).all())
 
     def format_help_for_context(self, ctx: commands.Context) -> str:
         pre_processed = super().format_help_for_context(ctx)
@@ -96,6 +154,7 @@ class UserRoleAnnouncer(commands.Cog):
 
         If channel is not specified, then announcements will be disabled"""
         await self.config.guild(ctx.guild).boost_channel.set(channel.id if channel else None)
+        await self._refresh_boost_settings(ctx.guild)
         await ctx.tick()
 
     @set_channel.command(name="all")
@@ -105,6 +164,7 @@ class UserRoleAnnouncer(commands.Cog):
         If channel is not specified, then announcements will be disabled"""
         await self.config.guild(ctx.guild).join_channel.set(channel.id if channel else None)
         await self.config.guild(ctx.guild).boost_channel.set(channel.id if channel else None)
+        await self._refresh_boost_settings(ctx.guild)
         await ctx.tick()
 
     @set_channel.command(name="settings")
@@ -112,9 +172,15 @@ class UserRoleAnnouncer(commands.Cog):
         """View current channels settings"""
         settings = []
         if join := await self.config.guild(ctx.guild).join_channel():
-            settings.append(_("Join: {}").format(ctx.guild.get_channel(join)))
+            settings.append(
+                _("Join: {}").format(ctx.guild.get_channel(join))
+                + breaker_status(self.dispatcher.breaker(join))
+            )
         if boost := await self.config.guild(ctx.guild).boost_channel():
-            settings.append(_("Boost: {}").format(ctx.guild.get_channel(boost)))
+            settings.append(
+                _("Boost: {}").format(ctx.guild.get_channel(boost))
+                + breaker_status(self.dispatcher.breaker(boost))
+            )
         await ctx.send("\n".join(settings) or chat.info(_("No channels set")))
 
     @userroleannouncer.group()
@@ -137,9 +203,28 @@ class UserRoleAnnouncer(commands.Cog):
         """Toggle logging of boost message"""
         boosting = self.config.guild(ctx.guild).boosting
         await boosting.set(not await boosting())
+        await self._refresh_boost_settings(ctx.guild)
         state = _("enabled") if await self.config.guild(ctx.guild).boosting() else _("disabled")
         await ctx.send(chat.info(_("Boost announcement {}").format(state)))
 
+    @userroleannouncer.command(name="webhooks")
+    @commands.is_owner()
+    async def webhooks_toggle(self, ctx):
+        """Toggle posting announcements through a webhook in each channel
+
+        Channels where the bot cannot manage webhooks are posted to as before
+        """
+        enabled = self.dispatcher.webhooks is None
+        await self.config.webhooks.set(enabled)
+        if enabled:
+            self.webhooks.open(self.qualified_name)
+            self.dispatcher.webhooks = self.webhooks
+        else:
+            self.dispatcher.webhooks = None
+            await self.webhooks.close(self.qualified_name)
+        state = _("enabled") if enabled else _("disabled")
+        await ctx.send(chat.info(_("Webhook delivery {}").format(state)))
+
     @userroleannouncer.command()
     async def ignore(
             self,
@@ -171,82 +256,57 @@ class UserRoleAnnouncer(commands.Cog):
                 if isinstance(item, discord.Member):
                     async with guild.ignored_users() as ignored_users:
                         await ignore_config_add(ignored_users, item)
+            await self._refresh_boost_settings(ctx.guild)
             await ctx.tick()
 
     """
-    This is our listener for members boosting.
+    This is our listener for locale changes, so announcements follow them
     """
-    @commands.Cog.listener("on_member_update")
-    async def message_user_boost(self, before: discord.Member, after: discord.Member):
-        # If there is no message then return
-        if not before.guild or not after.guild:
-            log.debug("user_update: not member.guild return")
-            return
+    @commands.Cog.listener("on_command_completion")
+    async def locale_changed(self, ctx: commands.Context):
+        self.locales.on_command_completion(ctx)
 
-        #  if the bot is disabled in the message server then return
-        if await self.bot.cog_disabled_in_guild(self, before.guild):
-            log.debug("user_update: cog disabled in guild return")
+    """
+    This is our handler for members boosting, routed from on_member_update
+    """
+    def _announces_boosts(self, guild: discord.Guild) -> bool:
+        return guild.id in self.boost_settings
+
+    async def message_user_boost(self, update: MemberUpdate):
+        # the router already dropped updates without role or boost changes, guilds
+        # not announcing boosts, and checked the cog is enabled in the guild
+        if not update.of_kind(MemberEventKind.BOOST_STARTED):
+            log.debug("user_update: no new boost return")
             return
+        after = update.after
+        settings = self.boost_settings.get(after.guild.id)
 
-        # check the users before and after roles are different
-        # this event handler can fire for a number of reasons not just role update
-        if before.roles == after.roles:
-            log.debug("user_update: roles are equal return")
+        # if boost announcements were turned off since or the member is ignored then return
+        if settings is None or after.id in settings[1]:
+            log.debug("user_update: boost announcement disabled return")
             return
 
-        # This handler is not complete
-        log.debug("user_update: incomplete handler return")
-        return
-
-
-        # decide if we're boosting or joining
-        # if member in before and after we could be boosting
-            # if boost in before and after then we've run out of things to check
-            # else if boost not in before and is in after then we got a boost
-            # else boost not in either or another role changed
-        # else
-
-
-
         # try to get the announcement channel for boost messages
-        announcechannel = before.guild.get_channel(
-            await self.config.guild(before.guild).boost_channel()
-        )
+        announcechannel = after.guild.get_channel(settings[0])
 
         # if the announcement channel isn't set then return
         if not announcechannel:
             log.debug("user_update: No boost logchannel return")
             return
 
-
-        # try to get the announcement channel for join messages
-        announcechannel = before.guild.get_channel(
-            await self.config.guild(before.guild).join_channel()
-        )
-
-        # if the announcement channel isn't set then return
-        if not announcechannel:
-            log.debug("user_update: No join logchannel return")
-            return
-
-
-        # translate the message to be logged based on server locale
-        await set_contextual_locales_from_guild(self.bot, before.guild)
-
+        # strings of the message to be logged in the server locale
+        strings = self.strings.get(await self.locales.get(after.guild))
 
         # build the message to send to a channel
         embed = discord.Embed(
-            title=_("User Boosted"),
-            description=chat.inline(_("User has boosted the server")),
-            timestamp=datetime.now(timezone.utc),
+            title=strings.user_boosted,
+            description=strings.boosted_description,
+            timestamp=after.premium_since,
             colour=discord.Colour.purple(),
         )
 
         # Set message author from incoming member
-        embed.set_author(name=before.name, icon_url=before.avatar_url)
+        embed.set_author(name=after.name, icon_url=after.avatar_url)
 
-        # try to send the message
-        try:
-            await announcechannel.send(embed=embed)
-        except discord.Forbidden:
-            pass
+        # queue the message, it is sent without blocking this listener
+        self.dispatcher.enqueue(announcechannel, embed)